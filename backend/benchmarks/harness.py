@@ -0,0 +1,43 @@
+# benchmarks/harness.py
+"""Shared setup for the benchmark scripts in this directory.
+
+Run them from backend/, e.g. ``python benchmarks/menu_cache.py``. Every
+script works on a throwaway test database created and destroyed around
+it the way the test runner does, never on db.sqlite3, and drives the
+views in process through Django's test client, so the numbers leave the
+HTTP server out.
+"""
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup():
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'canteen_cms.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
@@ -0,0 +1,77 @@
+# benchmarks/menu_cache.py
+"""Requests per second of the public menu endpoints with and without the
+menu response cache (menu.cache), on a menu of ``--items`` items.
+
+"uncached" serves every request through the view and serializer as before
+the cache existed, "cached" is a warm cache hit and "304" a revalidation
+with a matching ``If-None-Match``.
+
+    python benchmarks/menu_cache.py [--items 500] [--seconds 3]
+"""
+import argparse
+import time
+from unittest import mock
+
+from harness import setup, test_database
+
+URLS = ('/api/menu/customer/', '/api/menu/customer/categories/', '/api/menu/customer/bootstrap/')
+
+
+def uncached_response(request, view, prefix=None):
+    return view()
+
+
+def uncached_bytes(request, name, build):
+    from django.http import JsonResponse
+    return JsonResponse(build(0))
+
+
+def requests_per_second(client, url, seconds, **headers):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        response = client.get(url, headers=headers)
+        assert response.status_code in (200, 304), response.status_code
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=3)
+    options = parser.parse_args()
+
+    setup()
+    from django.core.cache import cache
+    from django.test import Client
+    from menu.models import MenuItem
+
+    with test_database():
+        categories = [choice for choice, _ in MenuItem.CATEGORY_CHOICES]
+        MenuItem.objects.bulk_create([
+            MenuItem(
+                name=f'Item {number}', description=f'Menu item number {number}',
+                price=f'{1 + number % 40}.50', category=categories[number % len(categories)],
+            )
+            for number in range(options.items)
+        ])
+        cache.clear()
+        client = Client()
+
+        print(f'{options.items} menu items, {options.seconds:g}s per run')
+        print(f"{'endpoint':34} {'uncached':>10} {'cached':>10} {'304':>10}")
+        for url in URLS:
+            # Bypass the cache the way the views ran before it existed
+            with mock.patch('menu.cache.cached_menu_response', uncached_response), \
+                    mock.patch('menu.views.cached_menu_bytes', uncached_bytes):
+                uncached = requests_per_second(client, url, options.seconds)
+            etag = client.get(url)['ETag']
+            cached = requests_per_second(client, url, options.seconds)
+            revalidated = requests_per_second(client, url, options.seconds, **{'If-None-Match': etag})
+            print(f'{url:34} {uncached:>10.0f} {cached:>10.0f} {revalidated:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
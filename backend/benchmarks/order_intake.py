@@ -0,0 +1,107 @@
+# benchmarks/order_intake.py
+"""Orders per second and placement latency with ``--clients`` customers
+checking out at once, each placing ``--orders`` orders of two lines.
+
+"direct" writes each order in its request's own transaction, "queued"
+hands the writes to the intake writer thread (``ORDER_INTAKE_QUEUE``,
+orders.intake). The latencies are of the place order request alone;
+orders/s is the placed orders over the whole burst, filling the carts
+included. ``--slots`` turns pickup slot reservations on.
+
+    python benchmarks/order_intake.py [--clients 50] [--orders 8] [--slots]
+"""
+import argparse
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import time as clock
+
+from harness import percentile, setup, test_database
+
+MODES = (('direct', False), ('queued', True))
+
+
+def checkout_burst(users, menu_items, orders_per_client):
+    """Every user fills their cart and places orders at once, returns
+    ``(seconds, latencies of placed orders, Counter of failed requests)``"""
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    start = threading.Barrier(len(users))
+    latencies = []
+    failures = Counter()
+    lock = threading.Lock()
+
+    def client_loop(user):
+        # Errors are counted rather than raised into the thread
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user)
+        try:
+            start.wait()
+            for _ in range(orders_per_client):
+                for menu_item, quantity in zip(menu_items, (2, 1)):
+                    response = client.post(
+                        '/api/cart/add/', {'menu_item_id': menu_item.pk, 'quantity': quantity}, format='json'
+                    )
+                    if response.status_code != 201:
+                        with lock:
+                            failures[f'cart {response.status_code}'] += 1
+                started = time.perf_counter()
+                response = client.post('/api/orders/place/', {}, format='json')
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if response.status_code == 201:
+                        latencies.append(elapsed)
+                    else:
+                        failures[f'place {response.status_code}'] += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client_loop, args=(user,)) for user in users]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sorted(latencies), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--orders', type=int, default=8, help="Orders placed by each client")
+    parser.add_argument('--slots', action='store_true', help="Reserve a pickup slot with every order")
+    options = parser.parse_args()
+
+    setup()
+    # Failed requests are counted in the table, not logged one by one
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    from django.contrib.auth.models import User
+    from django.test.utils import override_settings
+    from core.models import CanteenTiming
+    from menu.models import MenuItem
+
+    with test_database():
+        users = [User.objects.create_user(f'customer{number}', password='pw') for number in range(options.clients)]
+        menu_items = [MenuItem.objects.create(name='Tea', price='1.50'), MenuItem.objects.create(name='Cake', price='3.00')]
+        if options.slots:
+            # Open all day with room for everything, so no order is refused
+            CanteenTiming.objects.create(
+                opening_time=clock(0), closing_time=clock(23, 59), slot_minutes=15, slot_capacity=10 ** 6
+            )
+
+        print(f'{options.clients} clients x {options.orders} orders, pickup slots {"on" if options.slots else "off"}')
+        print(f"{'mode':8} {'placed':>7} {'orders/s':>9} {'p50 ms':>7} {'p99 ms':>7}  failed requests")
+        for name, queued in MODES:
+            with override_settings(ORDER_INTAKE_QUEUE=queued):
+                seconds, latencies, failures = checkout_burst(users, menu_items, options.orders)
+            failed = ', '.join(f'{count} {request}' for request, count in sorted(failures.items())) or 'none'
+            print(
+                f'{name:8} {len(latencies):>7} {len(latencies) / seconds:>9.1f}'
+                f' {percentile(latencies, 0.5) * 1000:>7.0f} {percentile(latencies, 0.99) * 1000:>7.0f}  {failed}'
+            )
+
+
+if __name__ == '__main__':
+    main()
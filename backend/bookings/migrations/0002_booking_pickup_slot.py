@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+        ('core', '0004_pickup_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='pickup_slot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='core.pickupslot'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='slot_load',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from core.models import PickupSlot
 from menu.models import MenuItem
 
 class Booking(models.Model):
@@ -8,6 +9,11 @@ class Booking(models.Model):
     date = models.DateField()
     quantity = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Capacity taken in the pickup slot (core.slots), given back on cancel
+    pickup_slot = models.ForeignKey(
+        PickupSlot, on_delete=models.SET_NULL, null=True, blank=True, related_name='bookings'
+    )
+    slot_load = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.menu_item.name} - {self.user.username} - {self.date}"
\ No newline at end of file
@@ -1,10 +1,16 @@
 from rest_framework import serializers
+from core.serializers import PickupSlotSerializer
 from .models import Booking
 
 class BookingSerializer(serializers.ModelSerializer):
     menu_item_name = serializers.ReadOnlyField(source='menu_item.name')
+    pickup_slot = PickupSlotSerializer(read_only=True)
+    # Start of the pickup slot on the booking date; the earliest one with
+    # room when omitted
+    pickup_time = serializers.TimeField(write_only=True, required=False)
 
     class Meta:
         model = Booking
-        fields = ['id', 'user', 'menu_item', 'menu_item_name', 'date', 'quantity', 'created_at']
+        fields = ['id', 'user', 'menu_item', 'menu_item_name', 'date', 'quantity',
+                  'pickup_slot', 'pickup_time', 'created_at']
         read_only_fields = ['user', 'created_at']
\ No newline at end of file
@@ -1,3 +1,111 @@
-from django.test import TestCase
+import threading
+from datetime import time, timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import CanteenTiming, PickupSlot
+from menu.models import MenuItem
+
+from .models import Booking
+
+
+def slot_timing(capacity):
+    # Open all day so bookings are accepted whenever the tests run
+    return CanteenTiming.objects.create(
+        opening_time=time(0), closing_time=time(23, 59, 59), slot_minutes=60, slot_capacity=capacity
+    )
+
+
+class BookingSlotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.other = User.objects.create_user('sam', 'sam@example.com', 'pw')
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.00')
+        cls.timing = slot_timing(5)
+        cls.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def book(self, quantity, pickup_time=None):
+        data = {'menu_item': self.tea.pk, 'date': self.tomorrow.isoformat(), 'quantity': quantity}
+        if pickup_time:
+            data['pickup_time'] = pickup_time
+        return self.client.post('/api/bookings/', data, format='json')
+
+    def reserved(self):
+        return dict(PickupSlot.objects.filter(date=self.tomorrow).values_list('start', 'reserved'))
+
+    def test_booking_reserves_its_slot_and_is_refused_at_capacity(self):
+        response = self.book(3, '10:00')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['pickup_slot'], {'date': self.tomorrow.isoformat(), 'start': '10:00'})
+        self.assertEqual(Booking.objects.get().slot_load, 3)
+
+        response = self.book(3, '10:00')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('The 10:00 pickup slot is full', str(response.data))
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(self.reserved(), {time(10): 3})
+
+    def test_booking_without_a_time_takes_the_earliest_slot_with_room(self):
+        self.assertEqual(self.book(4, '00:00').status_code, 201)
+        response = self.book(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['pickup_slot']['start'], '01:00')
+        self.assertEqual(self.book(1).data['pickup_slot']['start'], '00:00')
+
+    def test_deleting_a_booking_releases_its_slot(self):
+        booking_id = self.book(5, '10:00').data['id']
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(other.delete(f'/api/bookings/{booking_id}/cancel/').status_code, 404)
+        self.assertEqual(self.reserved(), {time(10): 5})
+
+        self.assertEqual(self.client.delete(f'/api/bookings/{booking_id}/cancel/').status_code, 204)
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.reserved(), {time(10): 0})
+        self.assertEqual(self.book(5, '10:00').status_code, 201)
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    threads = 8
+    capacity = 5
+
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user{number}', password='pw') for number in range(self.threads)]
+        self.tea = MenuItem.objects.create(name='Tea', price='1.00')
+        slot_timing(self.capacity)
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def test_a_slot_is_never_oversold(self):
+        start = threading.Barrier(self.threads)
+        statuses = []
+
+        def worker(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                start.wait()
+                response = client.post('/api/bookings/', {
+                    'menu_item': self.tea.pk, 'date': self.tomorrow.isoformat(), 'quantity': 1, 'pickup_time': '12:00',
+                }, format='json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(user,)) for user in self.users]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] * self.capacity + [400] * (self.threads - self.capacity))
+        self.assertEqual(PickupSlot.objects.get(date=self.tomorrow, start=time(12)).reserved, self.capacity)
+        self.assertEqual(Booking.objects.count(), self.capacity)
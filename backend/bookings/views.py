@@ -1,16 +1,18 @@
 from rest_framework import generics, permissions
 from rest_framework.exceptions import ValidationError
 from datetime import datetime
+from django.db import transaction
 from .models import Booking
 from .serializers import BookingSerializer
 from core.models import CanteenTiming  # Make sure core app has this model
+from core.slots import SlotUnavailable, load_of, release, reserve, slot_timing
 
 class BookingListCreateView(generics.ListCreateAPIView):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user)
+        return Booking.objects.filter(user=self.request.user).select_related('menu_item', 'pickup_slot')
 
     def perform_create(self, serializer):
         now = datetime.now().time()
@@ -20,11 +22,27 @@ class BookingListCreateView(generics.ListCreateAPIView):
         if timing and (now < timing.opening_time or now > timing.closing_time):
             raise ValidationError("Canteen is closed. Booking allowed only during working hours.")
 
-        serializer.save(user=self.request.user)
+        pickup_time = serializer.validated_data.pop('pickup_time', None)
+        timing = slot_timing(timing)
+        with transaction.atomic():
+            slot, load = None, 0
+            if timing is not None:
+                data = serializer.validated_data
+                load = load_of(timing, [(data['menu_item'], data['quantity'])])
+                try:
+                    slot = reserve(timing, data['date'], load, pickup_time)
+                except SlotUnavailable as e:
+                    raise ValidationError(str(e))
+            serializer.save(user=self.request.user, pickup_slot=slot, slot_load=load if slot else 0)
 
 class CancelBookingView(generics.DestroyAPIView):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user)
\ No newline at end of file
+        return Booking.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            release({instance.pickup_slot_id: instance.slot_load})
+            instance.delete()
\ No newline at end of file
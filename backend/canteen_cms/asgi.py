@@ -3,6 +3,12 @@ ASGI config for canteen_cms project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run under an ASGI server (e.g. ``uvicorn canteen_cms.asgi:application``) to
+serve the Server-Sent Events streams such as ``/api/menu/customer/events/``
+and the kitchen feed ``/api/orders/admin/events/``; WSGI cannot hold those
+connections open. With more than one worker set ``EVENTS_BROKER`` so events
+reach clients on every worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
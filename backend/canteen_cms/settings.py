@@ -51,6 +51,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Views declare how many SQL queries a request may run (core.query_budget)
+# and the tests enforce it. In development the middleware also logs
+# requests that go over; it counts every query, so it stays out of
+# production
+QUERY_BUDGET_WARNINGS = DEBUG
+if QUERY_BUDGET_WARNINGS:
+    MIDDLEWARE.append('core.query_budget.QueryBudgetMiddleware')
+
 # ===================== CORS SETTINGS =====================
 # Allow requests from your React development server
 CORS_ALLOWED_ORIGINS = [
@@ -78,6 +86,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 # ===================== URLS =====================
@@ -107,6 +116,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the in-memory default, so threaded tests see
+        # SQLite's real locking instead of shared-cache table locks
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -152,4 +164,88 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
-}
\ No newline at end of file
+}
+
+# ===================== CACHE =====================
+# Local memory is per process; point this at a shared backend (Redis,
+# Memcached, file based) when running several workers so menu version
+# bumps are seen by all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds a cached menu response is kept for a given menu version
+MENU_CACHE_TIMEOUT = 60 * 60
+
+# Build menu image thumbnails/WebP variants in a background thread after
+# upload; set to False to build them inline once the save commits
+MENU_IMAGE_VARIANTS_ASYNC = True
+
+# Half-life in days of the time-decayed popularity score for featured items
+POPULARITY_HALF_LIFE_DAYS = 7
+# Run `manage.py roll_popularity` daily, just after midnight, so old sales
+# drop out of the 1/7/30 day counts. New sales show up in the cached
+# featured/bootstrap responses within POPULARITY_REFRESH_SECONDS
+POPULARITY_REFRESH_SECONDS = 60
+
+# Seconds admin sales analytics results are cached per range/granularity
+SALES_ANALYTICS_CACHE_TIMEOUT = 5 * 60
+
+# Delivered/cancelled orders older than this many days are moved to the
+# archive tables by `manage.py archive_orders` (run it nightly)
+ORDER_ARCHIVE_AFTER_DAYS = 90
+
+# ===================== LIVE EVENTS =====================
+# Pub/sub behind the SSE streams (menu changes, kitchen order feed). The
+# local broker only reaches clients connected to the same process; use
+# 'core.events.RedisBroker' with EVENTS_REDIS_URL when running several
+# ASGI workers.
+EVENTS_BROKER = 'core.events.LocalBroker'
+EVENTS_REDIS_URL = 'redis://localhost:6379/0'
+
+# ===================== IDEMPOTENCY KEYS =====================
+# Responses to POSTs sent with an Idempotency-Key header are stored this
+# long and replayed for retries; a duplicate arriving while the first is
+# still running waits up to IDEMPOTENCY_WAIT_SECONDS for its response; run
+# `manage.py clear_idempotency_keys` periodically to drop expired ones. A
+# key still without a response IDEMPOTENCY_LEASE_SECONDS after its request
+# started is treated as abandoned and the next retry runs the view; keep it
+# above the slowest idempotent request
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_LEASE_SECONDS = 30
+
+# ===================== ORDER INTAKE =====================
+# With ORDER_INTAKE_QUEUE on, order placements in each process are written
+# by one thread (orders.intake), up to ORDER_INTAKE_BATCH_SIZE per
+# transaction, waiting at most ORDER_INTAKE_MAX_WAIT_MS for a batch to
+# fill. Helps SQLite under checkout bursts; requests give up after
+# ORDER_INTAKE_TIMEOUT seconds if their order was not started yet
+ORDER_INTAKE_QUEUE = False
+ORDER_INTAKE_BATCH_SIZE = 20
+ORDER_INTAKE_MAX_WAIT_MS = 2
+ORDER_INTAKE_TIMEOUT = 10
+
+# ===================== CART STORE =====================
+# 'cart.stores.CacheCartStore' keeps carts in the cache above and writes
+# them to the database lazily; run `manage.py flush_carts` periodically to
+# persist carts idle for longer than CART_STORE_IDLE_SECONDS. It needs a
+# cache shared by all processes with an atomic add (Redis, Memcached or
+# the database cache) and refuses to start on local memory or file based
+# caches. Cached carts expire CART_STORE_CACHE_TIMEOUT seconds after their
+# last change; keep it well above the flush_carts interval
+CART_STORE = 'cart.stores.DatabaseCartStore'
+CART_STORE_IDLE_SECONDS = 300
+CART_STORE_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# ===================== EMAIL OUTBOX =====================
+# Emails are queued in core.OutboundEmail and sent by
+# `manage.py send_queued_mail --loop` through EMAIL_BACKEND; failures are
+# retried after EMAIL_OUTBOX_RETRY_SECONDS, doubling each time up to
+# EMAIL_OUTBOX_MAX_RETRY_SECONDS, then marked FAILED
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_SECONDS = 30
+EMAIL_OUTBOX_MAX_RETRY_SECONDS = 60 * 60
@@ -7,6 +7,9 @@ class CartItemInline(admin.TabularInline):
     extra = 0
     readonly_fields = ['total_price', 'added_at']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('menu_item')
+
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['user', 'total_items', 'total_price', 'created_at']
@@ -15,6 +18,9 @@ class CartAdmin(admin.ModelAdmin):
     readonly_fields = ['total_items', 'total_price', 'created_at', 'updated_at']
     inlines = [CartItemInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user').with_totals()
+
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'menu_item', 'quantity', 'total_price', 'added_at']
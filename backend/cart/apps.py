@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
+
+    def ready(self):
+        from .stores import get_cart_store
+
+        # Fail at startup rather than on the first cart request when the
+        # configured store cannot work with the configured cache
+        get_cart_store()
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cart.stores import get_cart_store
+
+
+class Command(BaseCommand):
+    help = "Persist carts held by a write-behind cart store to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Flush every pending cart, not only idle ones")
+
+    def handle(self, *args, **options):
+        idle_seconds = None if options['all'] else getattr(settings, 'CART_STORE_IDLE_SECONDS', 300)
+        count = get_cart_store().flush(idle_seconds=idle_seconds)
+        self.stdout.write(self.style.SUCCESS(f"Flushed {count} carts"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='pending_flush',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
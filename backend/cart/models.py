@@ -1,33 +1,160 @@
 # cart/models.py
-from django.db import models
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, DecimalField, F, Prefetch, Sum
+from django.db.models.functions import Coalesce, Least
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from menu.models import MenuItem
 
+MAX_LINE_QUANTITY = 50
+PRICE_FIELD = DecimalField(max_digits=10, decimal_places=2)
+
+def line_totals(items):
+    """Aggregate quantity, price and line count of a CartItem queryset"""
+    return items.aggregate(
+        total_items=Coalesce(Sum('quantity'), 0),
+        total_price=Coalesce(
+            Sum(F('quantity') * F('menu_item__price'), output_field=PRICE_FIELD),
+            Decimal('0.00'),
+            output_field=PRICE_FIELD,
+        ),
+        items_count=Count('id'),
+    )
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate item count, quantity and price totals computed in SQL"""
+        return self.annotate(
+            sql_total_items=Coalesce(Sum('items__quantity'), 0),
+            sql_total_price=Coalesce(
+                Sum(F('items__quantity') * F('items__menu_item__price'), output_field=PRICE_FIELD),
+                Decimal('0.00'),
+                output_field=PRICE_FIELD,
+            ),
+            sql_items_count=Count('items'),
+        )
+
+    def for_detail(self):
+        """Totals plus items with their menu rows, two queries in all"""
+        return self.with_totals().prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.select_related('menu_item').order_by('added_at', 'id'))
+        )
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set by cart.stores.CacheCartStore while the cached copy has changes
+    # that flush_carts has not written yet
+    pending_flush = models.BooleanField(default=False, db_index=True)
+
+    objects = CartQuerySet.as_manager()
 
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    def get_totals(self):
+        """(total_items, total_price, items_count), from annotations if loaded"""
+        if hasattr(self, 'sql_total_items'):
+            return self.sql_total_items, self.sql_total_price, self.sql_items_count
+        totals = line_totals(CartItem.objects.filter(cart=self))
+        return totals['total_items'], totals['total_price'], totals['items_count']
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.get_totals()[0]
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.get_totals()[1]
 
     def clear(self):
         self.items.all().delete()
 
+class CartItemQuerySet(models.QuerySet):
+    def add_quantity(self, user, menu_item, quantity, max_quantity=MAX_LINE_QUANTITY):
+        """Atomically add ``quantity`` of ``menu_item`` to ``user``'s cart.
+
+        One ``INSERT ... ON CONFLICT DO UPDATE`` statement increments an
+        existing line (capped at ``max_quantity``) or creates it, so
+        concurrent adds never lose an increment or hit the unique
+        constraint. Only a user's very first add needs extra queries to
+        create the cart. Returns ``(cart_item, created)``.
+        """
+        if not self._can_upsert():
+            return self._add_quantity_fallback(user, menu_item, quantity, max_quantity)
+
+        now = timezone.now()
+        row = self._upsert(user, menu_item, quantity, max_quantity, now)
+        if row is None:
+            Cart.objects.get_or_create(user=user)
+            row = self._upsert(user, menu_item, quantity, max_quantity, now)
+
+        pk, cart_id, new_quantity, added_at = row
+        if isinstance(added_at, str):
+            added_at = parse_datetime(added_at)
+        if settings.USE_TZ and timezone.is_naive(added_at):
+            added_at = timezone.make_aware(added_at, dt_timezone.utc)
+        cart_item = self.model(
+            id=pk, cart_id=cart_id, menu_item=menu_item, quantity=new_quantity, added_at=added_at
+        )
+        return cart_item, added_at == now
+
+    def _can_upsert(self):
+        # RETURNING needs SQLite 3.35+, Django itself only needs 3.31
+        features = connection.features
+        return (
+            connection.vendor in ('sqlite', 'postgresql')
+            and features.can_return_columns_from_insert
+            and features.supports_update_conflicts_with_target
+        )
+
+    def _upsert(self, user, menu_item, quantity, max_quantity, now):
+        table = self.model._meta.db_table
+        least = 'MIN' if connection.vendor == 'sqlite' else 'LEAST'
+        sql = (
+            f'INSERT INTO {table} (cart_id, menu_item_id, quantity, added_at) '
+            f'SELECT id, %s, %s, %s FROM {Cart._meta.db_table} WHERE user_id = %s '
+            f'ON CONFLICT (cart_id, menu_item_id) DO UPDATE '
+            f'SET quantity = {least}({table}.quantity + excluded.quantity, %s) '
+            f'RETURNING id, cart_id, quantity, added_at'
+        )
+        params = [
+            menu_item.pk,
+            min(quantity, max_quantity),
+            connection.ops.adapt_datetimefield_value(now),
+            user.pk,
+            max_quantity,
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+
+    def _add_quantity_fallback(self, user, menu_item, quantity, max_quantity):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        lines = self.filter(cart=cart, menu_item=menu_item)
+        if lines.update(quantity=Least(F('quantity') + quantity, max_quantity)):
+            return lines.select_related('menu_item').get(), False
+        try:
+            with transaction.atomic():
+                return self.create(cart=cart, menu_item=menu_item, quantity=min(quantity, max_quantity)), True
+        except IntegrityError:
+            lines.update(quantity=Least(F('quantity') + quantity, max_quantity))
+            return lines.select_related('menu_item').get(), False
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ('cart', 'menu_item')
 
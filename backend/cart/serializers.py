@@ -1,6 +1,7 @@
 # cart/serializers.py
 from rest_framework import serializers
-from .models import Cart, CartItem
+from .models import MAX_LINE_QUANTITY, Cart, CartItem
+from .stores import get_cart_store
 from menu.models import MenuItem
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -28,7 +29,7 @@ class CartSerializer(serializers.ModelSerializer):
 
 class AddToCartSerializer(serializers.Serializer):
     menu_item_id = serializers.IntegerField()
-    quantity = serializers.IntegerField(min_value=1, max_value=50)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_LINE_QUANTITY)
 
     def validate_menu_item_id(self, value):
         try:
@@ -37,7 +38,56 @@ class AddToCartSerializer(serializers.Serializer):
                 raise serializers.ValidationError("This menu item is not available.")
         except MenuItem.DoesNotExist:
             raise serializers.ValidationError("Menu item does not exist.")
+        # Kept so the view does not have to fetch it again
+        self.menu_item = menu_item
         return value
 
 class UpdateCartItemSerializer(serializers.Serializer):
-    quantity = serializers.IntegerField(min_value=1, max_value=50)
\ No newline at end of file
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_LINE_QUANTITY)
+
+class CartOperationSerializer(serializers.Serializer):
+    OPERATIONS = ['add', 'update', 'remove']
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    menu_item_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_LINE_QUANTITY, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'remove' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': "This field is required."})
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    """Apply many add/update/remove operations to the cart atomically
+
+    Operations are applied in order; ``replace`` empties the cart first so a
+    client can sync its whole cart. Line quantities are capped at
+    MAX_LINE_QUANTITY.
+    """
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=200)
+    replace = serializers.BooleanField(default=False)
+
+    def validate_operations(self, operations):
+        ids = {op['menu_item_id'] for op in operations}
+        menu_items = MenuItem.objects.filter(pk__in=ids).only('id', 'name', 'available', 'price').in_bulk()
+        errors = []
+        for op in operations:
+            menu_item = menu_items.get(op['menu_item_id'])
+            if op['op'] == 'remove':
+                errors.append({})
+            elif menu_item is None:
+                errors.append({'menu_item_id': ["Menu item does not exist."]})
+            elif not menu_item.available:
+                errors.append({'menu_item_id': ["This menu item is not available."]})
+            else:
+                errors.append({})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        self.menu_items = menu_items
+        return operations
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        store = get_cart_store()
+        store.apply(user, validated_data['operations'], validated_data['replace'])
+        return store.get_cart(user)
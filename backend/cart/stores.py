@@ -0,0 +1,481 @@
+# cart/stores.py
+"""Pluggable storage for shopping carts.
+
+Views, serializers and order placement talk to the store returned by
+``get_cart_store()`` (``settings.CART_STORE``) instead of the cart models:
+
+* ``DatabaseCartStore`` keeps carts in the ``cart_cart``/``cart_cartitem``
+  tables, as before.
+* ``CacheCartStore`` keeps carts in the Django cache and only writes them
+  to the tables lazily (``flush_carts`` for carts idle longer than
+  ``CART_STORE_IDLE_SECONDS``), keeping scratch cart traffic off the SQLite
+  writer lock. Checkout reads straight from the cache; the order itself is
+  the durable record, so the stored copy is simply dropped.
+
+Both return cart-shaped objects (``items``, ``total_items``,
+``total_price``...) that ``CartSerializer``/``CartItemSerializer`` render.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from menu.models import MenuItem
+
+from .models import MAX_LINE_QUANTITY, Cart, CartItem, line_totals
+
+
+class CartBusy(APIException):
+    """Another request held the cart for too long"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Your cart is being updated by another request, please try again."
+    default_code = 'cart_busy'
+
+
+def fold_operations(quantities, operations, replace=False):
+    """Apply add/update/remove operations to ``{menu_item_id: quantity}``"""
+    quantities = {} if replace else dict(quantities)
+    for op in operations:
+        menu_item_id = op['menu_item_id']
+        if op['op'] == 'add':
+            quantity = quantities.get(menu_item_id, 0) + op['quantity']
+            quantities[menu_item_id] = min(quantity, MAX_LINE_QUANTITY)
+        elif op['op'] == 'update':
+            quantities[menu_item_id] = op['quantity']
+        else:
+            quantities.pop(menu_item_id, None)
+    return quantities
+
+
+class BaseCartStore:
+    def get_cart(self, user):
+        """Cart with its items for CartSerializer"""
+        raise NotImplementedError
+
+    def get_summary(self, user):
+        """``{'total_items', 'total_price', 'items_count'}``"""
+        raise NotImplementedError
+
+    def get_lines(self, user):
+        """Cart lines with ``menu_item`` loaded, oldest first"""
+        raise NotImplementedError
+
+    def add(self, user, menu_item, quantity):
+        """Add to a line, returns ``(line, created)``"""
+        raise NotImplementedError
+
+    def update(self, user, item_id, quantity):
+        """Set a line's quantity, returns the line or None if not found"""
+        raise NotImplementedError
+
+    def remove(self, user, item_id):
+        """Remove a line, returns the removed line or None if not found"""
+        raise NotImplementedError
+
+    def apply(self, user, operations, replace=False):
+        """Apply batch operations atomically"""
+        raise NotImplementedError
+
+    def clear(self, user):
+        """Empty the cart, returns False if there was no cart"""
+        raise NotImplementedError
+
+    def remove_ordered(self, user, lines):
+        """Take the quantities of ``lines`` (from ``get_lines``) off the cart
+
+        Lines added or topped up since they were read stay in the cart with
+        what was not ordered.
+        """
+        raise NotImplementedError
+
+    def flush(self, idle_seconds=None):
+        """Persist pending carts, returns how many were written"""
+        return 0
+
+
+class DatabaseCartStore(BaseCartStore):
+    """Carts stored directly in the Cart/CartItem tables"""
+
+    def get_cart(self, user):
+        try:
+            return Cart.objects.for_detail().get(user=user)
+        except Cart.DoesNotExist:
+            Cart.objects.get_or_create(user=user)
+            return Cart.objects.for_detail().get(user=user)
+
+    def get_summary(self, user):
+        return line_totals(CartItem.objects.filter(cart__user=user))
+
+    def get_lines(self, user):
+        return list(
+            CartItem.objects.filter(cart__user=user)
+            .select_related('menu_item')
+            .order_by('added_at', 'id')
+        )
+
+    def add(self, user, menu_item, quantity):
+        return CartItem.objects.add_quantity(user, menu_item, quantity)
+
+    def update(self, user, item_id, quantity):
+        try:
+            cart_item = CartItem.objects.select_related('menu_item').get(id=item_id, cart__user=user)
+        except CartItem.DoesNotExist:
+            return None
+        cart_item.quantity = quantity
+        cart_item.save(update_fields=['quantity'])
+        return cart_item
+
+    def remove(self, user, item_id):
+        try:
+            cart_item = CartItem.objects.select_related('menu_item').get(id=item_id, cart__user=user)
+        except CartItem.DoesNotExist:
+            return None
+        cart_item.delete()
+        return cart_item
+
+    def apply(self, user, operations, replace=False):
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(user=user)
+            lines = {} if created else {
+                line.menu_item_id: line for line in CartItem.objects.filter(cart=cart)
+            }
+            quantities = fold_operations(
+                {menu_item_id: line.quantity for menu_item_id, line in lines.items()},
+                operations,
+                replace,
+            )
+
+            to_create = []
+            to_update = []
+            for menu_item_id, quantity in quantities.items():
+                line = lines.get(menu_item_id)
+                if line is None:
+                    to_create.append(CartItem(cart=cart, menu_item_id=menu_item_id, quantity=quantity))
+                elif line.quantity != quantity:
+                    line.quantity = quantity
+                    to_update.append(line)
+            to_delete = [line.pk for menu_item_id, line in lines.items() if menu_item_id not in quantities]
+
+            if to_delete:
+                CartItem.objects.filter(pk__in=to_delete).delete()
+            if to_update:
+                CartItem.objects.bulk_update(to_update, ['quantity'])
+            if to_create:
+                CartItem.objects.bulk_create(to_create)
+
+    def clear(self, user):
+        try:
+            cart = Cart.objects.get(user=user)
+        except Cart.DoesNotExist:
+            return False
+        cart.clear()
+        return True
+
+    def remove_ordered(self, user, lines):
+        ordered = {line.pk: line.quantity for line in lines}
+        if not ordered:
+            return
+        items = CartItem.objects.filter(cart__user=user)
+        fully_ordered = Q()
+        for pk, quantity in ordered.items():
+            fully_ordered |= Q(pk=pk, quantity__lte=quantity)
+        items.filter(fully_ordered).delete()
+        items.filter(pk__in=ordered).update(quantity=F('quantity') - Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in ordered.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+
+class CacheCart:
+    """Cart-shaped view of a cached cart for CartSerializer"""
+
+    def __init__(self, user, items, created_at, updated_at):
+        self.id = user.pk
+        self.items = items
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @property
+    def total_items(self):
+        return sum(item.quantity for item in self.items)
+
+    @property
+    def total_price(self):
+        return sum((item.total_price for item in self.items), Decimal('0.00'))
+
+
+class CacheCartStore(BaseCartStore):
+    """Carts kept in the Django cache and written to the database lazily.
+
+    Needs a cache shared by every process whose ``add`` is atomic (Redis,
+    Memcached or the database cache): ``flush_carts`` runs in its own
+    process and has to see the carts the web workers wrote, and every
+    read-modify-write of a cart holds a lock taken with ``cache.add``, so
+    concurrent changes from different workers never lose an update. Lines
+    are identified by their menu item id, so ``item_id`` in the cart URLs
+    is the menu item id with this store.
+
+    Each cart has its own ``cart:store:dirty:<user id>`` marker holding the
+    time it was last changed. The first change after a flush also sets
+    ``Cart.pending_flush``, so ``flush`` can find the carts to write
+    without the cache having to list its keys. Carts and markers expire
+    ``CART_STORE_CACHE_TIMEOUT`` seconds after their last change, and are
+    dropped once checkout or ``clear`` has written the cart through.
+    """
+    key_prefix = 'cart:store:'
+    dirty_prefix = 'cart:store:dirty:'
+    lock_prefix = 'cart:store:lock:'
+    # Local to a process, or with an add() that is not atomic across them
+    unsupported_backends = (LocMemCache, DummyCache, FileBasedCache)
+    # Seconds a lock is held at most (a crashed holder frees it), waited
+    # for before giving up with CartBusy, and between attempts
+    lock_timeout = 10
+    lock_wait = 5
+    lock_poll = 0.01
+
+    def __init__(self):
+        if isinstance(caches[DEFAULT_CACHE_ALIAS], self.unsupported_backends):
+            raise ImproperlyConfigured(
+                "CacheCartStore needs a cache shared between processes with an "
+                "atomic add() (Redis, Memcached or the database cache)"
+            )
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'CART_STORE_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+
+    def _key(self, user_id):
+        return f'{self.key_prefix}{user_id}'
+
+    def _dirty_key(self, user_id):
+        return f'{self.dirty_prefix}{user_id}'
+
+    @contextmanager
+    def _lock(self, user_id):
+        """Hold the cart of ``user_id`` against every other process"""
+        key = f'{self.lock_prefix}{user_id}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not cache.add(key, token, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise CartBusy()
+            time.sleep(self.lock_poll)
+        try:
+            yield
+        finally:
+            # Past lock_timeout the lock may already belong to someone else
+            if cache.get(key) == token:
+                cache.delete(key)
+
+    def _load(self, user_id):
+        state = cache.get(self._key(user_id))
+        if state is not None:
+            return state
+        # Cache miss: start from whatever was last persisted
+        now = timezone.now().isoformat()
+        state = {'lines': {}, 'created_at': now, 'updated_at': now}
+        for menu_item_id, quantity, added_at in CartItem.objects.filter(
+            cart__user_id=user_id
+        ).values_list('menu_item_id', 'quantity', 'added_at'):
+            state['lines'][menu_item_id] = [quantity, added_at.isoformat()]
+        return state
+
+    def _save(self, user_id, state):
+        state['updated_at'] = timezone.now().isoformat()
+        cache.set(self._key(user_id), state, self.timeout)
+        # The state is written before the marker, so a flush that removed
+        # the marker before this point still reads the new state
+        if cache.add(self._dirty_key(user_id), time.time(), self.timeout):
+            Cart.objects.bulk_create(
+                [Cart(user_id=user_id, pending_flush=True)],
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['pending_flush'],
+            )
+        else:
+            cache.set(self._dirty_key(user_id), time.time(), self.timeout)
+
+    def _forget_on_commit(self, user_id, state):
+        """Drop the cached cart once the write-through commits, unless it
+        changed since ``state``; the next read loads it from the tables"""
+        def forget():
+            with self._lock(user_id):
+                current = cache.get(self._key(user_id))
+                if current is not None and current['updated_at'] != state['updated_at']:
+                    return
+                cache.delete_many([self._key(user_id), self._dirty_key(user_id)])
+                Cart.objects.filter(user_id=user_id, pending_flush=True).update(pending_flush=False)
+        transaction.on_commit(forget)
+
+    def _line(self, menu_item, quantity, added_at):
+        return CartItem(id=menu_item.pk, menu_item=menu_item, quantity=quantity, added_at=parse_datetime(added_at))
+
+    def _lines(self, state):
+        menu_items = MenuItem.objects.in_bulk(list(state['lines']))
+        lines = [
+            self._line(menu_items[menu_item_id], quantity, added_at)
+            for menu_item_id, (quantity, added_at) in state['lines'].items()
+            if menu_item_id in menu_items
+        ]
+        lines.sort(key=lambda line: (line.added_at, line.id))
+        return lines
+
+    def get_cart(self, user):
+        state = self._load(user.pk)
+        return CacheCart(
+            user,
+            self._lines(state),
+            parse_datetime(state['created_at']),
+            parse_datetime(state['updated_at']),
+        )
+
+    def get_summary(self, user):
+        lines = self._lines(self._load(user.pk))
+        return {
+            'total_items': sum(line.quantity for line in lines),
+            'total_price': sum((line.total_price for line in lines), Decimal('0.00')),
+            'items_count': len(lines),
+        }
+
+    def get_lines(self, user):
+        return self._lines(self._load(user.pk))
+
+    def add(self, user, menu_item, quantity):
+        with self._lock(user.pk):
+            state = self._load(user.pk)
+            line = state['lines'].get(menu_item.pk)
+            created = line is None
+            if created:
+                line = [0, timezone.now().isoformat()]
+            line[0] = min(line[0] + quantity, MAX_LINE_QUANTITY)
+            state['lines'][menu_item.pk] = line
+            self._save(user.pk, state)
+        return self._line(menu_item, *line), created
+
+    def update(self, user, item_id, quantity):
+        with self._lock(user.pk):
+            state = self._load(user.pk)
+            line = state['lines'].get(item_id)
+            if line is None:
+                return None
+            line[0] = quantity
+            self._save(user.pk, state)
+        try:
+            return self._line(MenuItem.objects.get(pk=item_id), *line)
+        except MenuItem.DoesNotExist:
+            return None
+
+    def remove(self, user, item_id):
+        menu_item = MenuItem.objects.filter(pk=item_id).first()
+        with self._lock(user.pk):
+            state = self._load(user.pk)
+            line = state['lines'].pop(item_id, None)
+            if line is None:
+                return None
+            self._save(user.pk, state)
+        # Lines of deleted menu items are dropped like the CASCADE would
+        return self._line(menu_item, *line) if menu_item else None
+
+    def apply(self, user, operations, replace=False):
+        with self._lock(user.pk):
+            state = self._load(user.pk)
+            now = timezone.now().isoformat()
+            quantities = fold_operations(
+                {menu_item_id: line[0] for menu_item_id, line in state['lines'].items()},
+                operations,
+                replace,
+            )
+            state['lines'] = {
+                menu_item_id: [quantity, state['lines'].get(menu_item_id, [0, now])[1]]
+                for menu_item_id, quantity in quantities.items()
+            }
+            self._save(user.pk, state)
+
+    def clear(self, user):
+        with self._lock(user.pk):
+            state = self._load(user.pk)
+            had_lines = bool(state['lines'])
+            state['lines'] = {}
+            self._save(user.pk, state)
+        # Written through so a cache eviction cannot bring back a cart that
+        # was already checked out from an earlier flush
+        CartItem.objects.filter(cart__user=user).delete()
+        self._forget_on_commit(user.pk, state)
+        return had_lines
+
+    def remove_ordered(self, user, lines):
+        with self._lock(user.pk):
+            state = self._load(user.pk)
+            for line in lines:
+                current = state['lines'].get(line.menu_item_id)
+                if current is None:
+                    continue
+                current[0] -= line.quantity
+                if current[0] <= 0:
+                    del state['lines'][line.menu_item_id]
+            self._save(user.pk, state)
+            # Written through like clear(), so an evicted cache entry cannot
+            # bring ordered lines back from an earlier flush
+            self._persist(user.pk, state)
+        self._forget_on_commit(user.pk, state)
+
+    def flush(self, idle_seconds=None):
+        """Write carts untouched for ``idle_seconds`` (all if None) to the database"""
+        now = time.time()
+        count = 0
+        for user_id in Cart.objects.filter(pending_flush=True).values_list('user_id', flat=True):
+            touched = cache.get(self._dirty_key(user_id))
+            if touched is not None and idle_seconds is not None and now - touched < idle_seconds:
+                continue
+            # Clear the flags before reading the state: a change made after
+            # this sets them again and is written by a later flush
+            Cart.objects.filter(user_id=user_id).update(pending_flush=False)
+            cache.delete(self._dirty_key(user_id))
+            with self._lock(user_id):
+                state = cache.get(self._key(user_id))
+                if state is not None:
+                    self._persist(user_id, state)
+            count += 1
+        return count
+
+    def _persist(self, user_id, state):
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user_id=user_id)
+            existing = set(MenuItem.objects.filter(pk__in=list(state['lines'])).values_list('pk', flat=True))
+            CartItem.objects.filter(cart=cart).exclude(menu_item_id__in=existing).delete()
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(cart=cart, menu_item_id=menu_item_id, quantity=quantity, added_at=parse_datetime(added_at))
+                    for menu_item_id, (quantity, added_at) in state['lines'].items()
+                    if menu_item_id in existing
+                ],
+                update_conflicts=True,
+                unique_fields=['cart', 'menu_item'],
+                update_fields=['quantity'],
+            )
+
+
+_stores = {}
+
+
+def get_cart_store():
+    """The store configured by ``settings.CART_STORE``"""
+    path = getattr(settings, 'CART_STORE', 'cart.stores.DatabaseCartStore')
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
@@ -1,3 +1,369 @@
-from django.test import TestCase
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from menu.models import MenuItem
+
+from .models import MAX_LINE_QUANTITY, Cart, CartItem
+from .stores import CacheCartStore, CartBusy
+
+
+class CartQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(name=f'Item {number}', price='2.50') for number in range(50)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_cart_reads_do_not_grow_with_the_cart(self):
+        CartItem.objects.add_quantity(self.user, self.menu_items[0], 1)
+        detail_queries, detail = self.queries_for('/api/cart/')
+        summary_queries, summary = self.queries_for('/api/cart/summary/')
+        self.assertEqual(len(detail['items']), 1)
+        self.assertEqual(summary['items_count'], 1)
+
+        for menu_item in self.menu_items[1:]:
+            CartItem.objects.add_quantity(self.user, menu_item, 2)
+
+        with self.assertNumQueries(detail_queries):
+            detail = self.client.get('/api/cart/').json()
+        with self.assertNumQueries(summary_queries):
+            summary = self.client.get('/api/cart/summary/').json()
+        self.assertEqual(len(detail['items']), 50)
+        self.assertEqual(detail['total_items'], 99)
+        self.assertEqual(summary['items_count'], 50)
+        self.assertEqual(summary['total_price'], 247.5)
+
+
+class AddQuantityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.00')
+
+    def add_twice(self):
+        with CaptureQueriesContext(connection) as queries:
+            first, first_created = CartItem.objects.add_quantity(self.user, self.tea, 2)
+            second, second_created = CartItem.objects.add_quantity(self.user, self.tea, MAX_LINE_QUANTITY)
+        self.assertEqual((first.quantity, first_created), (2, True))
+        self.assertEqual((second.pk, second.quantity, second_created), (first.pk, MAX_LINE_QUANTITY, False))
+        return ' '.join(query['sql'] for query in queries)
+
+    def test_upsert_returns_the_line(self):
+        self.assertIn('RETURNING', self.add_twice())
+
+    def test_falls_back_without_returning_from_insert(self):
+        # SQLite before 3.35
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            self.assertNotIn('RETURNING', self.add_twice())
+
+
+class CartBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.tea, cls.cake, cls.samosa = MenuItem.objects.bulk_create([
+            MenuItem(name='Tea', price='1.00'),
+            MenuItem(name='Cake', price='3.00'),
+            MenuItem(name='Samosa', price='1.50'),
+        ])
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(name=f'Item {number}', price='2.00') for number in range(40)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, operations, replace=False):
+        return self.client.post('/api/cart/batch/', {'operations': operations, 'replace': replace}, format='json')
+
+    def lines(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('menu_item_id', 'quantity'))
+
+    def test_mixed_operations_apply_in_order(self):
+        CartItem.objects.add_quantity(self.user, self.tea, 2)
+        CartItem.objects.add_quantity(self.user, self.cake, 1)
+        response = self.batch([
+            {'op': 'add', 'menu_item_id': self.tea.pk, 'quantity': 3},
+            {'op': 'update', 'menu_item_id': self.samosa.pk, 'quantity': 4},
+            {'op': 'remove', 'menu_item_id': self.cake.pk},
+            {'op': 'add', 'menu_item_id': self.samosa.pk, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines(), {self.tea.pk: 5, self.samosa.pk: 5})
+        self.assertEqual(response.data['cart']['total_items'], 10)
+
+    def test_replace_syncs_the_whole_cart(self):
+        CartItem.objects.add_quantity(self.user, self.tea, 2)
+        response = self.batch([{'op': 'add', 'menu_item_id': self.cake.pk, 'quantity': 2}], replace=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines(), {self.cake.pk: 2})
+
+    def test_adds_clamp_at_the_line_limit(self):
+        CartItem.objects.add_quantity(self.user, self.tea, MAX_LINE_QUANTITY - 1)
+        self.batch([
+            {'op': 'add', 'menu_item_id': self.tea.pk, 'quantity': 5},
+            {'op': 'add', 'menu_item_id': self.cake.pk, 'quantity': MAX_LINE_QUANTITY},
+            {'op': 'add', 'menu_item_id': self.cake.pk, 'quantity': 1},
+        ])
+        self.assertEqual(self.lines(), {self.tea.pk: MAX_LINE_QUANTITY, self.cake.pk: MAX_LINE_QUANTITY})
+        response = self.batch([{'op': 'update', 'menu_item_id': self.tea.pk, 'quantity': MAX_LINE_QUANTITY + 1}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_unavailable_or_missing_items_reject_the_batch(self):
+        CartItem.objects.add_quantity(self.user, self.tea, 2)
+        MenuItem.objects.filter(pk=self.samosa.pk).update(available=False)
+        response = self.batch([
+            {'op': 'add', 'menu_item_id': self.cake.pk, 'quantity': 1},
+            {'op': 'add', 'menu_item_id': self.samosa.pk, 'quantity': 1},
+            {'op': 'update', 'menu_item_id': 999999, 'quantity': 1},
+            {'op': 'remove', 'menu_item_id': self.tea.pk},
+        ], replace=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['operations'][0], {})
+        self.assertIn('menu_item_id', response.data['operations'][1])
+        self.assertIn('menu_item_id', response.data['operations'][2])
+        self.assertEqual(self.lines(), {self.tea.pk: 2})
+
+    def queries_for(self, count):
+        """Queries of a batch touching ``count`` existing lines and adding two new ones"""
+        CartItem.objects.filter(cart__user=self.user).delete()
+        operations = []
+        for number, menu_item in enumerate(self.menu_items[:count]):
+            CartItem.objects.add_quantity(self.user, menu_item, 1)
+            op = ('add', 'update', 'remove')[number % 3]
+            operations.append({'op': op, 'menu_item_id': menu_item.pk, **({} if op == 'remove' else {'quantity': 2})})
+        operations += [{'op': 'add', 'menu_item_id': menu_item.pk, 'quantity': 1} for menu_item in (self.cake, self.samosa)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.batch(operations)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.lines()), count - count // 3 + 2)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self.assertEqual(self.queries_for(3), self.queries_for(39))
+
+
+class CartConcurrencyTests(TransactionTestCase):
+    threads = 8
+    adds_per_thread = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        self.menu_item = MenuItem.objects.create(name='Tea', price='1.00')
+
+    def hammer(self, quantity):
+        """Add ``quantity`` of the item from many threads at once, returns the status codes"""
+        start = threading.Barrier(self.threads)
+        statuses = []
+
+        def worker():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                start.wait()
+                for _ in range(self.adds_per_thread):
+                    response = client.post(
+                        '/api/cart/add/', {'menu_item_id': self.menu_item.pk, 'quantity': quantity}, format='json'
+                    )
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return statuses
+
+    def test_concurrent_adds_keep_every_increment(self):
+        statuses = self.hammer(1)
+        self.assertEqual(statuses, [201] * self.threads * self.adds_per_thread)
+        line = CartItem.objects.get(cart__user=self.user)
+        self.assertEqual(line.quantity, self.threads * self.adds_per_thread)
+
+    def test_concurrent_adds_clamp_at_the_line_limit(self):
+        statuses = self.hammer(3)
+        self.assertEqual(statuses, [201] * self.threads * self.adds_per_thread)
+        line = CartItem.objects.get(cart__user=self.user)
+        self.assertEqual(line.quantity, MAX_LINE_QUANTITY)
+
+
+# Shared between processes with an atomic add(), like Redis or Memcached
+DATABASE_CACHE = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cart_store_test_cache'},
+})
+
+
+@DATABASE_CACHE
+class CacheCartStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('createcachetable', verbosity=0)
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.other = User.objects.create_user('sam', 'sam@example.com', 'pw')
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.00')
+        cls.cake = MenuItem.objects.create(name='Cake', price='3.00')
+
+    def setUp(self):
+        # Separate instances share nothing but the cache and the database,
+        # like a web worker and the flush_carts process
+        self.web = CacheCartStore()
+        self.flusher = CacheCartStore()
+
+    def lines(self, user):
+        return dict(CartItem.objects.filter(cart__user=user).values_list('menu_item_id', 'quantity'))
+
+    def test_refuses_a_cache_without_a_shared_atomic_add(self):
+        for backend, location in (
+            ('django.core.cache.backends.locmem.LocMemCache', ''),
+            ('django.core.cache.backends.filebased.FileBasedCache', tempfile.gettempdir()),
+        ):
+            with override_settings(CACHES={'default': {'BACKEND': backend, 'LOCATION': location}}):
+                with self.assertRaises(ImproperlyConfigured):
+                    CacheCartStore()
+
+    def test_cart_held_by_another_process_is_busy(self):
+        self.web.add(self.user, self.tea, 1)
+        with self.flusher._lock(self.user.pk), mock.patch.object(CacheCartStore, 'lock_wait', 0.05):
+            with self.assertRaises(CartBusy):
+                self.web.add(self.user, self.tea, 1)
+            client = APIClient()
+            client.force_authenticate(self.user)
+            with override_settings(CART_STORE='cart.stores.CacheCartStore'):
+                response = client.post('/api/cart/add/', {'menu_item_id': self.tea.pk, 'quantity': 1}, format='json')
+            self.assertEqual(response.status_code, 503)
+        self.web.add(self.user, self.tea, 1)
+        self.assertEqual(self.web.get_summary(self.user)['total_items'], 2)
+
+    def test_cached_carts_expire(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            with override_settings(CART_STORE_CACHE_TIMEOUT=120):
+                self.web.add(self.user, self.tea, 1)
+                self.web.add(self.user, self.tea, 1)
+        self.assertTrue(cache_set.call_args_list)
+        for call in cache_set.call_args_list:
+            self.assertEqual(call.args[2], 120)
+
+    def test_checkout_drops_the_cached_cart(self):
+        self.web.add(self.user, self.tea, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.web.remove_ordered(self.user, self.web.get_lines(self.user))
+        self.assertIsNone(cache.get(self.web._key(self.user.pk)))
+        self.assertIsNone(cache.get(self.web._dirty_key(self.user.pk)))
+        self.assertFalse(Cart.objects.filter(pending_flush=True).exists())
+        self.assertEqual(self.web.get_summary(self.user)['total_items'], 0)
+
+        self.web.add(self.user, self.cake, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.web.clear(self.user)
+        self.assertIsNone(cache.get(self.web._key(self.user.pk)))
+        self.assertEqual(self.flusher.flush(), 0)
+
+    def test_changes_after_checkout_stay_cached(self):
+        self.web.add(self.user, self.tea, 2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.web.remove_ordered(self.user, self.web.get_lines(self.user))
+        # Added before the checkout transaction committed
+        self.web.add(self.user, self.cake, 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.flusher.flush(), 1)
+        self.assertEqual(self.lines(self.user), {self.cake.pk: 1})
+
+    def test_flush_in_another_process_writes_every_changed_cart(self):
+        self.web.add(self.user, self.tea, 2)
+        self.web.add(self.other, self.cake, 1)
+        self.assertEqual(self.lines(self.user), {})
+
+        self.assertEqual(self.flusher.flush(), 2)
+        self.assertEqual(self.lines(self.user), {self.tea.pk: 2})
+        self.assertEqual(self.lines(self.other), {self.cake.pk: 1})
+        self.assertFalse(Cart.objects.filter(pending_flush=True).exists())
+        self.assertEqual(self.flusher.flush(), 0)
+
+    def test_changes_after_a_flush_are_flushed_again(self):
+        self.web.add(self.user, self.tea, 2)
+        self.flusher.flush()
+        self.web.add(self.user, self.tea, 1)
+        self.web.add(self.user, self.cake, 1)
+
+        self.assertEqual(self.flusher.flush(), 1)
+        self.assertEqual(self.lines(self.user), {self.tea.pk: 3, self.cake.pk: 1})
+
+    def test_recently_changed_carts_wait_until_idle(self):
+        self.web.add(self.user, self.tea, 2)
+        self.assertEqual(self.flusher.flush(idle_seconds=300), 0)
+        self.assertEqual(self.flusher.flush(idle_seconds=0), 1)
+        self.assertEqual(self.lines(self.user), {self.tea.pk: 2})
+
+    def test_remove_ordered_keeps_what_was_added_since(self):
+        self.web.add(self.user, self.tea, 2)
+        ordered = self.web.get_lines(self.user)
+        self.web.add(self.user, self.tea, 1)
+        self.web.add(self.user, self.cake, 1)
+
+        self.web.remove_ordered(self.user, ordered)
+        self.assertEqual(
+            {line.menu_item_id: line.quantity for line in self.web.get_lines(self.user)},
+            {self.tea.pk: 1, self.cake.pk: 1},
+        )
+        self.assertEqual(self.lines(self.user), {self.tea.pk: 1, self.cake.pk: 1})
+
+
+@DATABASE_CACHE
+class CacheCartStoreConcurrencyTests(TransactionTestCase):
+    threads = 8
+    adds_per_thread = 5
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+        cache.clear()
+        self.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        self.menu_item = MenuItem.objects.create(name='Tea', price='1.00')
+
+    def test_workers_in_other_processes_keep_every_increment(self):
+        start = threading.Barrier(self.threads)
+        errors = []
+
+        def worker():
+            # Its own store, as in a separate web worker process
+            store = CacheCartStore()
+            try:
+                start.wait()
+                for _ in range(self.adds_per_thread):
+                    store.add(self.user, self.menu_item, 1)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(CacheCartStore().get_summary(self.user)['total_items'], self.threads * self.adds_per_thread)
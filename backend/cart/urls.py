@@ -9,6 +9,7 @@ urlpatterns = [
     
     # Cart item operations
     path('add/', views.add_to_cart, name='add-to-cart'),
+    path('batch/', views.cart_batch, name='cart-batch'),
     path('items/<int:item_id>/update/', views.update_cart_item, name='update-cart-item'),
     path('items/<int:item_id>/remove/', views.remove_from_cart, name='remove-from-cart'),
     path('clear/', views.clear_cart, name='clear-cart'),
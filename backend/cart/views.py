@@ -3,17 +3,17 @@ from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
-from django.db import transaction
 
-from .models import Cart, CartItem
+from core.idempotency import idempotent
+
 from .serializers import (
     CartSerializer, 
     CartItemSerializer, 
     AddToCartSerializer, 
-    UpdateCartItemSerializer
+    UpdateCartItemSerializer,
+    CartBatchSerializer
 )
-from menu.models import MenuItem
+from .stores import get_cart_store
 
 class CartDetailView(generics.RetrieveAPIView):
     """Get current user's cart"""
@@ -21,36 +21,23 @@ class CartDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        return cart
+        return get_cart_store().get_cart(self.request.user)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def add_to_cart(request):
     """Add item to cart or update quantity if item already exists"""
     serializer = AddToCartSerializer(data=request.data)
     
     if serializer.is_valid():
-        menu_item_id = serializer.validated_data['menu_item_id']
+        menu_item = serializer.menu_item
         quantity = serializer.validated_data['quantity']
         
-        # Get or create cart
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        
-        # Get menu item
-        menu_item = get_object_or_404(MenuItem, id=menu_item_id)
-        
-        # Check if item already in cart
-        cart_item, item_created = CartItem.objects.get_or_create(
-            cart=cart,
-            menu_item=menu_item,
-            defaults={'quantity': quantity}
-        )
+        # Atomic in every store, safe against double-taps from the same user
+        cart_item, item_created = get_cart_store().add(request.user, menu_item, quantity)
         
         if not item_created:
-            # Item already exists, update quantity
-            cart_item.quantity += quantity
-            cart_item.save()
             message = f"Updated {menu_item.name} quantity to {cart_item.quantity}"
         else:
             message = f"Added {menu_item.name} to cart"
@@ -62,6 +49,22 @@ def add_to_cart(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def cart_batch(request):
+    """Apply a list of add/update/remove operations in one transaction"""
+    serializer = CartBatchSerializer(data=request.data, context={'request': request})
+    
+    if serializer.is_valid():
+        cart = serializer.save()
+        return Response({
+            'message': 'Cart updated successfully',
+            'cart': CartSerializer(cart).data
+        })
+    
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_cart_item(request, item_id):
@@ -71,23 +74,17 @@ def update_cart_item(request, item_id):
     if serializer.is_valid():
         quantity = serializer.validated_data['quantity']
         
-        try:
-            cart_item = CartItem.objects.get(
-                id=item_id,
-                cart__user=request.user
-            )
-            cart_item.quantity = quantity
-            cart_item.save()
-            
-            return Response({
-                'message': 'Cart item updated successfully',
-                'cart_item': CartItemSerializer(cart_item).data
-            })
-        except CartItem.DoesNotExist:
+        cart_item = get_cart_store().update(request.user, item_id, quantity)
+        if cart_item is None:
             return Response(
                 {'error': 'Cart item not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        return Response({
+            'message': 'Cart item updated successfully',
+            'cart_item': CartItemSerializer(cart_item).data
+        })
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -95,52 +92,31 @@ def update_cart_item(request, item_id):
 @permission_classes([IsAuthenticated])
 def remove_from_cart(request, item_id):
     """Remove specific item from cart"""
-    try:
-        cart_item = CartItem.objects.get(
-            id=item_id,
-            cart__user=request.user
-        )
-        item_name = cart_item.menu_item.name
-        cart_item.delete()
-        
-        return Response({
-            'message': f'Removed {item_name} from cart'
-        }, status=status.HTTP_200_OK)
-    except CartItem.DoesNotExist:
+    cart_item = get_cart_store().remove(request.user, item_id)
+    if cart_item is None:
         return Response(
             {'error': 'Cart item not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+    
+    return Response({
+        'message': f'Removed {cart_item.menu_item.name} from cart'
+    }, status=status.HTTP_200_OK)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def clear_cart(request):
     """Clear all items from cart"""
-    try:
-        cart = Cart.objects.get(user=request.user)
-        cart.clear()
+    if get_cart_store().clear(request.user):
         return Response({
             'message': 'Cart cleared successfully'
         }, status=status.HTTP_200_OK)
-    except Cart.DoesNotExist:
-        return Response({
-            'message': 'Cart is already empty'
-        }, status=status.HTTP_200_OK)
+    return Response({
+        'message': 'Cart is already empty'
+    }, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def cart_summary(request):
     """Get cart summary (total items and price)"""
-    try:
-        cart = Cart.objects.get(user=request.user)
-        return Response({
-            'total_items': cart.total_items,
-            'total_price': cart.total_price,
-            'items_count': cart.items.count()
-        })
-    except Cart.DoesNotExist:
-        return Response({
-            'total_items': 0,
-            'total_price': 0.00,
-            'items_count': 0
-        })
\ No newline at end of file
+    return Response(get_cart_store().get_summary(request.user))
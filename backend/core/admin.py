@@ -1,4 +1,18 @@
 from django.contrib import admin
-from .models import CanteenTiming
+from .models import CanteenTiming, OutboundEmail, PickupSlot
 
-admin.site.register(CanteenTiming)
\ No newline at end of file
+admin.site.register(CanteenTiming)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['subject', 'recipients']
+    readonly_fields = ['attempts', 'last_error', 'claim_token', 'created_at', 'sent_at']
+
+
+@admin.register(PickupSlot)
+class PickupSlotAdmin(admin.ModelAdmin):
+    list_display = ['date', 'start', 'reserved']
+    list_filter = ['date']
@@ -0,0 +1,154 @@
+# core/events.py
+"""Tiny pub/sub used to push live updates over Server-Sent Events.
+
+Publishers are ordinary (sync) Django code such as signal receivers;
+subscribers are async SSE views running under ``canteen_cms.asgi``. Each
+subscriber owns an ``asyncio.Queue`` on its event loop and publishing hands
+the event over with ``call_soon_threadsafe``.
+
+``LocalBroker`` only reaches subscribers in the publishing process, which
+is enough for a single worker and for tests. Set ``EVENTS_BROKER`` to
+``'core.events.RedisBroker'`` to fan out across workers.
+"""
+import asyncio
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+SUBSCRIBER_QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15
+
+
+class LocalBroker:
+    """Fan-out to subscribers living in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+    def subscribe(self, channel):
+        """Register a queue on the running loop, returns it"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add((loop, queue))
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, set())
+            subscribers.difference_update({item for item in subscribers if item[1] is queue})
+
+
+def _offer(queue, event):
+    # A client that stopped reading must not grow memory forever; it gets a
+    # 'resync' marker and is expected to reload its snapshot
+    if queue.full():
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({'type': 'resync'})
+    else:
+        queue.put_nowait(event)
+
+
+class RedisBroker(LocalBroker):
+    """Relay events through Redis pub/sub so every worker sees them
+
+    Publishing goes to Redis only; one listener thread per process receives
+    every channel and fans out to local subscribers, the publishing process
+    included. Needs the ``redis`` package and ``EVENTS_REDIS_URL``.
+    """
+    prefix = 'events:'
+
+    def __init__(self):
+        super().__init__()
+        import redis
+
+        self._redis = redis.Redis.from_url(getattr(settings, 'EVENTS_REDIS_URL', 'redis://localhost:6379/0'))
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channel, event):
+        self._redis.publish(self.prefix + channel, json.dumps(event, default=str))
+
+    def subscribe(self, channel):
+        self._ensure_listener()
+        return super().subscribe(channel)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='events-redis', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + '*')
+        for message in pubsub.listen():
+            channel = message['channel']
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            LocalBroker.publish(self, channel[len(self.prefix):], json.loads(message['data']))
+
+
+@lru_cache(maxsize=None)
+def _load_broker(path):
+    return import_string(path)()
+
+
+def get_broker():
+    return _load_broker(getattr(settings, 'EVENTS_BROKER', 'core.events.LocalBroker'))
+
+
+def publish(channel, event):
+    get_broker().publish(channel, event)
+
+
+def publish_on_commit(channel, event):
+    """Publish once the surrounding transaction commits (immediately if none)"""
+    transaction.on_commit(lambda: publish(channel, event))
+
+
+def format_sse(event, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f"event: {event.get('type', 'message')}")
+    lines.append(f'data: {json.dumps(event, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def sse_stream(channel, initial_events=(), snapshot=None):
+    """Async iterator of SSE frames for ``channel`` with periodic heartbeats
+
+    ``snapshot`` is an optional coroutine function returning events to send
+    first; it runs after subscribing so no change in between is missed.
+    """
+    broker = get_broker()
+    queue = broker.subscribe(channel)
+    try:
+        for event in initial_events:
+            yield format_sse(event)
+        if snapshot is not None:
+            for event in await snapshot():
+                yield format_sse(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment lines keep proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(channel, queue)
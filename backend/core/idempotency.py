@@ -0,0 +1,173 @@
+# core/idempotency.py
+"""``Idempotency-Key`` support for POST endpoints.
+
+The first request with a given key claims an ``IdempotencyKey`` row, runs
+the view and stores its response on the row in the same transaction as the
+view's own writes, unless the view opts out with ``atomic``. Retries with
+the same key and body get that response back with an
+``Idempotent-Replayed`` header. A retry that arrives while the first
+request is still running waits for it instead of running the view again.
+
+Only final outcomes are stored: server errors and responses that say
+"try again" (``TRANSIENT_STATUSES``) release the key so a retry runs the
+view again. A claim is a lease: one left without a response for
+``IDEMPOTENCY_LEASE_SECONDS`` (its request crashed or its worker was
+killed) is taken over by the next retry.
+"""
+import hashlib
+import json
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.05
+# Conflicts and busy answers, a retry of the same request may succeed
+TRANSIENT_STATUSES = {408, 409, 423, 425, 429}
+
+
+def request_fingerprint(request):
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def is_final(response):
+    """Whether a retry with the same key should get ``response`` back"""
+    return response.status_code < 500 and response.status_code not in TRANSIENT_STATUSES
+
+
+def _lease_seconds():
+    return getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 30)
+
+
+def _lease_expired(record, now):
+    return record.response_status is None and record.created_at <= now - timedelta(seconds=_lease_seconds())
+
+
+def _claim(request, scope, key, fingerprint):
+    """Returns ``(record, created)``, replacing an expired or abandoned record"""
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+    lookup = {'user': request.user, 'scope': scope, 'key': key}
+    for _ in range(2):
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    request_hash=fingerprint, expires_at=now + timedelta(seconds=ttl), **lookup
+                )
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(**lookup).first()
+            if record is None:
+                return None, False
+            if record.expires_at <= now:
+                record.delete()
+                continue
+            if _lease_expired(record, now) and record.request_hash == fingerprint:
+                # Its request never finished; renew the lease for this one.
+                # Only one of several retries gets the conditional UPDATE
+                taken = IdempotencyKey.objects.filter(
+                    pk=record.pk, response_status__isnull=True, created_at=record.created_at
+                ).update(created_at=now)
+                if taken:
+                    record.created_at = now
+                    return record, True
+                record = IdempotencyKey.objects.filter(pk=record.pk).first()
+            return record, False
+    return record, False
+
+
+def _wait_for(record):
+    """Poll until the in-flight request stores its response, its lease runs
+    out, or we give up"""
+    lease_left = (record.created_at + timedelta(seconds=_lease_seconds()) - timezone.now()).total_seconds()
+    wait = min(getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10), max(lease_left, 0))
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(POLL_SECONDS)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+        if record is None or record.response_status is not None:
+            return record
+    return record
+
+
+def idempotent(view_func=None, *, atomic=True):
+    """Decorator for function based POST views (place below ``@permission_classes``)
+
+    Requests without the header run as before. Keys are scoped to the user
+    and the view. ``atomic`` (a bool, or a callable checked per request)
+    may turn off the transaction around the view for views whose writes
+    commit on another thread; their response is then stored right after
+    the view returns, and a crash in between leaves a claim for the lease
+    to expire.
+    """
+    if view_func is None:
+        return lambda view_func: idempotent(view_func, atomic=atomic)
+    scope = view_func.__name__
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_func(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({
+                'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, created = _claim(request, scope, key, fingerprint)
+        if not created:
+            if record is not None and record.response_status is None and record.request_hash == fingerprint:
+                record = _wait_for(record)
+            if record is None or record.response_status is None:
+                # The first request released the key, or its lease ran out
+                record, created = _claim(request, scope, key, fingerprint)
+        if not created:
+            if record is not None and record.request_hash != fingerprint:
+                return Response({
+                    'error': f'{HEADER} was already used for a different request'
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record is None or record.response_status is None:
+                return Response({
+                    'error': f'A request with this {HEADER} is still being processed'
+                }, status=status.HTTP_409_CONFLICT)
+            return _replay(record)
+
+        in_transaction = atomic() if callable(atomic) else atomic
+        try:
+            with transaction.atomic() if in_transaction else nullcontext():
+                response = view_func(request, *args, **kwargs)
+                if is_final(response):
+                    # Store what the client will see, as plain JSON
+                    record.response_status = response.status_code
+                    record.response_body = json.loads(json.dumps(response.data, cls=JSONEncoder))
+                    record.save(update_fields=['response_status', 'response_body'])
+        except Exception:
+            record.delete()
+            raise
+        if not is_final(response):
+            # Let the client retry the key
+            record.delete()
+        return response
+
+    return wrapper
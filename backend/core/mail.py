@@ -0,0 +1,143 @@
+# core/mail.py
+"""Transactional email outbox.
+
+Request code calls ``queue_mail`` instead of ``send_mail``; the message is
+written to ``OutboundEmail`` once the surrounding transaction commits, so
+requests never wait on the mail server. ``manage.py send_queued_mail``
+drains the table through a single backend connection, retrying failures
+with exponential backoff.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """Add an email to the outbox after the current transaction commits"""
+    recipients = [address for address in recipient_list if address]
+    if not recipients:
+        return
+
+    def write():
+        OutboundEmail.objects.create(
+            subject=subject[:255],
+            body=message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=recipients,
+        )
+
+    transaction.on_commit(write)
+
+
+def queue_mass_mail(messages, from_email=None):
+    """Queue ``(subject, message, recipient_list)`` tuples with one INSERT on commit"""
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL
+    emails = [
+        OutboundEmail(
+            subject=subject[:255],
+            body=message,
+            from_email=from_email,
+            recipients=[address for address in recipient_list if address],
+        )
+        for subject, message, recipient_list in messages
+        if any(recipient_list)
+    ]
+    if emails:
+        transaction.on_commit(lambda: OutboundEmail.objects.bulk_create(emails))
+
+
+def retry_delay(attempts):
+    """Backoff before attempt number ``attempts + 1``"""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_SECONDS', 30)
+    cap = getattr(settings, 'EMAIL_OUTBOX_MAX_RETRY_SECONDS', 60 * 60)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), cap))
+
+
+def claim_batch(batch_size):
+    """Reserve up to ``batch_size`` due messages for this worker
+
+    The conditional UPDATE pushes ``next_attempt_at`` past the claim lease,
+    so another worker polling at the same time skips rows already taken.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_CLAIM_SECONDS', 300))
+    due = OutboundEmail.objects.filter(status='PENDING', next_attempt_at__lte=now)
+    ids = list(due.values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    due.filter(id__in=ids).update(claim_token=token, next_attempt_at=now + lease)
+    return list(OutboundEmail.objects.filter(claim_token=token, status='PENDING'))
+
+
+def defer(email, error, max_attempts):
+    """Record a failed attempt and schedule the retry, or give up"""
+    email.attempts += 1
+    email.last_error = str(error)
+    email.claim_token = ''
+    if email.attempts >= max_attempts:
+        email.status = 'FAILED'
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'claim_token', 'status', 'next_attempt_at'])
+
+
+def send_batch(batch_size=None, connection=None):
+    """Send one batch from the outbox, returns ``(sent, failed)`` counts
+
+    Messages go out over one connection; a message that raises is put back
+    with a backoff delay, or marked FAILED after EMAIL_OUTBOX_MAX_ATTEMPTS.
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            defer(email, e, max_attempts)
+        return 0, len(emails)
+
+    sent = []
+    failed = 0
+    try:
+        for email in emails:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=email.recipients,
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                defer(email, e, max_attempts)
+                # A dropped SMTP session fails every later message too
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+            else:
+                sent.append(email.id)
+    finally:
+        connection.close()
+
+    if sent:
+        OutboundEmail.objects.filter(id__in=sent).update(
+            status='SENT', sent_at=timezone.now(), claim_token='', last_error=''
+        )
+    return len(sent), failed
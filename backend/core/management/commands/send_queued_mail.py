@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.mail import send_batch
+
+
+class Command(BaseCommand):
+    help = "Send emails waiting in the outbox, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50))
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting once the outbox is drained")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to sleep between polls with --loop")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_batch(batch_size=options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {total_sent} emails, {total_failed} failed"))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canteentiming',
+            name='capacity_unit',
+            field=models.CharField(choices=[('ITEMS', 'Items'), ('PREP_MINUTES', 'Prep minutes')], default='ITEMS', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='canteentiming',
+            name='slot_capacity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='canteentiming',
+            name='slot_minutes',
+            field=models.PositiveSmallIntegerField(default=15),
+        ),
+        migrations.CreateModel(
+            name='PickupSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start', models.TimeField()),
+                ('reserved', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('date', 'start')},
+            },
+        ),
+    ]
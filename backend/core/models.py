@@ -1,8 +1,88 @@
+from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 class CanteenTiming(models.Model):
+    CAPACITY_UNITS = [
+        ('ITEMS', 'Items'),
+        ('PREP_MINUTES', 'Prep minutes'),
+    ]
+
     opening_time = models.TimeField(default='09:00')
     closing_time = models.TimeField(default='17:00')
+    # Pickup slots (core.slots) split opening hours into slot_minutes
+    # windows; each takes at most slot_capacity items or prep minutes of
+    # orders and bookings. A capacity of 0 turns slot scheduling off.
+    slot_minutes = models.PositiveSmallIntegerField(default=15)
+    slot_capacity = models.PositiveIntegerField(default=0)
+    capacity_unit = models.CharField(max_length=20, choices=CAPACITY_UNITS, default='ITEMS')
+
+    def __str__(self):
+        return f"{self.opening_time} - {self.closing_time}"
+
+
+class PickupSlot(models.Model):
+    """Load reserved so far in one pickup window, see core.slots
+
+    Rows are created the first time a slot on a day is reserved; a missing
+    row means nothing is reserved yet.
+    """
+    date = models.DateField()
+    start = models.TimeField()
+    reserved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'start')
+
+    def __str__(self):
+        return f"{self.date} {self.start:%H:%M} ({self.reserved} reserved)"
+
+class OutboundEmail(models.Model):
+    """An email waiting in the outbox for `manage.py send_queued_mail`"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # When the message is next due; also pushed forward while a worker holds it
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of a request sent with an ``Idempotency-Key`` header"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    # Name of the view, keys are only unique per user and endpoint
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    # Null until the first request finishes
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'scope', 'key')
 
     def __str__(self):
-        return f"{self.opening_time} - {self.closing_time}"
\ No newline at end of file
+        return f"{self.scope} {self.key} ({self.response_status or 'in progress'})"
@@ -0,0 +1,101 @@
+# core/query_budget.py
+"""Per-view limits on the number of SQL queries a request may run.
+
+Budgets are declared next to the views, with ``@query_budget(n)`` on
+function views or a ``query_budget = n`` attribute on class based views.
+The tests hold the views to them with ``assert_max_queries``.
+``QueryBudgetMiddleware`` only logs a warning for requests that go over
+(``QUERY_BUDGET_WARNINGS``); by then the view has run and its writes
+are committed, so failing the request would only invite a retry.
+"""
+import logging
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` that records the SQL it sees"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+
+def query_budget(limit):
+    """Declare the most queries a function view may run per request"""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def get_query_budget(view):
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+def _report(limit, counter, label):
+    listing = '\n'.join(f'{number}. {sql}' for number, sql in enumerate(counter.queries, 1))
+    return f"{label} ran {len(counter)} queries, budget is {limit}:\n{listing}"
+
+
+@contextmanager
+def assert_max_queries(limit, using='default', label='Block'):
+    """Fail if the block runs more than ``limit`` queries on ``using``"""
+    counter = QueryCounter()
+    with connections[using].execute_wrapper(counter):
+        yield counter
+    if len(counter) > limit:
+        raise QueryBudgetExceeded(_report(limit, counter, label))
+
+
+class QueryBudgetMiddleware:
+    """Check each request against the budget of the view it resolved to
+
+    Only synchronous requests (runserver, WSGI, the test client) are
+    counted; under ASGI requests pass straight through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not getattr(settings, 'QUERY_BUDGET_WARNINGS', False):
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        with connections['default'].execute_wrapper(counter):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        limit = get_query_budget(match.func) if match else None
+        if limit is not None and len(counter) > limit:
+            logger.warning(_report(limit, counter, f'{request.method} {request.path}'))
+        return response
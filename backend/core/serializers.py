@@ -1,7 +1,17 @@
 from rest_framework import serializers
-from .models import CanteenTiming
+from .models import CanteenTiming, PickupSlot
 
 class CanteenTimingSerializer(serializers.ModelSerializer):
     class Meta:
         model = CanteenTiming
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class PickupSlotSerializer(serializers.ModelSerializer):
+    start = serializers.TimeField(format='%H:%M')
+
+    class Meta:
+        model = PickupSlot
+        fields = ['date', 'start']
+
+class SlotAvailabilityQuerySerializer(serializers.Serializer):
+    date = serializers.DateField(required=False)
@@ -0,0 +1,133 @@
+# core/slots.py
+"""Pickup time slots with a per-slot kitchen capacity.
+
+Opening hours from ``CanteenTiming`` are cut into ``slot_minutes`` windows.
+Orders and bookings reserve their load (items, or prep minutes) in one
+window when they are created; a reservation is a single conditional
+UPDATE on the slot's ``PickupSlot`` counter, so concurrent requests can
+never push a slot past its capacity.
+"""
+from datetime import datetime, timedelta
+
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import CanteenTiming, PickupSlot
+
+
+class SlotUnavailable(Exception):
+    """No slot (or not the requested one) can take the load"""
+
+
+def slot_timing(timing):
+    """``timing`` when it turns slot scheduling on, else None"""
+    if timing is None or not timing.slot_capacity or not timing.slot_minutes:
+        return None
+    return timing
+
+
+def get_timing():
+    return slot_timing(CanteenTiming.objects.first())
+
+
+def slot_starts(timing):
+    """Start times of the day's slots, the last one starting before closing"""
+    day = datetime(2000, 1, 1)
+    start = datetime.combine(day, timing.opening_time)
+    closing = datetime.combine(day, timing.closing_time)
+    step = timedelta(minutes=timing.slot_minutes)
+    starts = []
+    while start < closing:
+        starts.append(start.time())
+        start += step
+    return starts
+
+
+def slot_end(timing, start):
+    return (datetime.combine(datetime(2000, 1, 1), start) + timedelta(minutes=timing.slot_minutes)).time()
+
+
+def open_starts(timing, day):
+    """Slots on ``day`` that have not started yet"""
+    starts = slot_starts(timing)
+    now = timezone.localtime()
+    if day < now.date():
+        return []
+    if day == now.date():
+        starts = [start for start in starts if start >= now.time()]
+    return starts
+
+
+def load_of(timing, lines):
+    """Load of ``(menu_item, quantity)`` lines in the timing's capacity unit"""
+    if timing.capacity_unit == 'PREP_MINUTES':
+        return sum(menu_item.prep_minutes * quantity for menu_item, quantity in lines)
+    return sum(quantity for _, quantity in lines)
+
+
+def day_availability(day, timing):
+    """Every slot on ``day`` with its capacity and what is left, one query"""
+    reserved = dict(PickupSlot.objects.filter(date=day).values_list('start', 'reserved'))
+    bookable = set(open_starts(timing, day))
+    return [
+        {
+            'start': start.strftime('%H:%M'),
+            'end': slot_end(timing, start).strftime('%H:%M'),
+            'capacity': timing.slot_capacity,
+            'reserved': reserved.get(start, 0),
+            'available': max(timing.slot_capacity - reserved.get(start, 0), 0) if start in bookable else 0,
+        }
+        for start in slot_starts(timing)
+    ]
+
+
+def reserve(timing, day, load, start=None):
+    """Reserve ``load`` in the requested slot, or the earliest one with room
+
+    Returns the ``PickupSlot``; raises ``SlotUnavailable`` when nothing fits.
+    Call inside the transaction that creates the order or booking, so a
+    failure afterwards gives the capacity back.
+    """
+    candidates = open_starts(timing, day)
+    if start is not None:
+        if start not in candidates:
+            raise SlotUnavailable(f"{start:%H:%M} is not an open pickup slot on {day}")
+        candidates = [start]
+    if load > timing.slot_capacity:
+        raise SlotUnavailable("The order is larger than a pickup slot can take")
+
+    # Writing first makes SQLite take the write lock before the read below;
+    # a read-then-write transaction fails with "database is locked" when
+    # another one got the lock in between
+    PickupSlot.objects.bulk_create(
+        [PickupSlot(date=day, start=candidate) for candidate in candidates], ignore_conflicts=True
+    )
+    slots = {slot.start: slot for slot in PickupSlot.objects.filter(date=day, start__in=candidates)}
+
+    for candidate in candidates:
+        slot = slots[candidate]
+        # Counts read above may be stale; the UPDATE decides
+        if slot.reserved + load > timing.slot_capacity:
+            continue
+        taken = PickupSlot.objects.filter(
+            pk=slot.pk, reserved__lte=timing.slot_capacity - load
+        ).update(reserved=F('reserved') + load)
+        if taken:
+            slot.reserved += load
+            return slot
+
+    if start is not None:
+        raise SlotUnavailable(f"The {start:%H:%M} pickup slot is full")
+    raise SlotUnavailable(f"No pickup slots left on {day}")
+
+
+def release(loads):
+    """Give back ``{slot_id: load}`` reserved by cancelled orders or bookings"""
+    loads = {slot_id: load for slot_id, load in loads.items() if slot_id and load}
+    if not loads:
+        return
+    PickupSlot.objects.filter(pk__in=loads).update(reserved=F('reserved') - Case(
+        *[When(pk=slot_id, then=Value(load)) for slot_id, load in loads.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
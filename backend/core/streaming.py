@@ -0,0 +1,39 @@
+# core/streaming.py
+"""Streaming responses built from sync iterators that stay streamed under ASGI.
+
+Django serves a ``StreamingHttpResponse`` over a sync iterator to an ASGI
+server by reading the whole iterator with ``sync_to_async(list)`` first, so
+a large export would sit in memory before the first byte is sent. The
+exports read the database from a sync iterator (querysets have no
+async streaming cursor on SQLite), so this response keeps the iterator and
+pulls it in ~``READ_BYTES`` batches, one thread hop per batch, on the
+request's sync thread where its database connection lives. Under WSGI it
+behaves like the plain response.
+"""
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+READ_BYTES = 64 * 1024
+
+
+def _read_batch(chunks, limit=READ_BYTES):
+    """Next chunks of ``chunks`` adding up to about ``limit`` bytes, [] at the end"""
+    batch = []
+    size = 0
+    for chunk in chunks:
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return batch
+
+
+class SyncStreamingHttpResponse(StreamingHttpResponse):
+    """``StreamingHttpResponse`` over a sync iterator, read in batches under ASGI"""
+
+    async def __aiter__(self):
+        chunks = iter(self.streaming_content)
+        read_batch = sync_to_async(_read_batch, thread_sensitive=True)
+        while batch := await read_batch(chunks):
+            for chunk in batch:
+                yield chunk
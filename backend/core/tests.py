@@ -1,3 +1,284 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends.locmem import EmailBackend
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .idempotency import idempotent
+from .mail import claim_batch, queue_mail, queue_mass_mail, send_batch
+from .models import CanteenTiming, IdempotencyKey, OutboundEmail, PickupSlot
+from .slots import SlotUnavailable, day_availability, release, reserve
+from .streaming import READ_BYTES, SyncStreamingHttpResponse
+
+
+@override_settings(IDEMPOTENCY_WAIT_SECONDS=0.2, IDEMPOTENCY_LEASE_SECONDS=30)
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+
+    def setUp(self):
+        self.calls = 0
+        self.status = 201
+
+        @api_view(['POST'])
+        @idempotent
+        def create_thing(request):
+            self.calls += 1
+            return Response({'call': self.calls}, status=self.status)
+
+        self.view = create_thing
+
+    def post(self, key='abc'):
+        request = APIRequestFactory().post('/things/', {'name': 'tea'}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, self.user)
+        return self.view(request)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.post()
+        retry = self.post()
+        self.assertEqual((retry.status_code, retry.data), (201, {'call': 1}))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.data, retry.data)
+
+    def test_transient_responses_are_not_stored(self):
+        for transient in (409, 429, 503):
+            self.status = transient
+            self.assertEqual(self.post().status_code, transient)
+            self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.status = 201
+        self.assertEqual(self.post().data, {'call': 4})
+        self.assertEqual(self.post().data, {'call': 4})
+
+    def test_abandoned_claim_is_taken_over_after_its_lease(self):
+        self.post()
+        # The first request died before storing its response
+        record = IdempotencyKey.objects.get()
+        IdempotencyKey.objects.filter(pk=record.pk).update(response_status=None, response_body=None)
+
+        response = self.post()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.calls, 1)
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(seconds=31))
+        response = self.post()
+        self.assertEqual((response.status_code, response.data), (201, {'call': 2}))
+        self.assertEqual(self.post().data, {'call': 2})
+
+
+class SyncStreamingHttpResponseTests(SimpleTestCase):
+    def chunks(self, produced, count=10):
+        for number in range(count):
+            produced.append(number)
+            yield b'x' * READ_BYTES
+
+    async def first_chunk(self, response_class):
+        produced = []
+        response = response_class(self.chunks(produced))
+        async for chunk in response:
+            return chunk, len(produced)
+
+    async def test_sync_iterator_streams_under_asgi(self):
+        chunk, produced = await self.first_chunk(SyncStreamingHttpResponse)
+        self.assertEqual(len(chunk), READ_BYTES)
+        self.assertEqual(produced, 1)
+
+        # What the plain response does, for contrast
+        with self.assertWarns(Warning):
+            chunk, produced = await self.first_chunk(StreamingHttpResponse)
+        self.assertEqual(produced, 10)
+
+    def test_sync_iteration_is_unchanged(self):
+        response = SyncStreamingHttpResponse(self.chunks([], count=3))
+        self.assertEqual(b''.join(response), b'x' * READ_BYTES * 3)
+
+
+class BouncingBackend(EmailBackend):
+    """locmem backend that refuses messages to bounce@example.com"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'bounce@example.com' in message.to:
+                raise ConnectionError('mailbox unavailable')
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='core.tests.BouncingBackend',
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_SECONDS=30,
+    EMAIL_OUTBOX_MAX_RETRY_SECONDS=3600,
+)
+class OutboxTests(TestCase):
+    def queue(self, *recipients):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_mass_mail([(f'Hello {address}', 'Body', [address]) for address in recipients])
+
+    def make_due(self):
+        OutboundEmail.objects.filter(status='PENDING').update(next_attempt_at=timezone.now())
+
+    def test_mail_is_written_when_the_transaction_commits(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            queue_mail('Order ready', 'Body', ['pat@example.com', ''])
+            queue_mass_mail([('Receipt', 'Body', ['sam@example.com']), ('Nobody', 'Body', [''])])
+            self.assertFalse(OutboundEmail.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('subject', 'recipients')),
+            [('Order ready', ['pat@example.com']), ('Receipt', ['sam@example.com'])],
+        )
+
+    def test_batch_is_sent_over_one_connection(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.queue('a@example.com', 'b@example.com', 'c@example.com')
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend', EMAIL_FILE_PATH=location
+        ), mock.patch('core.mail.get_connection', wraps=get_connection) as connect:
+            self.assertEqual(send_batch(), (3, 0))
+        self.assertEqual(connect.call_count, 1)
+        # The file backend writes one file per connection
+        [written] = os.listdir(location)
+        with open(os.path.join(location, written)) as file:
+            self.assertEqual(file.read().count('Subject: Hello'), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status='SENT').count(), 3)
+        self.assertEqual(send_batch(), (0, 0))
+
+    def test_failed_message_is_retried_with_backoff(self):
+        self.queue('bounce@example.com', 'pat@example.com')
+        self.assertEqual(send_batch(), (1, 1))
+        self.assertEqual([message.to for message in mail.outbox], [['pat@example.com']])
+
+        email = OutboundEmail.objects.get(status='PENDING')
+        self.assertEqual((email.attempts, email.last_error, email.claim_token), (1, 'mailbox unavailable', ''))
+        delay = email.next_attempt_at - timezone.now()
+        self.assertTrue(timedelta(seconds=25) < delay <= timedelta(seconds=30), delay)
+        self.assertEqual(send_batch(), (0, 0))
+
+        self.make_due()
+        self.assertEqual(send_batch(), (0, 1))
+        email.refresh_from_db()
+        delay = email.next_attempt_at - timezone.now()
+        self.assertTrue(timedelta(seconds=55) < delay <= timedelta(seconds=60), delay)
+
+    def test_message_fails_after_max_attempts(self):
+        self.queue('bounce@example.com')
+        for _ in range(3):
+            self.make_due()
+            self.assertEqual(send_batch(), (0, 1))
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('FAILED', 3))
+        # Never picked up again, even once due
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_batch(), (0, 0))
+
+    def test_claimed_messages_are_not_claimed_again(self):
+        self.queue('a@example.com', 'b@example.com', 'c@example.com')
+        first = claim_batch(2)
+        second = claim_batch(10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual([email.pk for email in second], [
+            email.pk for email in OutboundEmail.objects.exclude(pk__in=[email.pk for email in first])
+        ])
+        self.assertEqual(claim_batch(10), [])
+        self.assertEqual(len({email.claim_token for email in first + second}), 2)
+
+
+class PickupSlotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 09:00, 10:00 and 11:00 slots of 5 items each
+        cls.timing = CanteenTiming.objects.create(
+            opening_time=time(9), closing_time=time(12), slot_minutes=60, slot_capacity=5
+        )
+        cls.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def reserved(self, day=None):
+        return dict(PickupSlot.objects.filter(date=day or self.tomorrow).values_list('start', 'reserved'))
+
+    def test_requested_slot_is_refused_at_capacity(self):
+        self.assertEqual(reserve(self.timing, self.tomorrow, 3, time(10)).start, time(10))
+        with self.assertRaisesMessage(SlotUnavailable, 'The 10:00 pickup slot is full'):
+            reserve(self.timing, self.tomorrow, 3, time(10))
+        self.assertEqual(reserve(self.timing, self.tomorrow, 2, time(10)).reserved, 5)
+        self.assertEqual(self.reserved()[time(10)], 5)
+
+        with self.assertRaisesMessage(SlotUnavailable, '09:30 is not an open pickup slot'):
+            reserve(self.timing, self.tomorrow, 1, time(9, 30))
+        with self.assertRaisesMessage(SlotUnavailable, 'larger than a pickup slot can take'):
+            reserve(self.timing, self.tomorrow, 6)
+
+    def test_without_a_start_the_earliest_slot_with_room_is_taken(self):
+        reserve(self.timing, self.tomorrow, 4, time(9))
+        self.assertEqual(reserve(self.timing, self.tomorrow, 2).start, time(10))
+        self.assertEqual(reserve(self.timing, self.tomorrow, 1).start, time(9))
+        self.assertEqual(reserve(self.timing, self.tomorrow, 3).start, time(10))
+        self.assertEqual(reserve(self.timing, self.tomorrow, 5).start, time(11))
+        with self.assertRaisesMessage(SlotUnavailable, 'No pickup slots left'):
+            reserve(self.timing, self.tomorrow, 1)
+        self.assertEqual(self.reserved(), {time(9): 5, time(10): 5, time(11): 5})
+
+    def test_slots_that_started_cannot_be_reserved(self):
+        today = timezone.localdate()
+        half_past_ten = timezone.make_aware(datetime.combine(today, time(10, 30)))
+        with mock.patch('django.utils.timezone.now', return_value=half_past_ten):
+            self.assertEqual(reserve(self.timing, today, 1).start, time(11))
+            with self.assertRaises(SlotUnavailable):
+                reserve(self.timing, today, 1, time(10))
+        with self.assertRaisesMessage(SlotUnavailable, 'No pickup slots left'):
+            reserve(self.timing, today - timedelta(days=1), 1)
+
+    def test_release_gives_the_load_back(self):
+        nine = reserve(self.timing, self.tomorrow, 4, time(9))
+        ten = reserve(self.timing, self.tomorrow, 5, time(10))
+        release({nine.pk: 3, ten.pk: 5, None: 2, 0: 0})
+        self.assertEqual(self.reserved(), {time(9): 1, time(10): 0})
+        self.assertEqual(reserve(self.timing, self.tomorrow, 5).start, time(10))
+
+    def test_day_availability(self):
+        reserve(self.timing, self.tomorrow, 2, time(9))
+        reserve(self.timing, self.tomorrow, 5, time(11))
+        with self.assertNumQueries(1):
+            slots = day_availability(self.tomorrow, self.timing)
+        self.assertEqual(slots, [
+            {'start': '09:00', 'end': '10:00', 'capacity': 5, 'reserved': 2, 'available': 3},
+            {'start': '10:00', 'end': '11:00', 'capacity': 5, 'reserved': 0, 'available': 5},
+            {'start': '11:00', 'end': '12:00', 'capacity': 5, 'reserved': 5, 'available': 0},
+        ])
+
+        today = timezone.localdate()
+        half_past_ten = timezone.make_aware(datetime.combine(today, time(10, 30)))
+        with mock.patch('django.utils.timezone.now', return_value=half_past_ten):
+            available = [slot['available'] for slot in day_availability(today, self.timing)]
+        self.assertEqual(available, [0, 0, 5])
+
+    def test_availability_endpoint(self):
+        user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        reserve(self.timing, self.tomorrow, 2, time(10))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        # Its query budget: the JWT user, the timing and the day's slots
+        with self.assertNumQueries(3):
+            response = client.get('/api/timings/slots/', {'date': self.tomorrow.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['enabled'], True)
+        self.assertEqual([slot['available'] for slot in response.data['slots']], [5, 3, 5])
+
+        CanteenTiming.objects.update(slot_capacity=0)
+        response = client.get('/api/timings/slots/')
+        self.assertEqual((response.data['enabled'], response.data['slots']), (False, []))
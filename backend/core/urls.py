@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import CanteenTimingView
+from .views import CanteenTimingView, PickupSlotAvailabilityView
 
 urlpatterns = [
     path('', CanteenTimingView.as_view(), name='canteen-timing'),
+    path('slots/', PickupSlotAvailabilityView.as_view(), name='pickup-slots'),
 ]
\ No newline at end of file
@@ -1,6 +1,9 @@
-from rest_framework import generics, permissions
+from django.utils import timezone
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
 from .models import CanteenTiming
-from .serializers import CanteenTimingSerializer
+from .serializers import CanteenTimingSerializer, SlotAvailabilityQuerySerializer
+from .slots import day_availability, slot_timing
 
 class CanteenTimingView(generics.RetrieveUpdateAPIView):
     queryset = CanteenTiming.objects.all()
@@ -9,4 +12,27 @@ class CanteenTimingView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         # Only one timing object in system
-        return CanteenTiming.objects.first()
\ No newline at end of file
+        return CanteenTiming.objects.first()
+
+class PickupSlotAvailabilityView(generics.GenericAPIView):
+    """Pickup slots of a day (?date=YYYY-MM-DD, today by default) with the
+    capacity left in each"""
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
+
+    def get(self, request):
+        params = SlotAvailabilityQuerySerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        day = params.validated_data.get('date') or timezone.localdate()
+
+        timing = slot_timing(CanteenTiming.objects.first())
+        if timing is None:
+            return Response({'date': day, 'enabled': False, 'slots': []})
+        return Response({
+            'date': day,
+            'enabled': True,
+            'slot_minutes': timing.slot_minutes,
+            'capacity_unit': timing.capacity_unit,
+            'slots': day_availability(day, timing),
+        })
\ No newline at end of file
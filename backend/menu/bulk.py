@@ -0,0 +1,137 @@
+# menu/bulk.py
+"""Bulk import/export of the menu catalogue as CSV or JSON.
+
+Imports validate every row before writing anything and then apply all
+creates/updates with ``bulk_create``/``bulk_update`` in one transaction.
+Exports stream rows straight from the database cursor (served with
+``core.streaming.SyncStreamingHttpResponse`` so they stream under ASGI too).
+"""
+import csv
+import io
+import json
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import MenuItem
+
+EXPORT_FIELDS = ['id', 'name', 'description', 'price', 'available', 'category']
+IMPORT_FIELDS = ['name', 'description', 'price', 'available', 'category']
+BATCH_SIZE = 500
+
+
+class MenuItemImportSerializer(serializers.ModelSerializer):
+    """One imported row, ``id`` selects an existing item to update"""
+    id = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = MenuItem
+        fields = ['id'] + IMPORT_FIELDS
+
+
+def read_rows(data, file_format):
+    """Parse CSV text or JSON (a list of objects) into a list of dicts"""
+    if file_format == 'csv':
+        if isinstance(data, bytes):
+            data = data.decode('utf-8-sig')
+        return list(csv.DictReader(io.StringIO(data)))
+    rows = json.loads(data) if isinstance(data, (str, bytes)) else data
+    if isinstance(rows, dict):
+        rows = rows.get('items', [])
+    if not isinstance(rows, list):
+        raise ValueError("Expected a list of menu items.")
+    return rows
+
+
+def _clean(row):
+    # Blank CSV cells mean "not provided"
+    return {key: value for key, value in row.items() if key and value not in ('', None)}
+
+
+def import_rows(rows):
+    """Validate and write ``rows``, returns ``(created, updated, errors)``.
+
+    Nothing is written if any row fails validation; ``errors`` is a list of
+    ``{'row': <1-based row number>, 'errors': {...}}``.
+    """
+    errors = []
+    valid = []
+    # Field construction dominates DRF validation cost, so build the
+    # serializers once and run each row through them
+    create_serializer = MenuItemImportSerializer()
+    update_serializer = MenuItemImportSerializer(partial=True)
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': {'non_field_errors': ["Expected an object."]}})
+            continue
+        row = _clean(row)
+        # Updates may send only the fields that change
+        serializer = update_serializer if row.get('id') else create_serializer
+        try:
+            valid.append((number, serializer.run_validation(row)))
+        except serializers.ValidationError as e:
+            errors.append({'row': number, 'errors': e.detail})
+
+    ids = [data['id'] for _, data in valid if data.get('id')]
+    existing = MenuItem.objects.in_bulk(ids) if ids else {}
+
+    to_create = []
+    to_update = []
+    seen = set()
+    for number, data in valid:
+        pk = data.pop('id', None)
+        if not pk:
+            to_create.append(MenuItem(**data))
+            continue
+        item = existing.get(pk)
+        if item is None:
+            errors.append({'row': number, 'errors': {'id': [f"Menu item {pk} does not exist."]}})
+            continue
+        if pk in seen:
+            errors.append({'row': number, 'errors': {'id': [f"Menu item {pk} appears more than once."]}})
+            continue
+        seen.add(pk)
+        for field, value in data.items():
+            setattr(item, field, value)
+        to_update.append(item)
+
+    if errors:
+        errors.sort(key=lambda error: error['row'])
+        return 0, 0, errors
+
+    with transaction.atomic():
+        MenuItem.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        if to_update:
+            MenuItem.objects.bulk_update(to_update, IMPORT_FIELDS, batch_size=BATCH_SIZE)
+    return len(to_create), len(to_update), []
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset=None, chunk_size=2000):
+    queryset = MenuItem.objects.all() if queryset is None else queryset
+    return queryset.order_by('pk').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(rows):
+    """Yield a JSON array one item at a time"""
+    yield '['
+    separator = ''
+    for row in rows:
+        item = dict(zip(EXPORT_FIELDS, row))
+        item['price'] = str(item['price'])
+        yield separator + json.dumps(item)
+        separator = ','
+    yield ']'
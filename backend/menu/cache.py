@@ -0,0 +1,188 @@
+# menu/cache.py
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+MENU_VERSION_KEY = 'menu:version'
+# Popularity rankings (featured items) move with every order, so they have
+# their own version, bumped at most every POPULARITY_REFRESH_SECONDS
+FEATURED_VERSION_KEY = 'menu:featured:version'
+FEATURED_STALE_KEY = 'menu:featured:stale'
+FEATURED_REFRESH_LOCK_KEY = 'menu:featured:refreshed'
+MENU_CACHE_TIMEOUT = getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        # Another worker may have initialised it first, keep theirs
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump_version(key):
+    old_version = cache.get(key) or 0
+    version = max(int(time.time() * 1000), old_version + 1)
+    cache.set(key, version, None)
+    return version
+
+
+def get_menu_version():
+    """Current menu version (milliseconds since epoch of the last change)"""
+    return _get_version(MENU_VERSION_KEY)
+
+
+def bump_menu_version():
+    """Invalidate every cached menu response by moving to a new version"""
+    return _bump_version(MENU_VERSION_KEY)
+
+
+def bump_menu_version_on_commit():
+    """Bump the version once the current transaction commits.
+
+    Bumping before commit would let a concurrent reader cache the old rows
+    under the new version.
+    """
+    transaction.on_commit(bump_menu_version)
+
+
+def get_featured_version():
+    """Current version of the popularity rankings
+
+    Moves on when sales were recorded since the last move, but at most once
+    per ``POPULARITY_REFRESH_SECONDS`` so a lunch rush does not rebuild the
+    featured responses on every order.
+    """
+    refresh = getattr(settings, 'POPULARITY_REFRESH_SECONDS', 60)
+    if cache.get(FEATURED_STALE_KEY) and cache.add(FEATURED_REFRESH_LOCK_KEY, True, refresh):
+        cache.delete(FEATURED_STALE_KEY)
+        return _bump_version(FEATURED_VERSION_KEY)
+    return _get_version(FEATURED_VERSION_KEY)
+
+
+def mark_featured_stale():
+    """Note that rankings changed; ``get_featured_version`` moves on soon"""
+    cache.set(FEATURED_STALE_KEY, True, None)
+
+
+def bump_featured_version():
+    """Move the rankings to a new version right away"""
+    cache.delete(FEATURED_STALE_KEY)
+    return _bump_version(FEATURED_VERSION_KEY)
+
+
+def current_version(featured=False):
+    """``(menu version, cache version, last modified)``
+
+    The cache version (used in keys and ETags) also covers the popularity
+    rankings when ``featured``.
+    """
+    menu_version = get_menu_version()
+    if not featured:
+        return menu_version, str(menu_version), menu_version // 1000
+    featured_version = get_featured_version()
+    return menu_version, f'{menu_version}.{featured_version}', max(menu_version, featured_version) // 1000
+
+
+def menu_etag(version):
+    return quote_etag(f'menu-{version}')
+
+
+def menu_cache_key(prefix, version, request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'menu:{prefix}:{version}:{path}'
+
+
+def cached_menu_response(request, view, prefix='response', featured=False):
+    """Serve ``view()`` from the menu cache with ETag/Last-Modified headers.
+
+    ``view`` is only called on a cache miss. Clients sending a matching
+    ``If-None-Match``/``If-Modified-Since`` get a 304 without touching
+    the database. ``featured`` responses also depend on the popularity
+    rankings.
+    """
+    _, version, last_modified = current_version(featured)
+    etag = menu_etag(version)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    key = menu_cache_key(prefix, version, request)
+    data = cache.get(key)
+    if data is None:
+        response = view()
+        if response.status_code != 200:
+            return response
+        data = response.data
+        cache.set(key, data, MENU_CACHE_TIMEOUT)
+
+    response = Response(data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def cached_menu_bytes(request, name, build, featured=False):
+    """Serve a JSON document pre-rendered to bytes once per menu version.
+
+    ``build(menu_version)`` returns the data and only runs the first time a
+    version is requested; later hits are a cache lookup, and a matching
+    ``If-None-Match`` is answered with a 304 before even that. ``featured``
+    documents also depend on the popularity rankings.
+    """
+    menu_version, version, last_modified = current_version(featured)
+    etag = menu_etag(version)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    key = f'menu:{name}:{version}'
+    content = cache.get(key)
+    if content is None:
+        content = JSONRenderer().render(build(menu_version))
+        cache.set(key, content, MENU_CACHE_TIMEOUT)
+
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def menu_cached(view_func=None, *, featured=False):
+    """Decorator for function based menu views (place below ``@api_view``)"""
+    if view_func is None:
+        return lambda view_func: menu_cached(view_func, featured=featured)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        return cached_menu_response(
+            request,
+            lambda: view_func(request, *args, **kwargs),
+            prefix=view_func.__name__,
+            featured=featured,
+        )
+    return wrapper
+
+
+class MenuCacheMixin:
+    """Serve GET requests of a generic view through the menu cache"""
+
+    def get(self, request, *args, **kwargs):
+        return cached_menu_response(
+            request,
+            lambda: super(MenuCacheMixin, self).get(request, *args, **kwargs),
+            prefix=self.__class__.__name__,
+        )
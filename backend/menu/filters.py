@@ -0,0 +1,29 @@
+# menu/filters.py
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .search import fts_available, filter_by_search
+
+
+class MenuSearchFilter(filters.SearchFilter):
+    """SearchFilter that uses the full-text index when it is available"""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip() or not fts_available():
+            return super().filter_queryset(request, queryset, view)
+        return filter_by_search(queryset, query)
+
+
+class MenuOrderingFilter(filters.OrderingFilter):
+    """OrderingFilter that keeps the relevance order of a full-text search
+
+    The view's default ``ordering`` only applies when there is no search
+    term; an explicit ``?ordering=`` still wins.
+    """
+
+    def get_default_ordering(self, view):
+        request = view.request
+        if fts_available() and request.query_params.get(api_settings.SEARCH_PARAM, '').strip():
+            return None
+        return super().get_default_ordering(view)
@@ -0,0 +1,161 @@
+# menu/images.py
+"""Resized/WebP derivatives of MenuItem images.
+
+Derivatives are generated off the request thread after the upload commits
+and stored under ``menu_images/variants/<item id>/`` with a content hash in
+the filename, so browsers can cache them forever. The generated paths are
+recorded on ``MenuItem.image_variants`` together with the source image
+they were made from.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name: (size, format, crop to exact size)
+IMAGE_VARIANTS = {
+    'thumbnail': ((240, 240), 'JPEG', True),
+    'thumbnail_webp': ((240, 240), 'WEBP', True),
+    'medium_webp': ((800, 800), 'WEBP', False),
+}
+VARIANT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+VARIANT_QUALITY = 80
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='menu-images')
+    return _executor
+
+
+def needs_variants(item):
+    return bool(item.image) and (item.image_variants or {}).get('source') != item.image.name
+
+
+def variant_paths(variants):
+    """Storage paths of the derivative files in an ``image_variants`` dict"""
+    return [path for name, path in (variants or {}).items() if name != 'source']
+
+
+def render_variant(image, size, image_format, crop):
+    if crop:
+        resized = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    output = BytesIO()
+    resized.save(output, image_format, quality=VARIANT_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def build_variants(item):
+    """Write every derivative of ``item.image`` and return the new variants dict"""
+    with item.image.open('rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    variants = {'source': item.image.name}
+    for name, (size, image_format, crop) in IMAGE_VARIANTS.items():
+        extension = VARIANT_EXTENSIONS[image_format]
+        path = f'{variant_dir(item.pk)}/{digest}_{name}.{extension}'
+        if not default_storage.exists(path):
+            path = default_storage.save(path, ContentFile(render_variant(image, size, image_format, crop)))
+        variants[name] = path
+    return variants
+
+
+def generate_variants(item_id):
+    """Build derivatives for one MenuItem if its image changed since last run"""
+    from .models import MenuItem
+
+    try:
+        item = MenuItem.objects.get(pk=item_id)
+    except MenuItem.DoesNotExist:
+        return None
+    if not needs_variants(item):
+        return item.image_variants
+
+    try:
+        variants = build_variants(item)
+    except (OSError, ValueError):
+        logger.exception("Could not build image variants for menu item %s", item_id)
+        return None
+
+    # Only record them if the image was not replaced while we were working
+    updated = MenuItem.objects.filter(pk=item.pk, image=item.image.name).update(image_variants=variants)
+    if not updated:
+        delete_variant_files(variants)
+        return None
+    return variants
+
+
+def _run_in_worker(item_id):
+    try:
+        generate_variants(item_id)
+    finally:
+        connection.close()
+
+
+def schedule_variants(item):
+    """Queue derivative generation for ``item`` once the transaction commits"""
+    item_id = item.pk
+    if getattr(settings, 'MENU_IMAGE_VARIANTS_ASYNC', True):
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_worker, item_id))
+    else:
+        transaction.on_commit(lambda: generate_variants(item_id))
+
+
+def delete_variant_files(variants):
+    delete_files(variant_paths(variants))
+
+
+def variant_dir(item_id):
+    return f'menu_images/variants/{item_id}'
+
+
+def delete_files(names, variants_of=None):
+    """Delete storage files, plus every variant of item ``variants_of``"""
+    names = list(names)
+    if variants_of is not None:
+        directory = variant_dir(variants_of)
+        try:
+            _, files = default_storage.listdir(directory)
+        except FileNotFoundError:
+            files = []
+        names += [f'{directory}/{name}' for name in files]
+    for name in names:
+        if name and default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def delete_files_on_commit(names, variants_of=None):
+    """Delete files in the background once the transaction commits.
+
+    A rolled back save or delete therefore never removes a file that is
+    still referenced. Runs on the same worker as variant generation, so a
+    clean-up queued before a rebuild always finishes first.
+    """
+    names = [name for name in names if name]
+    if not names and variants_of is None:
+        return
+    if getattr(settings, 'MENU_IMAGE_VARIANTS_ASYNC', True):
+        transaction.on_commit(lambda: _get_executor().submit(delete_files, names, variants_of))
+    else:
+        transaction.on_commit(lambda: delete_files(names, variants_of))
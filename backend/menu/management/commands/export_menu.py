@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from menu.bulk import export_rows, stream_csv, stream_json
+
+
+class Command(BaseCommand):
+    help = "Export the menu catalogue as CSV or JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Output file, defaults to stdout")
+        parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+
+    def handle(self, *args, **options):
+        stream = stream_json if options['format'] == 'json' else stream_csv
+        output = open(options['path'], 'w', newline='') if options['path'] else sys.stdout
+        try:
+            for chunk in stream(export_rows()):
+                output.write(chunk)
+        finally:
+            if options['path']:
+                output.close()
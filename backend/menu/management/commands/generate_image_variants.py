@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from menu.images import delete_variant_files, generate_variants
+from menu.models import MenuItem
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail/WebP variants for menu item images that are missing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate variants for every image")
+
+    def handle(self, *args, **options):
+        items = MenuItem.objects.exclude(image='').exclude(image__isnull=True)
+        generated = 0
+        for item in items.only('id', 'image', 'image_variants').iterator():
+            if options['force'] and item.image_variants:
+                delete_variant_files(item.image_variants)
+                MenuItem.objects.filter(pk=item.pk).update(image_variants={})
+            if generate_variants(item.pk):
+                generated += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed variants for {generated} menu items"))
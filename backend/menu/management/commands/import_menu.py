@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.bulk import import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import menu items from a CSV or JSON file in a single transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], help="Defaults to the file extension")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or ('json' if path.suffix.lower() == '.json' else 'csv')
+        try:
+            rows = read_rows(path.read_bytes(), file_format)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        created, updated, errors = import_rows(rows)
+        if errors:
+            for error in errors:
+                self.stderr.write(f"Row {error['row']}: {error['errors']}")
+            raise CommandError(f"{len(errors)} invalid rows, nothing was imported.")
+        self.stdout.write(self.style.SUCCESS(f"Created {created} and updated {updated} menu items"))
@@ -0,0 +1,24 @@
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+
+from menu.popularity import rebuild_popularity
+from orders.models import ArchivedOrderItem, OrderItem
+
+
+class Command(BaseCommand):
+    help = "Rebuild menu item popularity counters from the order history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        rows = chain.from_iterable(
+            model.objects.order_by().values_list(
+                'menu_item_id', 'order__created_at', 'quantity'
+            ).iterator(chunk_size=chunk_size)
+            for model in (OrderItem, ArchivedOrderItem)
+        )
+        count = rebuild_popularity(rows, chunk_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt popularity from {count} order items"))
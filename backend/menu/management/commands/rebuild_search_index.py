@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for menu items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError("Full-text search index is not available on this database.")
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} menu items"))
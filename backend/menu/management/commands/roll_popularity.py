@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from menu.popularity import roll_windows
+
+
+class Command(BaseCommand):
+    help = "Recompute the rolling 1/7/30 day popularity counts (run daily, just after midnight)"
+
+    def handle(self, *args, **options):
+        roll_windows()
+        self.stdout.write(self.style.SUCCESS("Rolled popularity windows"))
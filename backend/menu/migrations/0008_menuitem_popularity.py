@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0007_menuitem_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuItemPopularity',
+            fields=[
+                ('menu_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='menu.menuitem')),
+                ('count_1d', models.PositiveIntegerField(default=0)),
+                ('count_7d', models.PositiveIntegerField(default=0)),
+                ('count_30d', models.PositiveIntegerField(default=0)),
+                ('decay_score', models.FloatField(default=0)),
+                ('last_ordered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-count_1d'], name='menu_menuit_count_1_08ee02_idx'), models.Index(fields=['-count_7d'], name='menu_menuit_count_7_c7d930_idx'), models.Index(fields=['-count_30d'], name='menu_menuit_count_3_d05d6e_idx'), models.Index(fields=['-decay_score'], name='menu_menuit_decay_s_4bef1e_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MenuItemDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='menu.menuitem')),
+            ],
+            options={
+                'unique_together': {('menu_item', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0008_menuitem_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='prep_minutes',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -1,8 +1,53 @@
+from decimal import Decimal
+
 from django.db import models
-import os
-from django.db.models.signals import post_delete, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from core.events import publish_on_commit
+
+from .cache import bump_menu_version_on_commit
+from . import images, search
+
+SEARCH_FIELDS = ('name', 'description')
+# Changes to these are pushed to clients on the menu event stream
+LIVE_FIELDS = ('available', 'price')
+MENU_EVENTS_CHANNEL = 'menu'
+
+def live_fields(item):
+    return {'id': item.pk, 'available': item.available, 'price': f'{Decimal(str(item.price)):.2f}'}
+
+def publish_item_changes(items):
+    """Queue one 'menu.items' event for the given id/available/price rows"""
+    if items:
+        publish_on_commit(MENU_EVENTS_CHANNEL, {'type': 'menu.items', 'items': items})
+
+class MenuItemQuerySet(models.QuerySet):
+    """Bulk writes skip model signals, so they bump the menu version here"""
+
+    def update(self, **kwargs):
+        reindex = search.fts_available() and any(field in kwargs for field in SEARCH_FIELDS)
+        live = any(field in kwargs for field in LIVE_FIELDS)
+        ids = list(self.values_list('pk', flat=True)) if reindex or live else None
+        rows = super().update(**kwargs)
+        if rows:
+            bump_menu_version_on_commit()
+        if ids and reindex:
+            search.index_items(self.model._base_manager.filter(pk__in=ids).only('id', *SEARCH_FIELDS))
+        if ids and live:
+            publish_item_changes(list(
+                self.model._base_manager.filter(pk__in=ids).values('id', *LIVE_FIELDS)
+            ))
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        if created:
+            bump_menu_version_on_commit()
+            search.index_items([obj for obj in created if obj.pk])
+            publish_item_changes([live_fields(obj) for obj in created if obj.pk])
+        return created
+
 class MenuItem(models.Model):
     CATEGORY_CHOICES = [
         ('juices', 'Juices'),
@@ -15,25 +60,136 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
     available = models.BooleanField(default=True)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='snacks')
+    # Kitchen time per unit, counted against pickup slot capacity when the
+    # canteen measures it in prep minutes
+    prep_minutes = models.PositiveSmallIntegerField(default=1)
     image = models.ImageField(upload_to='menu_images/', null=True, blank=True)
+    # Derivative paths written by menu.images, plus the 'source' they came from
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = MenuItemQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so saves can tell what changed without
+        # re-reading the row
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: field.get_prep_value(field.value_from_object(self))
+            for field in self._meta.concrete_fields
+        }
+
+    def get_loaded_value(self, field_name, default=None):
+        return getattr(self, '_loaded_values', {}).get(field_name, default)
+
+    def is_loaded(self, field_name):
+        return field_name in getattr(self, '_loaded_values', {})
+
+    def get_dirty_fields(self):
+        """Fields whose value differs from when the row was loaded or saved.
+
+        Fields that were never loaded (new instances, deferred fields) are
+        reported as dirty.
+        """
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if not self.is_loaded(field.attname):
+                dirty.append(field.name)
+                continue
+            current = field.get_prep_value(field.value_from_object(self))
+            if current != self._loaded_values[field.attname]:
+                dirty.append(field.name)
+        return dirty
+
+@receiver(post_save, sender=MenuItem)
+def update_search_index(sender, instance, created, **kwargs):
+    dirty = instance.get_dirty_fields()
+    if created or any(field in dirty for field in SEARCH_FIELDS):
+        search.index_items([instance])
+
+@receiver(post_save, sender=MenuItem)
+def publish_live_changes(sender, instance, created, **kwargs):
+    dirty = instance.get_dirty_fields()
+    if created or any(field in dirty for field in LIVE_FIELDS):
+        publish_item_changes([live_fields(instance)])
+
+@receiver(post_save, sender=MenuItem)
+def delete_replaced_image(sender, instance, **kwargs):
+    # Connected before schedule_image_variants so old variants are cleared
+    # before new ones are built
+    replaced = getattr(instance, '_replaced_image', None)
+    if replaced is not None:
+        del instance._replaced_image
+        images.delete_files_on_commit([replaced], variants_of=instance.pk)
+
+@receiver(post_save, sender=MenuItem)
+def schedule_image_variants(sender, instance, **kwargs):
+    if images.needs_variants(instance):
+        images.schedule_variants(instance)
+
 @receiver(post_delete, sender=MenuItem)
 def delete_image_file_on_delete(sender, instance, **kwargs):
-    if instance.image and os.path.isfile(instance.image.path):
-        os.remove(instance.image.path)
+    bump_menu_version_on_commit()
+    publish_item_changes([{'id': instance.pk, 'available': False, 'price': instance.price, 'deleted': True}])
+    search.unindex_items([instance.pk])
+    images.delete_files_on_commit([instance.image.name], variants_of=instance.pk)
 
 @receiver(pre_save, sender=MenuItem)
 def delete_old_image_on_update(sender, instance, **kwargs):
+    bump_menu_version_on_commit()
+    instance.__dict__.pop('_replaced_image', None)
     if not instance.pk:
         return
-    try:
-        old_instance = MenuItem.objects.get(pk=instance.pk)
-    except MenuItem.DoesNotExist:
-        return
-    old_image = old_instance.image
-    new_image = instance.image
-    if old_image and old_image != new_image and os.path.isfile(old_image.path):
-        os.remove(old_image.path)
\ No newline at end of file
+    if instance.is_loaded('image'):
+        old_image = instance.get_loaded_value('image') or ''
+    else:
+        # Built by hand or loaded with deferred fields, fall back to a query
+        old_image = MenuItem.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+        if old_image is None:
+            return
+    if old_image != (instance.image.name or ''):
+        # The files are removed by delete_replaced_image once the row is saved
+        instance._replaced_image = old_image
+        instance.image_variants = {}
+
+class MenuItemPopularity(models.Model):
+    """Rolling order counts per menu item, maintained by menu.popularity"""
+    menu_item = models.OneToOneField(MenuItem, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    count_1d = models.PositiveIntegerField(default=0)
+    count_7d = models.PositiveIntegerField(default=0)
+    count_30d = models.PositiveIntegerField(default=0)
+    # Sum of quantity * 2 ** (age / half-life) relative to a fixed epoch, so
+    # ordering by it ranks by time-decayed popularity without rewriting rows
+    decay_score = models.FloatField(default=0)
+    last_ordered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-count_1d']),
+            models.Index(fields=['-count_7d']),
+            models.Index(fields=['-count_30d']),
+            models.Index(fields=['-decay_score']),
+        ]
+
+    def __str__(self):
+        return f"{self.menu_item.name} popularity"
+
+class MenuItemDailySales(models.Model):
+    """Quantity ordered per menu item per day, the source of the rolling counts"""
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('menu_item', 'date')
+
+    def __str__(self):
+        return f"{self.menu_item.name} x{self.quantity} on {self.date}"
@@ -0,0 +1,174 @@
+# menu/popularity.py
+"""Incrementally maintained popularity counters for menu items.
+
+Every placed order adds its quantities to a per-day bucket
+(``MenuItemDailySales``) and to the rolling counters on
+``MenuItemPopularity``. Once a day the rolling 1/7/30 day counts are
+re-derived from the buckets by ``manage.py roll_popularity`` so old sales
+drop out of the windows. Both mark the featured rankings as changed for
+the menu cache (``menu.cache``).
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, FloatField, Q, Sum, Value, When
+from django.utils import timezone
+
+from .cache import bump_featured_version, mark_featured_stale
+from .models import MenuItem, MenuItemDailySales, MenuItemPopularity
+
+POPULARITY_WINDOWS = {'1d': 'count_1d', '7d': 'count_7d', '30d': 'count_30d'}
+POPULARITY_HALF_LIFE_DAYS = getattr(settings, 'POPULARITY_HALF_LIFE_DAYS', 7)
+# Scores grow by 2x per half-life after the epoch; at a 7 day half-life a
+# float lasts ~19 years, move the epoch and run rebuild_popularity before then
+DECAY_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def decay_weight(when):
+    """Weight of a sale at ``when``, doubling every half-life after the epoch"""
+    age_days = (when - DECAY_EPOCH).total_seconds() / 86400
+    return 2 ** (age_days / POPULARITY_HALF_LIFE_DAYS)
+
+
+def _case(quantities, output_field, key='pk'):
+    return Case(
+        *[When(**{key: pk}, then=Value(quantity)) for pk, quantity in quantities.items()],
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
+def record_sales(quantities, when=None):
+    """Add ``{menu_item_id: quantity}`` to the counters in three queries"""
+    quantities = {pk: qty for pk, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    when = when or timezone.now()
+    day = timezone.localdate(when)
+    weight = decay_weight(when)
+
+    with transaction.atomic():
+        MenuItemPopularity.objects.bulk_create(
+            [MenuItemPopularity(menu_item_id=pk) for pk in quantities],
+            ignore_conflicts=True,
+        )
+        MenuItemPopularity.objects.filter(pk__in=quantities).update(
+            count_1d=F('count_1d') + _case(quantities, IntegerField()),
+            count_7d=F('count_7d') + _case(quantities, IntegerField()),
+            count_30d=F('count_30d') + _case(quantities, IntegerField()),
+            decay_score=F('decay_score') + _case(
+                {pk: qty * weight for pk, qty in quantities.items()}, FloatField()
+            ),
+            last_ordered_at=when,
+        )
+
+        MenuItemDailySales.objects.bulk_create(
+            [MenuItemDailySales(menu_item_id=pk, date=day) for pk in quantities],
+            ignore_conflicts=True,
+        )
+        MenuItemDailySales.objects.filter(date=day, menu_item_id__in=quantities).update(
+            quantity=F('quantity') + _case(quantities, IntegerField(), key='menu_item_id'),
+        )
+        transaction.on_commit(mark_featured_stale)
+
+
+def record_batched_sales(entries):
+    """``record_sales`` for several ``(quantities, when)`` entries, once per day"""
+    by_day = {}
+    for quantities, when in entries:
+        day = timezone.localdate(when)
+        merged, latest = by_day.get(day, ({}, when))
+        for pk, qty in quantities.items():
+            merged[pk] = merged.get(pk, 0) + qty
+        by_day[day] = (merged, max(latest, when))
+    for merged, when in by_day.values():
+        record_sales(merged, when=when)
+
+
+def roll_windows(today=None):
+    """Recompute the rolling counts from the daily buckets and prune old ones"""
+    today = today or timezone.localdate()
+    since_30 = today - timedelta(days=29)
+    since_7 = today - timedelta(days=6)
+
+    with transaction.atomic():
+        MenuItemDailySales.objects.filter(date__lt=since_30).delete()
+        totals = {
+            row['menu_item_id']: row
+            for row in MenuItemDailySales.objects.values('menu_item_id').annotate(
+                day=Sum('quantity', filter=Q(date=today)),
+                week=Sum('quantity', filter=Q(date__gte=since_7)),
+                month=Sum('quantity'),
+            )
+        }
+        rows = list(MenuItemPopularity.objects.filter(
+            Q(pk__in=totals) | Q(count_30d__gt=0)
+        ).only('pk', 'count_1d', 'count_7d', 'count_30d'))
+        for row in rows:
+            total = totals.get(row.pk, {})
+            row.count_1d = total.get('day') or 0
+            row.count_7d = total.get('week') or 0
+            row.count_30d = total.get('month') or 0
+        MenuItemPopularity.objects.bulk_update(rows, ['count_1d', 'count_7d', 'count_30d'], batch_size=500)
+        transaction.on_commit(bump_featured_version)
+
+
+def top_items(limit, window='7d', decay=False):
+    """The ``limit`` most popular available items, padded with other items"""
+    ordering = 'decay_score' if decay else POPULARITY_WINDOWS.get(window, 'count_7d')
+    popular = list(
+        MenuItem.objects.filter(available=True, **{f'popularity__{ordering}__gt': 0})
+        .order_by(f'-popularity__{ordering}', 'name')[:limit]
+    )
+    if len(popular) < limit:
+        popular += list(
+            MenuItem.objects.filter(available=True)
+            .exclude(pk__in=[item.pk for item in popular])[:limit - len(popular)]
+        )
+    return popular
+
+
+def rebuild_popularity(order_items, chunk_size=2000, today=None):
+    """Recompute every counter from ``(menu_item_id, created_at, quantity)`` rows.
+
+    ``order_items`` is consumed lazily so a large history can be streamed
+    with ``QuerySet.iterator``. Returns the number of rows read.
+    """
+    today = today or timezone.localdate()
+    since_30 = today - timedelta(days=29)
+    daily = defaultdict(int)
+    decay = defaultdict(float)
+    last_ordered = {}
+    count = 0
+
+    for menu_item_id, created_at, quantity in order_items:
+        count += 1
+        day = timezone.localdate(created_at)
+        if day >= since_30:
+            daily[(menu_item_id, day)] += quantity
+        decay[menu_item_id] += quantity * decay_weight(created_at)
+        if menu_item_id not in last_ordered or created_at > last_ordered[menu_item_id]:
+            last_ordered[menu_item_id] = created_at
+
+    existing = set(MenuItem.objects.filter(pk__in=decay.keys()).values_list('pk', flat=True))
+    with transaction.atomic():
+        MenuItemDailySales.objects.all().delete()
+        MenuItemPopularity.objects.all().delete()
+        MenuItemDailySales.objects.bulk_create(
+            [
+                MenuItemDailySales(menu_item_id=pk, date=day, quantity=quantity)
+                for (pk, day), quantity in daily.items() if pk in existing
+            ],
+            batch_size=chunk_size,
+        )
+        MenuItemPopularity.objects.bulk_create(
+            [
+                MenuItemPopularity(menu_item_id=pk, decay_score=score, last_ordered_at=last_ordered[pk])
+                for pk, score in decay.items() if pk in existing
+            ],
+            batch_size=chunk_size,
+        )
+        roll_windows(today)
+    return count
@@ -0,0 +1,98 @@
+# menu/search.py
+"""SQLite FTS5 full-text index over MenuItem name/description.
+
+The index lives in a separate virtual table keyed by the MenuItem id and is
+kept in sync by the signals in ``menu.models`` and the bulk helpers on
+``MenuItemQuerySet``. On databases without FTS5 the callers fall back to
+``icontains`` filtering.
+"""
+import re
+
+from django.db import connection, transaction
+
+FTS_TABLE = 'menu_menuitem_fts'
+
+_fts_available = None
+
+
+def fts_available():
+    """True when the FTS5 table exists on the default database"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available
+
+
+def build_match_query(query):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def filter_by_search(queryset, query):
+    """Restrict ``queryset`` to rows matching ``query``, best match first
+
+    The index table is joined in so SQLite reads the matches from it and
+    looks the items up by id; the bm25 ``rank`` comes along as
+    ``search_rank`` (lower is better). A correlated subquery per item would
+    re-run the MATCH, bm25 statistics included, for every row.
+    """
+    match = build_match_query(query)
+    if not match:
+        return queryset.none()
+    return queryset.extra(
+        select={'search_rank': f'"{FTS_TABLE}"."rank"'},
+        tables=[FTS_TABLE],
+        where=[f'"{FTS_TABLE}"."rowid" = "menu_menuitem"."id"', f'"{FTS_TABLE}" MATCH %s'],
+        params=[match],
+    ).order_by('search_rank', 'name')
+
+
+def index_items(items):
+    """Add or refresh index rows for the given MenuItem instances"""
+    if not fts_available():
+        return
+    rows = [(item.pk, item.name, item.description) for item in items]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+            rows,
+        )
+
+
+def unindex_items(ids):
+    """Remove index rows for the given MenuItem ids"""
+    if not fts_available():
+        return
+    ids = list(ids)
+    if not ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in ids])
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild the whole index from the MenuItem table, returns rows indexed"""
+    from .models import MenuItem
+
+    if not fts_available():
+        return 0
+    count = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        batch = []
+        for item in MenuItem.objects.only('id', 'name', 'description').iterator(chunk_size=batch_size):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                index_items(batch)
+                count += len(batch)
+                batch = []
+        index_items(batch)
+        count += len(batch)
+    return count
@@ -1,7 +1,10 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import MenuItem
 
 class MenuItemSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = MenuItem
         fields = '__all__'
@@ -9,4 +12,22 @@ class MenuItemSerializer(serializers.ModelSerializer):
     def validate_image(self, value):
         if not value:
             raise serializers.ValidationError("Image is required.")
-        return value
\ No newline at end of file
+        return value
+
+    def get_image_variants(self, obj):
+        """URLs of the resized/WebP images, empty until they are generated"""
+        variants = obj.image_variants or {}
+        if not obj.image or variants.get('source') != obj.image.name:
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for name, path in variants.items():
+            if name == 'source':
+                continue
+            url = default_storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
+class BulkAvailabilitySerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    available = serializers.BooleanField()
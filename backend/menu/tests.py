@@ -1,3 +1,408 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.streaming import SyncStreamingHttpResponse
+
+from .cache import FEATURED_REFRESH_LOCK_KEY
+from .images import IMAGE_VARIANTS, variant_dir
+from .models import MenuItem
+from .popularity import record_batched_sales, roll_windows
+from .search import filter_by_search, fts_available
+from .serializers import MenuItemSerializer
+
+
+class MenuCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.00', category='beverages')
+        MenuItem.objects.create(name='Samosa', price='1.50')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url='/api/menu/customer/', **headers):
+        return self.client.get(url, headers=headers)
+
+    def assertChangesVersion(self, change):
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.get()
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 200)
+        return response
+
+    def test_responses_carry_validators_and_hit_the_cache(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+        with self.assertNumQueries(0):
+            cached = self.get()
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_matching_etag_is_not_modified_without_queries(self):
+        for url in ('/api/menu/customer/', '/api/menu/customer/categories/', '/api/menu/customer/bootstrap/'):
+            etag = self.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.get(url, **{'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(self.get(url, **{'If-None-Match': '"stale"'}).status_code, 200)
+
+    def test_save_invalidates(self):
+        def rename():
+            self.tea.name = 'Masala tea'
+            self.tea.save()
+        names = [item['name'] for item in self.assertChangesVersion(rename).json()]
+        self.assertIn('Masala tea', names)
+
+    def test_queryset_update_invalidates(self):
+        response = self.assertChangesVersion(lambda: MenuItem.objects.filter(pk=self.tea.pk).update(available=False))
+        self.assertNotIn('Tea', [item['name'] for item in response.json()])
+
+    def test_bulk_create_invalidates(self):
+        response = self.assertChangesVersion(lambda: MenuItem.objects.bulk_create([MenuItem(name='Vada', price='1.00')]))
+        self.assertIn('Vada', [item['name'] for item in response.json()])
+
+    def test_delete_invalidates(self):
+        response = self.assertChangesVersion(self.tea.delete)
+        self.assertNotIn('Tea', [item['name'] for item in response.json()])
+
+
+class MenuBootstrapTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root, MENU_IMAGE_VARIANTS_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tea = MenuItem.objects.create(name='Tea', price='1.00', image=png_upload('tea.png'))
+        self.client = APIClient()
+
+    def test_image_urls_match_the_other_customer_endpoints(self):
+        item = self.client.get('/api/menu/customer/bootstrap/').json()['menu'][0]
+        detail = self.client.get(f'/api/menu/customer/{self.tea.pk}/').json()
+        self.assertTrue(item['image'].startswith('http://testserver/'))
+        self.assertEqual(item['image'], detail['image'])
+        self.assertEqual(item['image_variants'], detail['image_variants'])
+        for url in ('/api/menu/customer/featured/', '/api/menu/customer/search/'):
+            listed = self.client.get(url).json()
+            listed = listed['results'] if 'results' in listed else listed
+            self.assertEqual((listed[0]['image'], listed[0]['image_variants']), (item['image'], item['image_variants']))
+
+    def test_revalidation_until_the_menu_changes(self):
+        response = self.client.get('/api/menu/customer/bootstrap/')
+        etag = response['ETag']
+        self.assertEqual(response.json()['version'], int(etag.strip('"').split('-')[1].split('.')[0]))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/menu/customer/bootstrap/', headers={'If-None-Match': etag}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.filter(pk=self.tea.pk).update(price='1.20')
+        response = self.client.get('/api/menu/customer/bootstrap/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['menu'][0]['price'], '1.20')
+
+
+class FeaturedCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.00')
+        cls.cake = MenuItem.objects.create(name='Cake', price='3.00')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def featured(self, url='/api/menu/customer/featured/', **headers):
+        return self.client.get(url, headers=headers)
+
+    def sell(self, item, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_batched_sales([({item.pk: quantity}, timezone.now())])
+
+    def test_sales_show_up_in_cached_rankings(self):
+        self.sell(self.tea, 1)
+        response = self.featured()
+        self.assertEqual([item['name'] for item in response.json()][:2], ['Tea', 'Cake'])
+        bootstrap_etag = self.featured('/api/menu/customer/bootstrap/')['ETag']
+
+        self.sell(self.cake, 3)
+        # Refreshed at most once per POPULARITY_REFRESH_SECONDS
+        self.assertEqual(self.featured(**{'If-None-Match': response['ETag']}).status_code, 304)
+        cache.delete(FEATURED_REFRESH_LOCK_KEY)
+        self.assertEqual(self.featured(**{'If-None-Match': response['ETag']}).status_code, 200)
+        self.assertEqual([item['name'] for item in self.featured().json()][:2], ['Cake', 'Tea'])
+        bootstrap = self.featured('/api/menu/customer/bootstrap/', **{'If-None-Match': bootstrap_etag})
+        self.assertEqual(bootstrap.status_code, 200)
+        self.assertEqual([item['name'] for item in bootstrap.json()['featured']][:2], ['Cake', 'Tea'])
+
+    def test_rolling_the_windows_moves_the_rankings(self):
+        etag = self.featured()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            roll_windows()
+        self.assertNotEqual(self.featured()['ETag'], etag)
+
+    def test_reading_rankings_does_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.featured().status_code, 200)
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries))
+
+
+class MenuSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        MenuItem.objects.create(
+            name='Apple juice', description='Fresh apples, good with a slice of pizza after a long day',
+            price='2.00', category='juices',
+        )
+        MenuItem.objects.create(name='Veg pizza', description='Cheese pizza', price='5.00')
+        MenuItem.objects.create(name='Burger', description='With a side of fries', price='4.00')
+
+    def setUp(self):
+        if not fts_available():
+            self.skipTest("SQLite FTS5 is not available")
+
+    def test_search_reads_matches_from_the_index(self):
+        queryset = filter_by_search(MenuItem.objects.all(), 'pizz')
+        self.assertEqual({item.name for item in queryset}, {'Veg pizza', 'Apple juice'})
+        plan = ' '.join(str(row) for row in queryset.explain().splitlines())
+        self.assertIn('menu_menuitem_fts VIRTUAL TABLE', plan)
+        self.assertNotIn('CORRELATED', plan)
+        self.assertNotIn('SCAN menu_menuitem ', plan)
+
+    def test_customer_list_keeps_relevance_order_when_searching(self):
+        client = APIClient()
+        names = [item['name'] for item in client.get('/api/menu/customer/', {'search': 'pizza'}).json()]
+        self.assertEqual(names, ['Veg pizza', 'Apple juice'])
+
+        names = [item['name'] for item in client.get('/api/menu/customer/').json()]
+        self.assertEqual(names, ['Apple juice', 'Burger', 'Veg pizza'])
+
+        names = [item['name'] for item in client.get('/api/menu/customer/', {'search': 'pizza', 'ordering': 'price'}).json()]
+        self.assertEqual(names, ['Apple juice', 'Veg pizza'])
+
+
+def png_upload(name, size=(8, 8), color='red'):
+    output = BytesIO()
+    Image.new('RGB', size, color).save(output, 'PNG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+
+
+class MenuItemSaveTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root, MENU_IMAGE_VARIANTS_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_update_of_a_loaded_item_is_one_query(self):
+        item = MenuItem.objects.create(name='Tea', price='1.00')
+        item = MenuItem.objects.get(pk=item.pk)
+        with self.assertNumQueries(1):
+            item.available = False
+            item.save()
+        with self.assertNumQueries(1):
+            item.price = '1.50'
+            item.save()
+
+    def test_rolled_back_save_keeps_the_image_file(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = MenuItem.objects.create(name='Tea', price='1.00', image=png_upload('tea.png'))
+        old_image = item.image.name
+        self.assertTrue(default_storage.exists(old_image))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    item.image = png_upload('tea-new.png')
+                    item.save()
+                    raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertTrue(default_storage.exists(old_image))
+        self.assertEqual(MenuItem.objects.get(pk=item.pk).image.name, old_image)
+
+    def test_committed_save_removes_the_replaced_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = MenuItem.objects.create(name='Tea', price='1.00', image=png_upload('tea.png'))
+        old_image = item.image.name
+        item = MenuItem.objects.get(pk=item.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.image = png_upload('tea-new.png')
+            item.save()
+        self.assertFalse(default_storage.exists(old_image))
+        self.assertTrue(default_storage.exists(item.image.name))
+
+
+class MenuImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root, MENU_IMAGE_VARIANTS_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = MenuItem.objects.create(name='Tea', price='1.00', **kwargs)
+        return MenuItem.objects.get(pk=item.pk)
+
+    def variant_files(self, item_id):
+        try:
+            return set(default_storage.listdir(variant_dir(item_id))[1])
+        except FileNotFoundError:
+            return set()
+
+    def test_upload_builds_every_variant(self):
+        item = self.create(image=png_upload('tea.png', size=(1200, 600)))
+        variants = item.image_variants
+        self.assertEqual(variants['source'], item.image.name)
+        self.assertEqual(set(variants) - {'source'}, set(IMAGE_VARIANTS))
+        for name, (size, image_format, crop) in IMAGE_VARIANTS.items():
+            with default_storage.open(variants[name]) as variant:
+                image = Image.open(variant)
+                self.assertEqual(image.format, image_format)
+                self.assertEqual(image.size, size if crop else (800, 400))
+
+    def test_serializer_returns_variant_urls_once_built(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            item = MenuItem.objects.create(name='Tea', price='1.00', image=png_upload('tea.png'))
+        self.assertEqual(MenuItemSerializer(item).data['image_variants'], {})
+
+        item = self.create(image=png_upload('tea.png'))
+        request = APIRequestFactory().get('/api/menu/customer/')
+        urls = MenuItemSerializer(item, context={'request': request}).data['image_variants']
+        self.assertEqual(set(urls), set(IMAGE_VARIANTS))
+        self.assertEqual(urls['thumbnail'], f"http://testserver{default_storage.url(item.image_variants['thumbnail'])}")
+        self.assertEqual(
+            MenuItemSerializer(item).data['image_variants']['thumbnail'],
+            default_storage.url(item.image_variants['thumbnail']),
+        )
+
+    def test_replacing_the_image_replaces_its_variants(self):
+        item = self.create(image=png_upload('tea.png'))
+        old_files = self.variant_files(item.pk)
+        self.assertEqual(len(old_files), len(IMAGE_VARIANTS))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.image = png_upload('tea-new.png', color='blue')
+            item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.image_variants['source'], item.image.name)
+        new_files = self.variant_files(item.pk)
+        self.assertEqual(len(new_files), len(IMAGE_VARIANTS))
+        self.assertFalse(new_files & old_files)
+
+    def test_deleting_the_item_removes_its_variants(self):
+        item = self.create(image=png_upload('tea.png'))
+        item_id, image = item.pk, item.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.variant_files(item_id), set())
+        self.assertFalse(default_storage.exists(image))
+
+
+class MenuBulkExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        MenuItem.objects.bulk_create([MenuItem(name=f'Item {number}', price='2.50') for number in range(30)])
+
+    def export(self, export_type):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/menu/admin/bulk/', {'type': export_type})
+        self.assertEqual(response.status_code, 200)
+        # Streams from the cursor under ASGI as well, not buffered into a list
+        self.assertIsInstance(response, SyncStreamingHttpResponse)
+        return b''.join(response.streaming_content).decode()
+
+    def test_exports_every_item(self):
+        items = json.loads(self.export('json'))
+        self.assertEqual(len(items), 30)
+        self.assertEqual(items[0]['price'], '2.50')
+        self.assertEqual(len(self.export('csv').splitlines()), 31)
+
+
+class MenuBulkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.tea = MenuItem.objects.create(name='Tea', description='Masala chai', price='1.00', category='beverages')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, data, **kwargs):
+        return self.client.post('/api/menu/admin/bulk/', data, **kwargs)
+
+    def test_invalid_row_rejects_the_whole_file(self):
+        response = self.post([
+            {'name': 'Vada', 'price': '1.00'},
+            {'name': 'Idli', 'price': 'cheap'},
+            {'name': 'Dosa', 'price': '2.00'},
+            {'price': '3.00'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 4])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertIn('name', response.data['errors'][1]['errors'])
+        self.assertEqual(MenuItem.objects.count(), 1)
+
+    def test_rows_with_an_id_update_only_the_given_fields(self):
+        response = self.post({'items': [{'id': self.tea.pk, 'price': '1.25'}]}, format='json')
+        self.assertEqual(response.data, {'created': 0, 'updated': 1})
+        self.tea.refresh_from_db()
+        self.assertEqual((self.tea.name, self.tea.description, str(self.tea.price)), ('Tea', 'Masala chai', '1.25'))
+
+    def test_duplicate_and_unknown_ids_are_rejected(self):
+        response = self.post([
+            {'id': self.tea.pk, 'price': '1.25'},
+            {'id': self.tea.pk, 'price': '1.50'},
+            {'id': self.tea.pk + 100, 'price': '1.50'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.tea.refresh_from_db()
+        self.assertEqual(str(self.tea.price), '1.00')
+
+    def test_csv_upload_creates_and_updates(self):
+        upload = SimpleUploadedFile('menu.csv', (
+            'id,name,description,price,available,category\n'
+            f'{self.tea.pk},,,1.10,,\n'
+            ',Samosa,Potato filling,1.50,true,snacks\n'
+            ',Lime soda,,2.00,false,beverages\n'
+        ).encode(), content_type='text/csv')
+        response = self.post({'file': upload}, format='multipart')
+        self.assertEqual(response.data, {'created': 2, 'updated': 1})
+        self.assertEqual(str(MenuItem.objects.get(pk=self.tea.pk).price), '1.10')
+        self.assertFalse(MenuItem.objects.get(name='Lime soda').available)
+
+    def test_created_items_are_published(self):
+        with mock.patch('menu.models.publish_on_commit') as publish:
+            self.post([{'name': 'Vada', 'price': '1.00'}], format='json')
+        vada = MenuItem.objects.get(name='Vada')
+        publish.assert_called_once_with('menu', {
+            'type': 'menu.items', 'items': [{'id': vada.pk, 'available': True, 'price': '1.00'}],
+        })
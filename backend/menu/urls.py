@@ -8,11 +8,15 @@ urlpatterns = [
     path('customer/<int:pk>/', views.CustomerMenuDetailView.as_view(), name='customer-menu-detail'),
     path('customer/categories/', views.menu_categories, name='menu-categories'),
     path('customer/featured/', views.featured_items, name='featured-items'),
+    path('customer/bootstrap/', views.menu_bootstrap, name='menu-bootstrap'),
+    path('customer/events/', views.menu_events, name='menu-events'),
     path('customer/search/', views.search_menu, name='search-menu'),
     
     # Admin menu endpoints
     path('admin/', views.MenuItemListCreateView.as_view(), name='admin-menu-list-create'),
     path('admin/<int:pk>/', views.MenuItemDetailView.as_view(), name='admin-menu-detail'),
+    path('admin/bulk/', views.MenuBulkView.as_view(), name='admin-menu-bulk'),
+    path('admin/availability/', views.bulk_availability, name='admin-menu-availability'),
     
     # Legacy endpoints (for backward compatibility)
     path('', views.list_items, name='list-items'),
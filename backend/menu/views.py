@@ -1,20 +1,34 @@
-from rest_framework import generics, permissions, filters
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework import generics, permissions
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework import status
+from django.http import StreamingHttpResponse
+from core.events import sse_stream
+from core.streaming import SyncStreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, Q, Window
 
-from .models import MenuItem
-from .serializers import MenuItemSerializer
+from .bulk import export_rows, import_rows, read_rows, stream_csv, stream_json
+from .cache import MenuCacheMixin, cached_menu_bytes, get_menu_version, menu_cached
+from .filters import MenuOrderingFilter, MenuSearchFilter
+from .models import MENU_EVENTS_CHANNEL, MenuItem
+from .popularity import top_items
+from .search import fts_available, filter_by_search
+from .serializers import BulkAvailabilitySerializer, MenuItemSerializer
+
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 100
+FEATURED_ITEMS_LIMIT = 6
 
 # Customer Views (Public/Authenticated)
-class CustomerMenuListView(generics.ListAPIView):
+class CustomerMenuListView(MenuCacheMixin, generics.ListAPIView):
     """Public view for customers to see available menu items"""
     serializer_class = MenuItemSerializer
     permission_classes = []  # Public access
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, MenuSearchFilter, MenuOrderingFilter]
     filterset_fields = ['category', 'available']
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'price', 'category']
@@ -23,7 +37,7 @@ class CustomerMenuListView(generics.ListAPIView):
     def get_queryset(self):
         return MenuItem.objects.filter(available=True)
 
-class CustomerMenuDetailView(generics.RetrieveAPIView):
+class CustomerMenuDetailView(MenuCacheMixin, generics.RetrieveAPIView):
     """Public view for customers to see specific menu item details"""
     serializer_class = MenuItemSerializer
     permission_classes = []  # Public access
@@ -31,35 +45,80 @@ class CustomerMenuDetailView(generics.RetrieveAPIView):
     def get_queryset(self):
         return MenuItem.objects.filter(available=True)
 
-@api_view(['GET'])
-def menu_categories(request):
-    """Get all available categories"""
+def available_categories():
     categories = MenuItem.objects.filter(available=True).values_list('category', flat=True).distinct()
     category_choices = dict(MenuItem.CATEGORY_CHOICES)
     
-    result = [
+    return [
         {
             'value': category,
             'label': category_choices.get(category, category.title())
         }
         for category in categories
     ]
-    
-    return Response(result)
 
 @api_view(['GET'])
+@menu_cached
+def menu_categories(request):
+    """Get all available categories"""
+    return Response(available_categories())
+
+@api_view(['GET'])
+@menu_cached(featured=True)
 def featured_items(request):
-    """Get featured/popular menu items (you can customize this logic)"""
-    # For now, just return first 6 available items
-    # You can enhance this with popularity logic later
-    featured = MenuItem.objects.filter(available=True)[:6]
-    serializer = MenuItemSerializer(featured, many=True)
+    """Get featured items ranked by recent popularity
+
+    ``window`` picks the rolling count (1d, 7d or 30d), ``decay=true`` ranks
+    by the time-decayed score instead.
+    """
+    window = request.GET.get('window', '7d')
+    decay = request.GET.get('decay', '').lower() in ('1', 'true', 'yes')
+    featured = top_items(FEATURED_ITEMS_LIMIT, window=window, decay=decay)
+    serializer = MenuItemSerializer(featured, many=True, context={'request': request})
     return Response(serializer.data)
 
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def menu_bootstrap(request):
+    """Categories, featured items and the full available menu in one payload
+
+    Rendered once per menu and popularity version and honours If-None-Match,
+    so clients can revalidate on every app open for the cost of a header
+    comparison.
+    """
+    # Absolute image URLs, like the other customer endpoints
+    context = {'request': request}
+
+    def build(version):
+        menu = MenuItem.objects.filter(available=True).order_by('category', 'name')
+        return {
+            'version': version,
+            'categories': available_categories(),
+            'featured': MenuItemSerializer(top_items(FEATURED_ITEMS_LIMIT), many=True, context=context).data,
+            'menu': MenuItemSerializer(menu, many=True, context=context).data,
+        }
+    return cached_menu_bytes(request, 'bootstrap', build, featured=True)
+
+async def menu_events(request):
+    """Server-Sent Events stream of availability and price changes
+
+    Needs an ASGI server (see canteen_cms/asgi.py). The first event carries
+    the current menu version so clients can revalidate their bootstrap copy.
+    """
+    hello = {'type': 'menu.version', 'version': get_menu_version()}
+    response = StreamingHttpResponse(
+        sse_stream(MENU_EVENTS_CHANNEL, [hello]),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @api_view(['GET'])
 def search_menu(request):
-    """Advanced search for menu items"""
-    query = request.GET.get('q', '')
+    """Advanced search for menu items, ranked by relevance and paginated"""
+    query = request.GET.get('q', '').strip()
     category = request.GET.get('category', '')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
@@ -67,9 +126,14 @@ def search_menu(request):
     queryset = MenuItem.objects.filter(available=True)
     
     if query:
-        queryset = queryset.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        )
+        if fts_available():
+            queryset = filter_by_search(queryset, query)
+        else:
+            queryset = queryset.filter(
+                Q(name__icontains=query) | Q(description__icontains=query)
+            ).order_by('category', 'name')
+    else:
+        queryset = queryset.order_by('category', 'name')
     
     if category:
         queryset = queryset.filter(category=category)
@@ -86,10 +150,31 @@ def search_menu(request):
         except ValueError:
             pass
     
-    serializer = MenuItemSerializer(queryset, many=True)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    try:
+        page_size = int(request.GET.get('page_size', SEARCH_PAGE_SIZE))
+    except ValueError:
+        page_size = SEARCH_PAGE_SIZE
+    page_size = min(max(page_size, 1), SEARCH_MAX_PAGE_SIZE)
+    start = (page - 1) * page_size
+    
+    # The total rides along on every row, so results and count are one query
+    items = list(queryset.annotate(total_count=Window(Count('id')))[start:start + page_size])
+    if items:
+        count = items[0].total_count
+    else:
+        count = queryset.count() if start else 0
+    
+    serializer = MenuItemSerializer(items, many=True, context={'request': request})
     return Response({
         'results': serializer.data,
-        'count': queryset.count()
+        'count': count,
+        'page': page,
+        'page_size': page_size,
+        'has_next': start + len(items) < count
     })
 
 # Admin Views (Existing functionality)
@@ -97,7 +182,7 @@ class MenuItemListCreateView(generics.ListCreateAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
     permission_classes = [IsAdminUser]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, MenuSearchFilter]
     filterset_fields = ['category', 'available']
     search_fields = ['name', 'description']
 
@@ -106,6 +191,57 @@ class MenuItemDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = MenuItemSerializer
     permission_classes = [IsAdminUser]
 
+class MenuBulkView(APIView):
+    """Admin bulk import (POST) and streaming export (GET) of the menu
+
+    Export: ``?type=csv`` (default) or ``?type=json``.
+    Import: a CSV ``file`` upload, or a JSON list of items (optionally under
+    ``items``). Rows with an ``id`` update that item, the rest are created.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        export_type = request.query_params.get('type', 'csv')
+        if export_type == 'json':
+            response = SyncStreamingHttpResponse(stream_json(export_rows()), content_type='application/json')
+            filename = 'menu.json'
+        else:
+            response = SyncStreamingHttpResponse(stream_csv(export_rows()), content_type='text/csv')
+            filename = 'menu.csv'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                file_format = 'json' if upload.name.lower().endswith('.json') else 'csv'
+                rows = read_rows(upload.read(), file_format)
+            else:
+                rows = read_rows(request.data, 'json')
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        created, updated, errors = import_rows(rows)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created': created, 'updated': updated})
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_availability(request):
+    """Mark many items sold out / back in stock with one UPDATE"""
+    serializer = BulkAvailabilitySerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    available = serializer.validated_data['available']
+    with transaction.atomic():
+        updated = MenuItem.objects.filter(
+            pk__in=serializer.validated_data['ids']
+        ).exclude(available=available).update(available=available)
+    return Response({'updated': updated, 'available': available})
+
 # Function-based views (for backward compatibility)
 @api_view(['GET'])
 def list_items(request):
@@ -1,37 +1,105 @@
 # orders/admin.py
-from django.contrib import admin
-from .models import Order, OrderItem
+from django import forms
+from django.contrib import admin, messages
+from django.db import transaction
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, can_transition, publish_status_changes
+from .rollup import record_status_changes
+from .transitions import TransitionConflict, release_pickup_slots, transition_orders
 
 class OrderItemInline(admin.TabularInline):
+    """Lines are fixed at checkout, the sales rollup and total_amount count them"""
     model = OrderItem
     extra = 0
-    readonly_fields = ['total_price', 'created_at']
+    can_delete = False
+    readonly_fields = ['menu_item', 'quantity', 'price', 'total_price', 'created_at']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        current = self.initial.get('status')
+        if self.instance.pk and current and status != current and not can_transition(current, status):
+            raise forms.ValidationError(f"Cannot move order from {current} to {status}")
+        return status
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'status', 'total_amount', 'total_items', 'created_at']
     list_filter = ['status', 'created_at', 'updated_at']
     search_fields = ['user__username', 'user__email', 'id']
-    readonly_fields = ['total_amount', 'total_items', 'created_at', 'updated_at']
+    readonly_fields = ['total_amount', 'total_items', 'pickup_slot', 'slot_load', 'version', 'created_at', 'updated_at']
     list_editable = ['status']
+    form = OrderAdminForm
     inlines = [OrderItemInline]
     
     actions = ['mark_as_confirmed', 'mark_as_preparing', 'mark_as_ready', 'mark_as_delivered']
+
+    def has_add_permission(self, request):
+        # Orders come from checkout, which also records them in the rollup
+        return False
+
+    def get_queryset(self, request):
+        # total_items sums the items of every listed order
+        return super().get_queryset(request).select_related('user').prefetch_related('items')
+
+    def get_deleted_objects(self, objs, request):
+        # Items go with their order, though OrderItemAdmin deletes none alone
+        deleted, model_count, perms_needed, protected = super().get_deleted_objects(objs, request)
+        perms_needed.discard(OrderItem._meta.verbose_name)
+        return deleted, model_count, perms_needed, protected
+
+    def get_changelist_form(self, request, **kwargs):
+        # list_editable forms do not use ModelAdmin.form
+        kwargs.setdefault('form', OrderAdminForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        status_changed = change and 'status' in form.changed_data
+        with transaction.atomic():
+            if status_changed:
+                previous = Order.objects.select_for_update().get(pk=obj.pk)
+                record_status_changes([previous], obj.status)
+                obj.version = previous.version + 1
+                if obj.status == 'CANCELLED':
+                    release_pickup_slots([previous])
+            super().save_model(request, obj, form, change)
+        if status_changed:
+            publish_status_changes([obj])
+
+    def _set_status(self, request, queryset, status):
+        try:
+            updated, rejected = transition_orders(
+                (pk, status, None) for pk in queryset.values_list('id', flat=True)
+            )
+        except TransitionConflict as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        if updated:
+            self.message_user(request, f"{len(updated)} orders marked as {status.title()}")
+        if rejected:
+            skipped = ', '.join(f"#{rejection['id']} ({rejection['error']})" for rejection in rejected)
+            self.message_user(request, f"Skipped {len(rejected)} orders: {skipped}", messages.WARNING)
     
     def mark_as_confirmed(self, request, queryset):
-        queryset.update(status='CONFIRMED')
+        self._set_status(request, queryset, 'CONFIRMED')
     mark_as_confirmed.short_description = "Mark selected orders as Confirmed"
     
     def mark_as_preparing(self, request, queryset):
-        queryset.update(status='PREPARING')
+        self._set_status(request, queryset, 'PREPARING')
     mark_as_preparing.short_description = "Mark selected orders as Preparing"
     
     def mark_as_ready(self, request, queryset):
-        queryset.update(status='READY')
+        self._set_status(request, queryset, 'READY')
     mark_as_ready.short_description = "Mark selected orders as Ready"
     
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status='DELIVERED')
+        self._set_status(request, queryset, 'DELIVERED')
     mark_as_delivered.short_description = "Mark selected orders as Delivered"
 
 @admin.register(OrderItem)
@@ -39,4 +107,34 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'menu_item', 'quantity', 'price', 'total_price', 'created_at']
     list_filter = ['created_at', 'menu_item__category']
     search_fields = ['order__id', 'menu_item__name', 'order__user__username']
-    readonly_fields = ['total_price', 'created_at']
\ No newline at end of file
+    readonly_fields = ['total_price', 'created_at']
+
+    # Read-only like OrderItemInline
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    can_delete = False
+    readonly_fields = ['menu_item', 'quantity', 'price', 'created_at']
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only view of orders moved out by ``manage.py archive_orders``"""
+    list_display = ['id', 'user', 'status', 'total_amount', 'created_at', 'archived_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'user__email', 'id']
+    inlines = [ArchivedOrderItemInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
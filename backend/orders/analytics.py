@@ -0,0 +1,164 @@
+# orders/analytics.py
+"""Sales figures bucketed by hour, day, week or month.
+
+Day and coarser buckets are summed from the daily rollup (orders.rollup),
+so a year is a few hundred rows per status. Hourly buckets need the order
+timestamps and read ``created_at`` of hot and archived orders through a
+half-open range, which the created_at indexes serve; they are limited to
+HOURLY_MAX_DAYS.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from menu.models import MenuItem
+
+from .models import ArchivedOrder, DailyItemSales, DailyOrderSales, Order
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+SPLITS = ('category', 'item')
+HOURLY_MAX_DAYS = 31
+
+SPLIT_FIELDS = {
+    None: (),
+    'category': ('menu_item__category',),
+    'item': ('menu_item_id', 'menu_item__name'),
+}
+REVENUE_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _row(period, group, order_count, quantity, revenue):
+    row = {
+        'period': period.isoformat(),
+        'orders': order_count or 0,
+        'quantity': quantity or 0,
+        'revenue': f'{revenue or 0:.2f}',
+    }
+    if len(group) == 1:
+        row['category'] = group[0]
+    elif len(group) == 2:
+        row['menu_item'], row['name'] = group
+    return row
+
+
+def _bucket(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _from_rollup(start, end, granularity, split, statuses):
+    # SQL sums the rollup per day (and menu item); folding days into weeks
+    # or months and items into categories is done on that much smaller
+    # result, which keeps SQLite from calling its Python date functions
+    # and joining menu items row by row
+    model = DailyItemSales if split else DailyOrderSales
+    group = ('menu_item_id',) if split else ()
+    rows = (
+        model.objects.filter(date__gte=start, date__lte=end, status__in=statuses)
+        .values_list('date', *group)
+        .annotate(order_count=Sum('orders'), total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+        .order_by()
+    )
+    names = {}
+    if split:
+        names = {
+            pk: (category,) if split == 'category' else (pk, name)
+            for pk, name, category in MenuItem.objects.values_list('id', 'name', 'category')
+        }
+
+    buckets = defaultdict(lambda: [0, 0, Decimal('0')])
+    for day, *key, order_count, quantity, revenue in rows:
+        totals = buckets[(_bucket(day, granularity), names.get(key[0], key) if key else ())]
+        totals[0] += order_count
+        totals[1] += quantity
+        totals[2] += revenue
+    return [
+        _row(period, group_key, *totals)
+        for (period, group_key), totals in sorted(buckets.items(), key=lambda entry: (entry[0][0], str(entry[0][1])))
+    ]
+
+
+def _from_orders(start, end, split, statuses):
+    since = timezone.make_aware(datetime.combine(start, time.min))
+    until = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    group = SPLIT_FIELDS[split]
+
+    buckets = defaultdict(lambda: [0, 0, Decimal('0')])
+    # Recent hours are nearly always in the hot table; the archive scan is
+    # an empty range on its created_at index then
+    for order_model in (Order, ArchivedOrder):
+        item_model = order_model._meta.get_field('items').related_model
+        items = (
+            item_model.objects.filter(
+                order__created_at__gte=since, order__created_at__lt=until, order__status__in=statuses
+            )
+            .annotate(period=TruncHour('order__created_at'))
+            .values('period', *group)
+            .annotate(
+                order_count=Count('order', distinct=True),
+                total_quantity=Sum('quantity'),
+                total_revenue=Sum(F('price') * F('quantity'), output_field=REVENUE_FIELD),
+            )
+            .order_by()
+        )
+        if split:
+            for row in items:
+                totals = buckets[(row['period'], tuple(row[field] for field in group))]
+                totals[0] += row['order_count']
+                totals[1] += row['total_quantity']
+                totals[2] += row['total_revenue']
+            continue
+
+        # Order totals are summed on their own so the item join does not repeat them
+        for row in items:
+            buckets[(row['period'], ())][1] += row['total_quantity']
+        orders = (
+            order_model.objects.filter(created_at__gte=since, created_at__lt=until, status__in=statuses)
+            .annotate(period=TruncHour('created_at'))
+            .values('period')
+            .annotate(order_count=Count('id'), total_revenue=Sum('total_amount'))
+            .order_by()
+        )
+        for row in orders:
+            totals = buckets[(row['period'], ())]
+            totals[0] += row['order_count']
+            totals[2] += row['total_revenue']
+
+    return [
+        _row(period, group_key, *totals)
+        for (period, group_key), totals in sorted(buckets.items(), key=lambda entry: (entry[0][0], str(entry[0][1])))
+    ]
+
+
+def sales_series(start, end, granularity='day', split=None, include_cancelled=False):
+    """Revenue, order and item counts per bucket between two local dates
+
+    ``end`` is inclusive. With a ``split`` each bucket has one row per
+    category or menu item; from the daily rollup their ``orders`` count
+    is the number of orders containing the item, summed per category.
+    """
+    statuses = [code for code, _ in Order.STATUS_CHOICES if include_cancelled or code != 'CANCELLED']
+    if granularity == 'hour':
+        return _from_orders(start, end, split, statuses)
+    return _from_rollup(start, end, granularity, split, statuses)
+
+
+def cached_sales_series(start, end, granularity='day', split=None, include_cancelled=False):
+    """``sales_series`` cached per range, granularity and split"""
+    params = f'{start}:{end}:{granularity}:{split}:{int(include_cancelled)}:{timezone.get_current_timezone_name()}'
+    key = 'orders:analytics:' + hashlib.md5(params.encode()).hexdigest()
+    results = cache.get(key)
+    if results is None:
+        results = sales_series(start, end, granularity, split, include_cancelled)
+        cache.set(key, results, getattr(settings, 'SALES_ANALYTICS_CACHE_TIMEOUT', 300))
+    return results
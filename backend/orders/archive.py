@@ -0,0 +1,64 @@
+# orders/archive.py
+"""Moving completed orders out of the hot tables.
+
+``archive_orders`` copies DELIVERED and CANCELLED orders older than a
+cutoff, with their items, into ``ArchivedOrder``/``ArchivedOrderItem`` and
+deletes them from ``Order``/``OrderItem``. Each batch is its own short
+transaction, so order placement is never blocked for long. The rollup
+tables already count archived orders and are left as they are.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import COMPLETED_STATUSES, ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .rollup import archiving
+
+ORDER_FIELDS = ('id', 'user_id', 'status', 'total_amount', 'notes', 'created_at', 'updated_at', 'version')
+ITEM_FIELDS = ('id', 'order_id', 'menu_item_id', 'quantity', 'price', 'created_at')
+
+
+def archivable_orders(older_than_days):
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    orders = Order.objects.filter(status__in=COMPLETED_STATUSES, created_at__lt=cutoff)
+    # SQLite hands out max(id) + 1 to new rows, so moving the newest order
+    # away would let its id be reused and clash with the archived copy
+    latest = Order.objects.order_by('-id').values_list('id', flat=True).first()
+    return orders.exclude(id=latest)
+
+
+@transaction.atomic
+def archive_batch(order_ids):
+    """Move the given completed orders and their items, returns the count"""
+    orders = list(
+        Order.objects.select_for_update()
+        .filter(id__in=order_ids, status__in=COMPLETED_STATUSES)
+        .values(*ORDER_FIELDS)
+    )
+    if not orders:
+        return 0
+    ids = [order['id'] for order in orders]
+    items = OrderItem.objects.filter(order_id__in=ids).values(*ITEM_FIELDS)
+
+    ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+    ArchivedOrderItem.objects.bulk_create([ArchivedOrderItem(**item) for item in items])
+    # Items go with their orders through the cascade
+    with archiving():
+        Order.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def archive_orders(older_than_days, batch_size=500):
+    """Archive completed orders older than ``older_than_days`` in batches
+
+    Yields the number of orders moved by each batch.
+    """
+    candidates = archivable_orders(older_than_days).order_by('id')
+    last_id = 0
+    while True:
+        ids = list(candidates.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield archive_batch(ids)
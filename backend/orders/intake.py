@@ -0,0 +1,167 @@
+# orders/intake.py
+"""Group-commit queue for order placement writes.
+
+SQLite lets one connection write at a time; with many concurrent checkouts
+each request waits for the write lock (or gives up with "database is
+locked") and pays for its own commit. With ``ORDER_INTAKE_QUEUE`` on,
+``OrderCreateSerializer`` hands its writes to ``run_write`` instead: a
+single writer thread per process takes up to ``ORDER_INTAKE_BATCH_SIZE``
+queued placements and runs them in one transaction, each in its own
+savepoint so one failing order does not take the batch down. Counter
+updates registered with ``defer_to_batch`` (sales rollup, popularity) are
+merged and applied once per batch. Requests wait on a future for their
+own result, which is only set once the batch has committed.
+
+The writes commit in the writer's transaction, not in the request's, so
+the request must not hold a transaction of its own while it waits: on
+SQLite its read lock would block the writer's commit until both time out.
+``place_order`` therefore stores its idempotency key outside a
+transaction while the queue is on (see ``intake_enabled``).
+"""
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+_batch = threading.local()
+
+
+def defer_to_batch(key, item, apply):
+    """Collect ``item`` for one ``apply(items)`` call at the end of the batch
+
+    Outside the writer thread ``apply([item])`` runs at once. Items of a
+    placement that fails are dropped with its savepoint.
+    """
+    job = getattr(_batch, 'job', None)
+    if job is None:
+        apply([item])
+    else:
+        job.setdefault(key, (apply, []))[1].append(item)
+
+
+class IntakeTimeout(Exception):
+    """The writer did not get to the order in time; nothing was written"""
+
+
+class OrderIntake:
+    """In-process queue drained by one writer thread"""
+
+    def __init__(self, batch_size=20, max_wait=0.002):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, write):
+        """Queue ``write`` (a callable doing one placement's writes), returns a Future"""
+        self._ensure_writer()
+        future = Future()
+        self._queue.put((write, future))
+        return future
+
+    def _ensure_writer(self):
+        # A forked worker inherits the object but not the thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='order-intake', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        # Give requests arriving right behind the first one a moment to join
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            close_old_connections()
+            try:
+                self._commit(batch)
+            except Exception:
+                logger.exception("Order intake batch failed")
+            finally:
+                close_old_connections()
+
+    def _commit(self, batch):
+        results = []
+        deferred = {}
+        try:
+            with transaction.atomic():
+                for write, future in batch:
+                    # Requests that timed out before their turn are skipped
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    _batch.job = {}
+                    try:
+                        # Each placement opens its own atomic block, a
+                        # savepoint inside the batch transaction
+                        results.append((future, write(), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+                    else:
+                        for key, (apply, items) in _batch.job.items():
+                            deferred.setdefault(key, (apply, []))[1].extend(items)
+                    finally:
+                        _batch.job = None
+                for apply, items in deferred.values():
+                    apply(items)
+        except Exception as e:
+            for future, _, _ in results:
+                future.set_exception(e)
+            raise
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_intake = None
+_intake_lock = threading.Lock()
+
+
+def get_intake():
+    global _intake
+    if _intake is None:
+        with _intake_lock:
+            if _intake is None:
+                _intake = OrderIntake(
+                    batch_size=getattr(settings, 'ORDER_INTAKE_BATCH_SIZE', 20),
+                    max_wait=getattr(settings, 'ORDER_INTAKE_MAX_WAIT_MS', 2) / 1000,
+                )
+    return _intake
+
+
+def intake_enabled():
+    return getattr(settings, 'ORDER_INTAKE_QUEUE', False)
+
+
+def run_write(write):
+    """Run ``write`` directly, or through the intake queue when it is enabled"""
+    if not intake_enabled():
+        return write()
+    future = get_intake().submit(write)
+    try:
+        return future.result(timeout=getattr(settings, 'ORDER_INTAKE_TIMEOUT', 10))
+    except TimeoutError:
+        if future.cancel():
+            raise IntakeTimeout("The kitchen is very busy right now, please try again")
+        # Already being written, its batch commits shortly
+        return future.result()
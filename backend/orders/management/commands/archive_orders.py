@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move delivered and cancelled orders older than --days into the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 90))
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--days must be >= 0 and --batch-size >= 1")
+        total = 0
+        for moved in archive_orders(options['days'], batch_size=options['batch_size']):
+            total += moved
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Archived {total} orders")
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} orders"))
@@ -0,0 +1,70 @@
+import sys
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.export import FORMATS, export_rows, export_stream
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Export order lines joined with orders and customers as CSV or JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--start', type=date.fromisoformat, help="First order date, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last order date, YYYY-MM-DD")
+        parser.add_argument(
+            '--status', action='append', choices=[choice for choice, _ in Order.STATUS_CHOICES],
+            help="Only orders in this status, may be repeated",
+        )
+        parser.add_argument('--user', help="Only orders of this user id or username")
+        parser.add_argument('--no-archive', action='store_true', help="Leave out archived orders")
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', '-o', default='-', help="File to write, '-' for stdout")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['start'] and options['end'] and options['start'] > options['end']:
+            raise CommandError("--start must not be after --end")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be >= 1")
+
+        user_id = None
+        if options['user']:
+            users = get_user_model().objects.all()
+            lookup = {'pk': options['user']} if options['user'].isdigit() else {'username': options['user']}
+            user_id = users.filter(**lookup).values_list('pk', flat=True).first()
+            if user_id is None:
+                raise CommandError(f"No user {options['user']}")
+
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        rows = export_rows(
+            start=options['start'],
+            end=options['end'],
+            statuses=options['status'],
+            user_id=user_id,
+            include_archived=not options['no_archive'],
+            chunk_size=options['chunk_size'],
+        )
+        chunks = export_stream(counted(rows), fmt=options['format'], compress=options['gzip'])
+
+        if options['output'] == '-':
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+        else:
+            with open(options['output'], 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        # stdout may be the export itself
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} order lines"))
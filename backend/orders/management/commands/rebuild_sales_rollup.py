@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.rollup import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollup from the order history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild days from this date on (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date like 2025-01-31")
+        count = rebuild_rollup(since=since)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} daily order rows"))
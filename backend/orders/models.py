@@ -2,8 +2,65 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from core.events import publish_on_commit
+from core.models import PickupSlot
 from menu.models import MenuItem
 
+# Orders the kitchen still has to act on, streamed on the kitchen feed
+ACTIVE_STATUSES = ('PLACED', 'CONFIRMED', 'PREPARING', 'READY')
+KITCHEN_EVENTS_CHANNEL = 'kitchen'
+# Orders only move forward through the flow (steps may be skipped) and can
+# be cancelled until they are delivered; DELIVERED and CANCELLED are final
+ORDER_FLOW = ('PLACED', 'CONFIRMED', 'PREPARING', 'READY', 'DELIVERED')
+
+def allowed_sources(target):
+    """Statuses an order may move to ``target`` from"""
+    if target == 'CANCELLED':
+        return ACTIVE_STATUSES
+    if target in ORDER_FLOW:
+        return ORDER_FLOW[:ORDER_FLOW.index(target)]
+    return ()
+
+def can_transition(current, target):
+    return current in allowed_sources(target)
+
+def kitchen_payload(order, items):
+    """Compact JSON-ready dict of an order for kitchen screens"""
+    return {
+        'id': order.id,
+        'status': order.status,
+        'user': order.user.username,
+        'notes': order.notes or '',
+        'total_amount': f'{order.total_amount:.2f}',
+        'created_at': order.created_at.isoformat(),
+        'version': order.version,
+        'items': [
+            {'menu_item': item.menu_item_id, 'name': item.menu_item.name, 'quantity': item.quantity}
+            for item in items
+        ],
+    }
+
+def publish_order_created(order, items):
+    publish_on_commit(KITCHEN_EVENTS_CHANNEL, {'type': 'order.created', 'order': kitchen_payload(order, items)})
+
+def publish_status_changes(orders):
+    """Queue one 'order.status' event for the given orders"""
+    if orders:
+        publish_on_commit(KITCHEN_EVENTS_CHANNEL, {
+            'type': 'order.status',
+            'orders': [{'id': order.id, 'status': order.status, 'version': order.version} for order in orders],
+        })
+
+class OrderQuerySet(models.QuerySet):
+    def for_display(self):
+        """Load what OrderSerializer reads: user, items and their menu items"""
+        item_model = self.model._meta.get_field('items').related_model
+        # Archived orders keep no pickup slot
+        related = ['user', 'pickup_slot'] if self.model is Order else ['user']
+        return self.select_related(*related).prefetch_related(
+            models.Prefetch('items', queryset=item_model.objects.select_related('menu_item'))
+        )
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('PLACED', 'Placed'),
@@ -20,9 +77,23 @@ class Order(models.Model):
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Bumped on every status change so clients can detect stale updates
+    version = models.PositiveIntegerField(default=1)
+    # Capacity taken in the pickup slot (core.slots), given back on cancel
+    pickup_slot = models.ForeignKey(
+        PickupSlot, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders'
+    )
+    slot_load = models.PositiveIntegerField(default=0)
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination in orders.pagination walks these
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.user.username} - {self.status}"
@@ -36,6 +107,7 @@ class Order(models.Model):
 
     @property
     def total_items(self):
+        # Uses prefetched items when loaded through Order.objects.for_display()
         return sum(item.quantity for item in self.items.all())
 
 class OrderItem(models.Model):
@@ -58,4 +130,82 @@ class OrderItem(models.Model):
         # Store the current price of the menu item when creating order item
         if not self.price or self.price == 0:
             self.price = self.menu_item.price
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+class DailyOrderSales(models.Model):
+    """Per day and status totals, maintained by orders.rollup"""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'status')
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.orders} orders"
+
+class DailyItemSales(models.Model):
+    """Per day, menu item and order status totals, maintained by orders.rollup"""
+    date = models.DateField()
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='daily_order_sales')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    # Orders containing the item
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menu_item', 'status')
+
+    def __str__(self):
+        return f"{self.date} {self.menu_item} {self.status}: {self.quantity}"
+
+# Orders that can no longer change, the only ones orders.archive moves out
+COMPLETED_STATUSES = ('DELIVERED', 'CANCELLED')
+
+class ArchivedOrder(models.Model):
+    """A completed order moved out of the hot table by orders.archive
+
+    Keeps the original order id, so ids stay unique across both tables.
+    """
+    id = models.PositiveBigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=8, decimal_places=2)
+    notes = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    version = models.PositiveIntegerField(default=1)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='archorder_user_created_id_idx'),
+            models.Index(fields=['created_at'], name='archorder_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.id} - {self.status}"
+
+    @property
+    def total_items(self):
+        return sum(item.quantity for item in self.items.all())
+
+class ArchivedOrderItem(models.Model):
+    id = models.PositiveBigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='items', on_delete=models.CASCADE)
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.menu_item_id} (x{self.quantity}) for archived order #{self.order_id}"
+
+    @property
+    def total_price(self):
+        return self.price * self.quantity
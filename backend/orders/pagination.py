@@ -0,0 +1,118 @@
+# orders/pagination.py
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class OrderCursorPagination(BasePagination):
+    """Keyset pagination on (-created_at, -id).
+
+    Each page is a single indexed range scan whatever its depth. Cursors are
+    opaque tokens for the last row of the previous page; pass ``count=true``
+    to also get the total (an extra COUNT query).
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, obj):
+        raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def filter_after(self, queryset, created_at, pk):
+        """Rows that come after ``(created_at, pk)`` in the page order"""
+        # The plain created_at bound lets SQLite seek the index; the OR alone
+        # makes it walk the index from the top
+        return queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(pk__lt=pk))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """Paginate several querysets of the same kind of rows as one list
+
+        Used to merge hot and archived orders: each queryset gets its own
+        range scan and the page is cut from the merged rows.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count = sum(queryset.count() for queryset in querysets)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+
+        results = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.ordering)
+            if cursor:
+                queryset = self.filter_after(queryset, created_at, pk)
+            # One extra row tells us whether there is a next page
+            results.extend(queryset[:page_size + 1])
+        if len(querysets) > 1:
+            results.sort(key=lambda obj: (obj.created_at, obj.pk), reverse=True)
+
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_cursor = self.encode_cursor(results[-1]) if self.has_next else None
+        return results
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_data(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'has_next': self.has_next,
+        }
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return payload
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'has_next': {'type': 'boolean'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,226 @@
+# orders/rollup.py
+"""Daily sales rollup behind the admin summary.
+
+``DailyOrderSales`` holds per (date, status) totals and ``DailyItemSales``
+per (date, menu item, status) totals. Placing an order adds to its rows and
+a status change moves the order's numbers from the old status rows to the
+new ones, in the caller's transaction. Deleting an order, hot or archived,
+takes it back out, except when ``orders.archive`` moves it to the archive
+tables, which the rollup keeps counting. ``rebuild_rollup`` recomputes both
+tables from the orders themselves, archived ones included; run it after
+deleting a menu item that has sales, whose order lines go with it.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedOrder, DailyItemSales, DailyOrderSales, Order, OrderItem
+
+ROLLUP_FIELDS = ('orders', 'quantity', 'revenue')
+
+_archiving = threading.local()
+
+
+class Deltas:
+    """Accumulates ``(orders, quantity, revenue)`` changes per rollup key"""
+
+    def __init__(self):
+        self.orders = defaultdict(lambda: [0, 0, Decimal('0')])
+        self.items = defaultdict(lambda: [0, 0, Decimal('0')])
+
+    def add(self, order, status, items, sign=1):
+        """Count ``order`` under ``status``; items are (menu_item_id, quantity, price)"""
+        day = timezone.localdate(order.created_at)
+        totals = self.orders[(day, status)]
+        totals[0] += sign
+        totals[2] += sign * order.total_amount
+        for menu_item_id, quantity, price in items:
+            totals[1] += sign * quantity
+            line = self.items[(day, menu_item_id, status)]
+            line[0] += sign
+            line[1] += sign * quantity
+            line[2] += sign * price * quantity
+
+    def apply(self):
+        with transaction.atomic():
+            _apply(DailyOrderSales, ('date', 'status'), self.orders)
+            _apply(DailyItemSales, ('date', 'menu_item_id', 'status'), self.items)
+
+
+def _case(values, output_field):
+    return Case(
+        *[When(pk=pk, then=Value(value)) for pk, value in values.items()],
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
+def _apply(model, key_fields, deltas):
+    deltas = {key: values for key, values in deltas.items() if any(values)}
+    if not deltas:
+        return
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key))) for key in deltas],
+        ignore_conflicts=True,
+    )
+
+    # Read the row ids back to turn the composite keys into one UPDATE
+    lookup = {f'{field}__in': {key[i] for key in deltas} for i, field in enumerate(key_fields)}
+    by_pk = {}
+    for pk, *key in model.objects.filter(**lookup).values_list('pk', *key_fields):
+        if tuple(key) in deltas:
+            by_pk[pk] = deltas[tuple(key)]
+
+    model.objects.filter(pk__in=by_pk).update(**{
+        field: F(field) + _case(
+            {pk: values[i] for pk, values in by_pk.items()},
+            DecimalField(max_digits=12, decimal_places=2) if field == 'revenue' else IntegerField(),
+        )
+        for i, field in enumerate(ROLLUP_FIELDS)
+    })
+
+
+def record_order(order, items):
+    """Add a newly placed order and its ``OrderItem`` rows to the rollup"""
+    record_orders([(order, items)])
+
+
+def record_orders(placed):
+    """``record_order`` for several ``(order, items)`` pairs in one pass"""
+    deltas = Deltas()
+    for order, items in placed:
+        deltas.add(order, order.status, [(item.menu_item_id, item.quantity, item.price) for item in items])
+    deltas.apply()
+
+
+def record_status_changes(orders, new_status):
+    """Move ``orders`` (loaded with their old status) under ``new_status``
+
+    Call inside the transaction that writes the new status.
+    """
+    record_transitions([(order, new_status) for order in orders])
+
+
+def record_transitions(moves):
+    """Like ``record_status_changes`` for ``(order, new_status)`` pairs with
+    different targets, applied as one set of rollup writes
+    """
+    moves = [(order, new_status) for order, new_status in moves if order.status != new_status]
+    if not moves:
+        return
+    items = defaultdict(list)
+    unloaded = []
+    for order, _ in moves:
+        if 'items' in getattr(order, '_prefetched_objects_cache', {}):
+            items[order.id] = [(item.menu_item_id, item.quantity, item.price) for item in order.items.all()]
+        else:
+            unloaded.append(order)
+    if unloaded:
+        rows = OrderItem.objects.filter(order__in=unloaded).values_list('order_id', 'menu_item_id', 'quantity', 'price')
+        for order_id, *line in rows:
+            items[order_id].append(line)
+
+    deltas = Deltas()
+    for order, new_status in moves:
+        deltas.add(order, order.status, items[order.id], sign=-1)
+        deltas.add(order, new_status, items[order.id])
+    deltas.apply()
+
+
+@contextmanager
+def archiving():
+    """Delete orders in this block without taking them out of the rollup"""
+    _archiving.active = True
+    try:
+        yield
+    finally:
+        _archiving.active = False
+
+
+@receiver(pre_delete, sender=Order)
+@receiver(pre_delete, sender=ArchivedOrder)
+def remove_deleted_order(sender, instance, **kwargs):
+    """Take an order out of the rollup before it and its items are deleted"""
+    if getattr(_archiving, 'active', False):
+        return
+    deltas = Deltas()
+    deltas.add(instance, instance.status, instance.items.values_list('menu_item_id', 'quantity', 'price'), sign=-1)
+    deltas.apply()
+
+
+@transaction.atomic
+def rebuild_rollup(since=None):
+    """Recompute the rollup from hot and archived orders, for every day or
+    from ``since`` on
+
+    Returns the number of (date, status) rows written.
+    """
+    order_totals = defaultdict(lambda: [0, 0, Decimal('0')])
+    item_totals = defaultdict(lambda: [0, 0, Decimal('0')])
+    for order_model in (Order, ArchivedOrder):
+        orders = order_model.objects.all()
+        items = order_model._meta.get_field('items').related_model.objects.all()
+        if since is not None:
+            # Same local-date boundary the rollup keys use
+            start = timezone.make_aware(datetime.combine(since, time.min))
+            orders = orders.filter(created_at__gte=start)
+            items = items.filter(order__created_at__gte=start)
+
+        item_rows = (
+            items.annotate(date=TruncDate('order__created_at'))
+            .values_list('date', 'menu_item_id', 'order__status')
+            .annotate(
+                order_count=Count('order', distinct=True),
+                total_quantity=Sum('quantity'),
+                total_revenue=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            )
+            .order_by()
+        )
+        for day, menu_item_id, status, order_count, quantity, revenue in item_rows.iterator():
+            order_totals[(day, status)][1] += quantity
+            totals = item_totals[(day, menu_item_id, status)]
+            totals[0] += order_count
+            totals[1] += quantity
+            totals[2] += revenue
+
+        order_rows = (
+            orders.annotate(date=TruncDate('created_at'))
+            .values_list('date', 'status')
+            .annotate(order_count=Count('id'), total_revenue=Sum('total_amount'))
+            .order_by()
+        )
+        for day, status, order_count, revenue in order_rows.iterator():
+            totals = order_totals[(day, status)]
+            totals[0] += order_count
+            totals[2] += revenue or 0
+
+    order_sales = [
+        DailyOrderSales(date=day, status=status, orders=orders, quantity=quantity, revenue=revenue)
+        for (day, status), (orders, quantity, revenue) in order_totals.items()
+    ]
+    item_sales = [
+        DailyItemSales(
+            date=day, menu_item_id=menu_item_id, status=status, orders=orders, quantity=quantity, revenue=revenue
+        )
+        for (day, menu_item_id, status), (orders, quantity, revenue) in item_totals.items()
+    ]
+
+    stale_orders = DailyOrderSales.objects.all()
+    stale_items = DailyItemSales.objects.all()
+    if since is not None:
+        stale_orders = stale_orders.filter(date__gte=since)
+        stale_items = stale_items.filter(date__gte=since)
+    stale_orders.delete()
+    stale_items.delete()
+    DailyOrderSales.objects.bulk_create(order_sales, batch_size=500)
+    DailyItemSales.objects.bulk_create(item_sales, batch_size=500)
+    return len(order_sales)
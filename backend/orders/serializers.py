@@ -1,7 +1,18 @@
 # orders/serializers.py
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Order, OrderItem
+from core.serializers import PickupSlotSerializer
+from core.slots import SlotUnavailable, get_timing, load_of, reserve
+from .analytics import GRANULARITIES, HOURLY_MAX_DAYS, SPLITS
+from .export import FORMATS as EXPORT_FORMATS
+from .intake import defer_to_batch, run_write
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, can_transition, publish_order_created
+from .rollup import record_orders
 from menu.models import MenuItem
+from menu.popularity import record_batched_sales
 
 class OrderItemSerializer(serializers.ModelSerializer):
     menu_item_name = serializers.CharField(source='menu_item.name', read_only=True)
@@ -18,65 +29,165 @@ class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
     total_items = serializers.IntegerField(read_only=True)
+    pickup_slot = PickupSlotSerializer(read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'user', 'user_username', 'status', 'total_amount', 
-                 'total_items', 'notes', 'items', 'created_at', 'updated_at']
-        read_only_fields = ['user', 'total_amount', 'created_at', 'updated_at']
+                 'total_items', 'notes', 'items', 'pickup_slot', 'version', 'created_at', 'updated_at']
+        read_only_fields = ['user', 'total_amount', 'version', 'created_at', 'updated_at']
+
+    def validate_status(self, value):
+        if self.instance is not None and value != self.instance.status and not can_transition(self.instance.status, value):
+            raise serializers.ValidationError(f"Cannot move order from {self.instance.status} to {value}")
+        return value
+
+class ArchivedOrderItemSerializer(OrderItemSerializer):
+    class Meta(OrderItemSerializer.Meta):
+        model = ArchivedOrderItem
+
+class ArchivedOrderSerializer(OrderSerializer):
+    """Same shape as OrderSerializer, for orders moved by orders.archive"""
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    pickup_slot = None
+
+    class Meta(OrderSerializer.Meta):
+        model = ArchivedOrder
+        fields = [field for field in OrderSerializer.Meta.fields if field != 'pickup_slot']
+
+def serialize_orders(orders):
+    """Serialize a page that may mix hot and archived orders"""
+    return [
+        (ArchivedOrderSerializer if isinstance(order, ArchivedOrder) else OrderSerializer)(order).data
+        for order in orders
+    ]
 
 class OrderCreateSerializer(serializers.Serializer):
     notes = serializers.CharField(max_length=500, required=False, allow_blank=True)
+    # Start of today's pickup slot; the earliest one with room when omitted
+    pickup_time = serializers.TimeField(required=False)
 
     def create(self, validated_data):
+        """Place the order as one atomic unit with a fixed number of queries
+
+        One read of the cart lines (with their menu items), an in-memory
+        availability check and total, a pickup slot reservation when slots
+        are on, one order INSERT, one bulk INSERT of the items, then the
+        popularity counters and taking the ordered lines off the cart. The
+        writes run in ``write``, which orders.intake may run on its writer
+        thread.
+        """
         user = self.context['request'].user
         
-        # Get user's cart
-        from cart.models import Cart
-        try:
-            cart = Cart.objects.get(user=user)
-            if not cart.items.exists():
-                raise serializers.ValidationError("Cart is empty")
-        except Cart.DoesNotExist:
-            raise serializers.ValidationError("Cart not found")
-
-        # Create order
-        order = Order.objects.create(
-            user=user,
-            notes=validated_data.get('notes', ''),
-            total_amount=0
-        )
-
-        # Create order items from cart items
-        for cart_item in cart.items.all():
-            # Check if menu item is still available
-            if not cart_item.menu_item.available:
-                order.delete()  # Clean up
-                raise serializers.ValidationError(
-                    f"{cart_item.menu_item.name} is no longer available"
-                )
-            
-            OrderItem.objects.create(
-                order=order,
-                menu_item=cart_item.menu_item,
-                quantity=cart_item.quantity,
-                price=cart_item.menu_item.price
+        # Get user's cart from whichever store is configured
+        from cart.stores import get_cart_store
+        store = get_cart_store()
+        cart_items = store.get_lines(user)
+        if not cart_items:
+            raise serializers.ValidationError("Cart is empty")
+
+        # Check every menu item is still available before writing anything
+        unavailable = [item.menu_item.name for item in cart_items if not item.menu_item.available]
+        if unavailable:
+            raise serializers.ValidationError(
+                f"{', '.join(unavailable)} {'is' if len(unavailable) == 1 else 'are'} no longer available"
             )
 
-        # Calculate total amount
-        order.calculate_total()
-        
-        # Clear cart after successful order
-        cart.clear()
-        
-        return order
+        total = sum(item.menu_item.price * item.quantity for item in cart_items)
+        quantities = {item.menu_item_id: item.quantity for item in cart_items}
+        timing = get_timing()
+
+        def write():
+            with transaction.atomic():
+                slot, load = None, 0
+                if timing is not None:
+                    load = load_of(timing, [(item.menu_item, item.quantity) for item in cart_items])
+                    try:
+                        slot = reserve(timing, timezone.localdate(), load, validated_data.get('pickup_time'))
+                    except SlotUnavailable as e:
+                        raise serializers.ValidationError(str(e))
+
+                order = Order.objects.create(
+                    user=user,
+                    notes=validated_data.get('notes', ''),
+                    total_amount=total,
+                    pickup_slot=slot,
+                    slot_load=load if slot else 0,
+                )
+                order_items = OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        menu_item=item.menu_item,
+                        quantity=item.quantity,
+                        price=item.menu_item.price
+                    )
+                    for item in cart_items
+                ])
+
+                # Shared by every order of an intake batch
+                defer_to_batch('popularity', (quantities, order.created_at), record_batched_sales)
+                defer_to_batch('rollup', (order, order_items), record_orders)
+
+                # Only what was ordered: lines added since the read above stay
+                store.remove_ordered(user, cart_items)
+                publish_order_created(order, order_items)
+            return order
+
+        # Straight away, or batched with other placements by orders.intake
+        return run_write(write)
 
 class OrderStatusUpdateSerializer(serializers.ModelSerializer):
+    # Optional, the update is refused if the order has moved on since
+    version = serializers.IntegerField(required=False, min_value=1)
+
     class Meta:
         model = Order
-        fields = ['status']
+        fields = ['status', 'version']
+        extra_kwargs = {'status': {'required': True}}
 
     def validate_status(self, value):
         if value not in ['CONFIRMED', 'PREPARING', 'READY', 'DELIVERED', 'CANCELLED']:
             raise serializers.ValidationError("Invalid status")
-        return value
\ No newline at end of file
+        return value
+
+class OrderTransitionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    version = serializers.IntegerField(required=False, min_value=1)
+
+class BulkOrderStatusSerializer(serializers.Serializer):
+    orders = OrderTransitionSerializer(many=True, allow_empty=False, max_length=500)
+
+class SalesAnalyticsQuerySerializer(serializers.Serializer):
+    """Query parameters of the sales analytics endpoint"""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    granularity = serializers.ChoiceField(choices=GRANULARITIES, default='day')
+    split = serializers.ChoiceField(choices=SPLITS, required=False)
+    include_cancelled = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        end = data.get('end') or timezone.localdate()
+        start = data.get('start') or end - timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError("start must not be after end")
+        if data['granularity'] == 'hour' and (end - start).days >= HOURLY_MAX_DAYS:
+            raise serializers.ValidationError(f"Hourly buckets are limited to {HOURLY_MAX_DAYS} days")
+        data['start'], data['end'] = start, end
+        return data
+
+class OrderExportQuerySerializer(serializers.Serializer):
+    """Query parameters of the order export endpoint"""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.MultipleChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    user = serializers.IntegerField(min_value=1, required=False)
+    # Not "format", DRF reads that one to pick a renderer
+    output = serializers.ChoiceField(choices=list(EXPORT_FORMATS), default='csv')
+    gzip = serializers.BooleanField(default=False)
+    include_archived = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end")
+        return data
@@ -1,3 +1,539 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from cart.models import CartItem
+from core.query_budget import assert_max_queries, get_query_budget
+from cart.stores import DatabaseCartStore
+from core.models import CanteenTiming, OutboundEmail, PickupSlot
+from menu.models import MenuItem
+
+from .archive import archive_batch, archive_orders
+from .intake import IntakeTimeout
+from .models import ArchivedOrder, DailyItemSales, DailyOrderSales, Order, OrderItem
+from .pagination import OrderCursorPagination
+from .rollup import ROLLUP_FIELDS, rebuild_rollup
+
+
+class OrderCursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        now = timezone.now()
+        # Pairs of orders share a timestamp, so pages break inside ties
+        orders = Order.objects.bulk_create([Order(user=cls.user, total_amount=1) for _ in range(25)])
+        for number, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(minutes=number // 2))
+
+    def paginate(self, params):
+        paginator = OrderCursorPagination()
+        request = Request(APIRequestFactory().get('/api/orders/', params))
+        return paginator, paginator.paginate_queryset(Order.objects.all(), request)
+
+    def test_pages_walk_every_order_once_in_order(self):
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        seen = []
+        params = {'page_size': 3}
+        while True:
+            paginator, page = self.paginate(params)
+            seen += [order.id for order in page]
+            if not paginator.has_next:
+                break
+            params['cursor'] = paginator.next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_cursor_filter_seeks_the_index(self):
+        order = Order.objects.order_by('-created_at', '-id')[5]
+        paginator = OrderCursorPagination()
+        for queryset, index in (
+            (Order.objects.all(), 'order_created_id_idx'),
+            (Order.objects.filter(user=self.user), 'order_user_created_id_idx'),
+        ):
+            queryset = paginator.filter_after(queryset.order_by(*paginator.ordering), order.created_at, order.pk)
+            self.assertIn(f'SEARCH orders_order USING INDEX {index}', queryset[:21].explain())
+            self.assertIn('created_at<?', queryset[:21].explain())
+
+
+class PlaceOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.00')
+        cls.cake = MenuItem.objects.create(name='Cake', price='3.00')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_lines_added_while_placing_stay_in_the_cart(self):
+        CartItem.objects.add_quantity(self.user, self.tea, 2)
+        get_lines = DatabaseCartStore.get_lines
+
+        def get_lines_then_add(store, user):
+            lines = get_lines(store, user)
+            # Another request adds to the cart right after the read
+            CartItem.objects.add_quantity(user, self.tea, 1)
+            CartItem.objects.add_quantity(user, self.cake, 1)
+            return lines
+
+        with mock.patch.object(DatabaseCartStore, 'get_lines', get_lines_then_add):
+            response = self.client.post('/api/orders/place/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get()
+        self.assertEqual(list(order.items.values_list('menu_item_id', 'quantity')), [(self.tea.pk, 2)])
+        cart = dict(CartItem.objects.filter(cart__user=self.user).values_list('menu_item_id', 'quantity'))
+        self.assertEqual(cart, {self.tea.pk: 1, self.cake.pk: 1})
+
+    def test_placing_an_order_empties_the_cart(self):
+        CartItem.objects.add_quantity(self.user, self.tea, 2)
+        CartItem.objects.add_quantity(self.user, self.cake, 1)
+        response = self.client.post('/api/orders/place/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+        self.assertEqual(Order.objects.get().total_amount, 5)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        menu_items = MenuItem.objects.bulk_create([
+            MenuItem(name=f'Item {number}', price='2.00') for number in range(50)
+        ])
+        CartItem.objects.add_quantity(self.user, menu_items[0], 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post('/api/orders/place/', {}, format='json').status_code, 201)
+
+        for menu_item in menu_items:
+            CartItem.objects.add_quantity(self.user, menu_item, 2)
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.client.post('/api/orders/place/', {}, format='json').status_code, 201)
+        self.assertEqual(Order.objects.latest('pk').items.count(), 50)
+
+
+class OrderPickupSlotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.00')
+        CanteenTiming.objects.create(opening_time=time(9), closing_time=time(12), slot_minutes=60, slot_capacity=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Before opening, so every slot of the day is still open
+        eight = timezone.make_aware(datetime.combine(timezone.localdate(), time(8)))
+        patcher = mock.patch('django.utils.timezone.now', return_value=eight)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def place(self, quantity, pickup_time=None):
+        CartItem.objects.add_quantity(self.user, self.tea, quantity)
+        response = self.client.post('/api/orders/place/', {'pickup_time': pickup_time} if pickup_time else {}, format='json')
+        CartItem.objects.filter(cart__user=self.user).delete()
+        return response
+
+    def reserved(self):
+        return dict(PickupSlot.objects.values_list('start', 'reserved'))
+
+    def test_placing_reserves_a_slot_and_is_refused_at_capacity(self):
+        response = self.place(4)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['order']['pickup_slot']['start'], '09:00')
+        self.assertEqual(self.place(3).data['order']['pickup_slot']['start'], '10:00')
+
+        response = self.place(2, '09:00')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('The 09:00 pickup slot is full', str(response.data))
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(self.reserved(), {time(9): 4, time(10): 3, time(11): 0})
+
+    def test_cancelling_releases_the_slot(self):
+        first = self.place(4).data['order']['id']
+        second = self.place(5).data['order']['id']
+        self.assertEqual(self.client.post(f'/api/orders/{first}/cancel/').status_code, 200)
+        self.assertEqual(self.reserved()[time(9)], 0)
+
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        response = admin.patch(f'/api/orders/admin/{second}/update-status/', {'status': 'CANCELLED'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.reserved(), {time(9): 0, time(10): 0, time(11): 0})
+        # Cancelled twice is refused and gives nothing back again
+        self.assertEqual(self.client.post(f'/api/orders/{first}/cancel/').status_code, 400)
+        self.assertEqual(self.reserved()[time(9)], 0)
+
+
+@override_settings(ORDER_INTAKE_QUEUE=True)
+class QueuedPlaceOrderTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        self.tea = MenuItem.objects.create(name='Tea', price='1.00')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def place(self, key):
+        return self.client.post('/api/orders/place/', {}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_idempotent_placement_commits_through_the_writer(self):
+        CartItem.objects.add_quantity(self.user, self.tea, 2)
+        response = self.place('first')
+        self.assertEqual(response.status_code, 201, response.data)
+        retry = self.place('first')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, response.data)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+
+    def test_busy_writer_is_a_retryable_503(self):
+        CartItem.objects.add_quantity(self.user, self.tea, 2)
+        with mock.patch('orders.serializers.run_write', side_effect=IntakeTimeout('busy')):
+            self.assertEqual(self.place('busy').status_code, 503)
+        self.assertEqual(self.place('busy').status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class OrderAdminActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+
+    def test_bulk_status_action_emails_each_customer(self):
+        orders = [Order.objects.create(user=self.user, total_amount=10) for _ in range(2)]
+        delivered = Order.objects.create(user=self.user, total_amount=10, status='DELIVERED')
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/admin/orders/order/', {
+                'action': 'mark_as_confirmed',
+                '_selected_action': [order.pk for order in orders + [delivered]],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.filter(status='CONFIRMED').count(), 2)
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('subject', flat=True)),
+            [f'Order Status Update - Order #{order.pk}' for order in orders],
+        )
+        self.assertEqual(OutboundEmail.objects.first().recipients, ['pat@example.com'])
+
+
+class OrderArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.other = User.objects.create_user('sam', 'sam@example.com', 'pw')
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.50')
+        cls.cake = MenuItem.objects.create(name='Cake', price='3.00')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_order(self, status, days_ago, user=None, created_at=None):
+        order = Order.objects.create(user=user or self.user, status=status, total_amount='6.00')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menu_item=self.tea, quantity=2, price='1.50'),
+            OrderItem(order=order, menu_item=self.cake, quantity=1, price='3.00'),
+        ])
+        created_at = created_at or timezone.now() - timedelta(days=days_ago)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        order.created_at = created_at
+        return order
+
+    def test_archiving_moves_old_completed_orders_with_their_items(self):
+        delivered = [self.add_order('DELIVERED', 100 + number) for number in range(3)]
+        cancelled = self.add_order('CANCELLED', 120, user=self.other)
+        active = self.add_order('PREPARING', 200)
+        recent = self.add_order('DELIVERED', 10)
+        # The newest order keeps its id in the hot table
+        newest = self.add_order('DELIVERED', 150)
+        items = {
+            order.pk: sorted(order.items.values_list('id', 'menu_item_id', 'quantity', 'price'))
+            for order in delivered + [cancelled]
+        }
+
+        self.assertEqual(list(archive_orders(90, batch_size=3)), [3, 1])
+
+        moved = [order.pk for order in delivered + [cancelled]]
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), sorted(moved))
+        self.assertEqual(sorted(Order.objects.values_list('id', flat=True)), sorted([active.pk, recent.pk, newest.pk]))
+        self.assertFalse(OrderItem.objects.filter(order_id__in=moved).exists())
+        for order_id, lines in items.items():
+            archived = ArchivedOrder.objects.get(pk=order_id)
+            self.assertEqual(sorted(archived.items.values_list('id', 'menu_item_id', 'quantity', 'price')), lines)
+        self.assertEqual(ArchivedOrder.objects.get(pk=cancelled.pk).user, self.other)
+        self.assertEqual(list(archive_orders(90)), [])
+
+    def test_archive_batch_skips_orders_that_are_not_completed(self):
+        active = self.add_order('READY', 100)
+        delivered = self.add_order('DELIVERED', 100)
+        self.add_order('PLACED', 0)
+        self.assertEqual(archive_batch([active.pk, delivered.pk]), 1)
+        self.assertTrue(Order.objects.filter(pk=active.pk, items__isnull=False).exists())
+        self.assertEqual(list(ArchivedOrder.objects.values_list('id', flat=True)), [delivered.pk])
+
+    def test_history_pages_through_both_tables(self):
+        # Alternating hot and archived orders, two sharing a timestamp
+        shared = timezone.now() - timedelta(days=150)
+        orders = [self.add_order('DELIVERED' if number % 2 else 'CONFIRMED', 100 + number) for number in range(23)]
+        orders += [self.add_order(status, 0, created_at=shared) for status in ('DELIVERED', 'READY')]
+        self.add_order('DELIVERED', 130, user=self.other)
+        self.add_order('PLACED', 0)
+        archive_batch([order.pk for order in orders])
+        self.assertEqual(ArchivedOrder.objects.filter(user=self.user).count(), 12)
+
+        expected = sorted(
+            [*Order.objects.filter(user=self.user).values_list('created_at', 'id'),
+             *ArchivedOrder.objects.filter(user=self.user).values_list('created_at', 'id')],
+            reverse=True,
+        )
+        seen = []
+        cursor = None
+        for _ in range(10):
+            params = {'page_size': 4, 'count': 'true', **({'cursor': cursor} if cursor else {})}
+            response = self.client.get('/api/orders/history/', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['total_orders'], len(expected))
+            seen += [order['id'] for order in response.data['orders']]
+            cursor = response.data['next_cursor']
+            if not response.data['has_next']:
+                break
+        self.assertEqual(seen, [order_id for _, order_id in expected])
+
+    def test_order_detail_falls_back_to_the_archive(self):
+        archived = self.add_order('DELIVERED', 100)
+        theirs = self.add_order('DELIVERED', 100, user=self.other)
+        self.add_order('PLACED', 0)
+        archive_batch([archived.pk, theirs.pk])
+
+        response = self.client.get(f'/api/orders/{archived.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['id'], response.data['status']), (archived.pk, 'DELIVERED'))
+        self.assertEqual(
+            sorted((item['menu_item'], item['quantity']) for item in response.data['items']),
+            sorted([(self.tea.pk, 2), (self.cake.pk, 1)]),
+        )
+        self.assertEqual(self.client.get(f'/api/orders/{theirs.pk}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/orders/999999/').status_code, 404)
+
+
+class SalesRollupTests(TestCase):
+    """The incrementally kept rollup matches a rebuild from the orders"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.other = User.objects.create_user('sam', 'sam@example.com', 'pw')
+        cls.tea = MenuItem.objects.create(name='Tea', price='1.50')
+        cls.cake = MenuItem.objects.create(name='Cake', price='3.00')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def place(self, user, *lines):
+        for menu_item, quantity in lines:
+            CartItem.objects.add_quantity(user, menu_item, quantity)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/orders/place/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.latest('pk')
+
+    def rollup(self):
+        """Both tables without the all-zero rows left behind by moves"""
+        return (
+            sorted(DailyOrderSales.objects.exclude(orders=0).values_list('date', 'status', *ROLLUP_FIELDS)),
+            sorted(DailyItemSales.objects.exclude(orders=0).values_list('date', 'menu_item', 'status', *ROLLUP_FIELDS)),
+        )
+
+    def assertRollupMatchesRebuild(self):
+        live = self.rollup()
+        rebuild_rollup()
+        self.assertEqual(live, self.rollup())
+
+    def test_rollup_matches_a_rebuild_after_changes(self):
+        api = APIClient()
+        api.force_authenticate(self.admin)
+        placed = [
+            self.place(self.user, (self.tea, 2), (self.cake, 1)),
+            self.place(self.user, (self.tea, 1)),
+            self.place(self.other, (self.cake, 3)),
+            self.place(self.other, (self.tea, 4), (self.cake, 2)),
+            self.place(self.user, (self.cake, 1)),
+        ]
+        self.assertRollupMatchesRebuild()
+
+        customer = APIClient()
+        customer.force_authenticate(self.user)
+        self.assertEqual(customer.post(f'/api/orders/{placed[1].pk}/cancel/').status_code, 200)
+        response = api.patch(f'/api/orders/admin/{placed[0].pk}/update-status/', {'status': 'CONFIRMED'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/admin/orders/order/', {
+            'action': 'mark_as_delivered', '_selected_action': [placed[2].pk, placed[3].pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertRollupMatchesRebuild()
+
+        # Status edit on the admin change form
+        items = list(placed[4].items.all())
+        response = self.client.post(f'/admin/orders/order/{placed[4].pk}/change/', {
+            'user': self.user.pk, 'status': 'PREPARING', 'notes': '',
+            'items-TOTAL_FORMS': len(items), 'items-INITIAL_FORMS': len(items),
+            'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+            **{f'items-{number}-id': item.pk for number, item in enumerate(items)},
+            **{f'items-{number}-order': placed[4].pk for number in range(len(items))},
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(pk=placed[4].pk).status, 'PREPARING')
+        self.assertRollupMatchesRebuild()
+
+    def test_deleted_orders_leave_the_rollup(self):
+        first = self.place(self.user, (self.tea, 2), (self.cake, 1))
+        self.place(self.user, (self.tea, 1))
+        second = self.place(self.other, (self.cake, 3))
+        self.place(self.other, (self.tea, 1))
+
+        # Archived orders are still counted, until they are deleted
+        Order.objects.filter(pk=second.pk).update(status='DELIVERED')
+        DailyOrderSales.objects.all().delete()
+        DailyItemSales.objects.all().delete()
+        rebuild_rollup()
+        self.assertEqual(archive_batch([second.pk]), 1)
+        self.assertRollupMatchesRebuild()
+
+        response = self.client.post(f'/admin/orders/order/{first.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertRollupMatchesRebuild()
+
+        ArchivedOrder.objects.get(pk=second.pk).delete()
+        self.assertRollupMatchesRebuild()
+
+        # Cascade from the customer's account
+        self.other.delete()
+        self.assertRollupMatchesRebuild()
+        self.user.delete()
+        self.assertEqual(self.rollup(), ([], []))
+
+
+class OrderQueryBudgetTests(TestCase):
+    """Order views stay within their declared query budgets, whatever the data
+    size, and each budget is what the view's most expensive path runs"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pat', 'pat@example.com', 'pw')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(name=f'Item {number}', price='2.00') for number in range(5)
+        ])
+
+    def setUp(self):
+        # {view name: (most queries seen, budget)}
+        self.counts = {}
+
+    def client_for(self, user):
+        client = APIClient()
+        # Real JWT authentication, its user lookup counts against the budget
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def add_orders(self, count, items_per_order, **fields):
+        orders = [Order.objects.create(user=self.user, total_amount=10, **fields) for _ in range(count)]
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menu_item=menu_item, quantity=2, price=menu_item.price)
+            for order in orders
+            for menu_item in self.menu_items[:items_per_order]
+        ])
+        return orders
+
+    def request(self, user, method, url, data=None, **headers):
+        """Send the request, failing if it runs more queries than its view's budget"""
+        match = resolve(url.split('?')[0])
+        limit = get_query_budget(match.func)
+        self.assertIsNotNone(limit, f'{url} has no query budget')
+        client = self.client_for(user)
+        with CaptureQueriesContext(connection) as queries:
+            with assert_max_queries(limit, label=f'{method} {url}'):
+                response = getattr(client, method.lower())(url, data, format='json', headers=headers)
+                if response.streaming:
+                    # Streamed responses query while they are read
+                    b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+        most = self.counts.get(match.view_name, (0, limit))[0]
+        self.counts[match.view_name] = (max(most, len(queries)), limit)
+        return len(queries)
+
+    def assertBudgetsAreTight(self):
+        """A budget above what its view runs would hide a regression"""
+        self.assertEqual(
+            {name: count for name, (count, _) in self.counts.items()},
+            {name: limit for name, (_, limit) in self.counts.items()},
+        )
+
+    def read_counts(self, order):
+        # Analytics results are cached, count the uncached path
+        cache.clear()
+        return [
+            self.request(self.user, 'GET', '/api/orders/'),
+            self.request(self.user, 'GET', '/api/orders/?count=true'),
+            self.request(self.user, 'GET', '/api/orders/history/'),
+            self.request(self.user, 'GET', '/api/orders/history/?count=true'),
+            self.request(self.user, 'GET', f'/api/orders/{order.pk}/'),
+            self.request(self.admin, 'GET', '/api/orders/admin/'),
+            self.request(self.admin, 'GET', '/api/orders/admin/?count=true'),
+            self.request(self.admin, 'GET', f'/api/orders/admin/{order.pk}/'),
+            self.request(self.admin, 'GET', '/api/orders/admin/summary/today/'),
+            self.request(self.admin, 'GET', '/api/orders/admin/analytics/sales/'),
+            self.request(self.admin, 'GET', '/api/orders/admin/analytics/sales/?granularity=hour&split=item'),
+            self.request(self.admin, 'GET', '/api/orders/admin/analytics/sales/?split=category'),
+            self.request(self.admin, 'GET', '/api/orders/admin/analytics/sales/?granularity=hour&split=category'),
+            self.request(self.admin, 'GET', '/api/orders/admin/analytics/sales/?granularity=month&split=item&include_cancelled=true'),
+            self.request(self.admin, 'GET', '/api/orders/admin/export/'),
+        ]
+
+    def test_reads_stay_within_budget_as_orders_grow(self):
+        old = timezone.now() - timedelta(days=200)
+        archived = self.add_orders(3, 2, status='DELIVERED')
+        Order.objects.filter(pk__in=[order.pk for order in archived]).update(created_at=old)
+        order = self.add_orders(1, 1)[0]
+        archive_batch([order.pk for order in archived])
+
+        small = self.read_counts(order)
+        self.add_orders(12, 5)
+        self.assertEqual(self.read_counts(order), small)
+        self.request(self.user, 'GET', f'/api/orders/{archived[0].pk}/')
+        # Its budget is set by updates, see the writes test
+        del self.counts['admin-order-detail']
+        self.assertBudgetsAreTight()
+
+    def test_writes_stay_within_budget(self):
+        # The most expensive placement: pickup slots on and a key to store
+        CanteenTiming.objects.create(opening_time='00:00', closing_time='23:59', slot_capacity=100)
+        noon = timezone.make_aware(datetime.combine(timezone.localdate(), time(12)))
+        for menu_item in self.menu_items:
+            CartItem.objects.add_quantity(self.user, menu_item, 3)
+        with mock.patch('django.utils.timezone.now', return_value=noon):
+            self.request(self.user, 'POST', '/api/orders/place/', {'notes': 'No sugar'}, Idempotency_Key='place')
+        placed = Order.objects.get()
+        self.assertIsNotNone(placed.pickup_slot)
+
+        first, second, *others = self.add_orders(7, 5, pickup_slot=placed.pickup_slot, slot_load=1)
+        PickupSlot.objects.filter(pk=placed.pickup_slot_id).update(reserved=placed.slot_load + 7)
+        self.request(self.user, 'POST', f'/api/orders/{first.pk}/cancel/', Idempotency_Key='cancel')
+        self.request(self.admin, 'PATCH', f'/api/orders/admin/{placed.pk}/update-status/', {'status': 'CANCELLED'})
+        self.request(self.admin, 'PATCH', f'/api/orders/admin/{second.pk}/', {'status': 'CANCELLED'})
+        # One UPDATE per target status
+        targets = ['CONFIRMED', 'PREPARING', 'READY', 'DELIVERED', 'CANCELLED']
+        self.request(self.admin, 'POST', '/api/orders/admin/status/bulk/', {'orders': [
+            {'id': order.pk, 'status': target} for order, target in zip(others, targets)
+        ]})
+        self.assertBudgetsAreTight()
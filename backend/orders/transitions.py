@@ -0,0 +1,102 @@
+# orders/transitions.py
+"""Validated order status changes, one or many at a time.
+
+``transition_orders`` checks each requested move against the state machine
+in ``orders.models`` (and an optional expected version), then writes one
+conditional UPDATE per target status. It updates the sales rollup in the
+same transaction. Kitchen events and customer emails are queued in bulk to
+go out after commit.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.mail import queue_mass_mail
+from core.slots import release
+
+from .models import Order, allowed_sources, publish_status_changes
+from .rollup import record_transitions
+
+
+class TransitionConflict(Exception):
+    """Orders changed between reading and updating them"""
+
+
+def status_email(order):
+    return (
+        f'Order Status Update - Order #{order.id}',
+        f'Your order #{order.id} status has been updated to: {order.get_status_display()}',
+        [order.user.email],
+    )
+
+
+def release_pickup_slots(orders):
+    """Give the pickup slot capacity of cancelled orders back"""
+    loads = defaultdict(int)
+    for order in orders:
+        loads[order.pickup_slot_id] += order.slot_load
+    release(loads)
+
+
+def transition_orders(changes, queryset=None, allowed_from=None, email=True):
+    """Apply ``(order_id, target_status, expected_version)`` changes
+
+    ``expected_version`` may be None to skip the version check. Orders are
+    looked up in ``queryset`` (all orders by default) and ``allowed_from``
+    narrows the statuses a move may start from. Returns ``(updated,
+    rejected)``: the changed orders, and dicts describing refused changes.
+    """
+    requested = {order_id: (target, version) for order_id, target, version in changes}
+    queryset = Order.objects.all() if queryset is None else queryset
+    updated = []
+    rejected = []
+
+    with transaction.atomic():
+        orders = queryset.filter(id__in=requested).select_related('user').select_for_update(of=('self',)).only(
+            'id', 'status', 'version', 'created_at', 'total_amount', 'pickup_slot', 'slot_load', 'user__email'
+        )
+        orders = {order.id: order for order in orders}
+
+        by_target = defaultdict(list)
+        for order_id, (target, version) in requested.items():
+            order = orders.get(order_id)
+            if order is None:
+                error = 'Order not found'
+            elif version is not None and version != order.version:
+                error = 'Order was changed by someone else'
+            elif order.status == target:
+                error = f'Order is already {order.get_status_display()}'
+            elif order.status not in allowed_sources(target) or (allowed_from and order.status not in allowed_from):
+                error = f'Cannot move order from {order.status} to {target}'
+            else:
+                by_target[target].append(order)
+                continue
+            rejection = {'id': order_id, 'error': error}
+            if order is not None:
+                rejection.update(status=order.status, version=order.version)
+            rejected.append(rejection)
+
+        record_transitions([(order, target) for target, group in by_target.items() for order in group])
+        now = timezone.now()
+        for target, group in by_target.items():
+            sources = [status for status in allowed_sources(target) if not allowed_from or status in allowed_from]
+            count = Order.objects.filter(id__in=[order.id for order in group], status__in=sources).update(
+                status=target, version=F('version') + 1, updated_at=now
+            )
+            if count != len(group):
+                raise TransitionConflict("Orders changed while updating their status, try again")
+            if target == 'CANCELLED':
+                release_pickup_slots(group)
+            for order in group:
+                order.status = target
+                order.version += 1
+                order.updated_at = now
+                updated.append(order)
+
+        publish_status_changes(updated)
+        if email:
+            queue_mass_mail([status_email(order) for order in updated])
+
+    return updated, rejected
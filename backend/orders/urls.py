@@ -13,6 +13,10 @@ urlpatterns = [
     # Admin order endpoints
     path('admin/', views.AdminOrderListView.as_view(), name='admin-order-list'),
     path('admin/<int:pk>/', views.AdminOrderDetailView.as_view(), name='admin-order-detail'),
+    path('admin/events/', views.kitchen_events, name='kitchen-events'),
     path('admin/<int:order_id>/update-status/', views.update_order_status, name='update-order-status'),
+    path('admin/status/bulk/', views.bulk_update_order_status, name='bulk-update-order-status'),
     path('admin/summary/today/', views.daily_order_summary, name='daily-order-summary'),
+    path('admin/analytics/sales/', views.sales_analytics, name='sales-analytics'),
+    path('admin/export/', views.export_orders, name='export-orders'),
 ]
\ No newline at end of file
@@ -4,41 +4,89 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils.timezone import now
-from django.db.models import Sum, Count, Q
-from django.core.mail import send_mail
-from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.timezone import localdate
+from django.db import DatabaseError, transaction
+from django.db.models import F, Sum, Q
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 
-from .models import Order, OrderItem
+from core.events import sse_stream
+from core.idempotency import idempotent
+from core.mail import queue_mail
+from core.query_budget import query_budget
+from core.streaming import SyncStreamingHttpResponse
+
+from .models import (
+    ACTIVE_STATUSES,
+    KITCHEN_EVENTS_CHANNEL,
+    ArchivedOrder,
+    DailyItemSales,
+    DailyOrderSales,
+    Order,
+    OrderItem,
+    kitchen_payload,
+    publish_status_changes,
+)
+from .analytics import cached_sales_series
+from .export import FORMATS as EXPORT_FORMATS, export_filename, export_rows, export_stream
+from .intake import IntakeTimeout, intake_enabled
+from .rollup import record_status_changes
+from .transitions import TransitionConflict, release_pickup_slots, transition_orders
+from .pagination import OrderCursorPagination
 from .serializers import (
     OrderSerializer, 
+    ArchivedOrderSerializer,
     OrderCreateSerializer, 
     OrderStatusUpdateSerializer,
-    OrderItemSerializer
+    OrderItemSerializer,
+    BulkOrderStatusSerializer,
+    SalesAnalyticsQuerySerializer,
+    OrderExportQuerySerializer,
+    serialize_orders,
 )
 
 class CustomerOrderListView(generics.ListAPIView):
-    """List all orders for the authenticated customer"""
+    """List all orders for the authenticated customer, newest first"""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    query_budget = 4
+    pagination_class = OrderCursorPagination
+    filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status']
-    ordering_fields = ['created_at', 'total_amount']
-    ordering = ['-created_at']
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).for_display()
 
 class CustomerOrderDetailView(generics.RetrieveAPIView):
     """Get specific order details for the authenticated customer"""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    # Archived orders cost one more query after missing the hot table
+    query_budget = 4
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).for_display()
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            order = get_object_or_404(
+                ArchivedOrder.objects.filter(user=request.user).for_display(), pk=kwargs['pk']
+            )
+            return Response(ArchivedOrderSerializer(order).data)
 
+# Budgets of idempotent views include claiming and storing the key, and
+# those of placing and cancelling a pickup slot reservation
+@query_budget(34)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+# Queued placements commit on the writer thread, which a transaction held
+# open by this request would block
+@idempotent(atomic=lambda: not intake_enabled())
 def place_order(request):
     """Place order from cart items"""
     serializer = OrderCreateSerializer(data=request.data, context={'request': request})
@@ -46,24 +94,25 @@ def place_order(request):
     if serializer.is_valid():
         try:
             order = serializer.save()
+            order = Order.objects.for_display().get(pk=order.pk)
             
-            # Send order confirmation email (optional)
-            try:
-                send_mail(
-                    subject=f'Order Confirmation - Order #{order.id}',
-                    message=f'Thank you for your order! Your order #{order.id} has been placed successfully. Total amount: ₹{order.total_amount}',
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[request.user.email],
-                    fail_silently=True
-                )
-            except:
-                pass  # Email sending is optional
+            # Queue order confirmation email, sent by `manage.py send_queued_mail`
+            queue_mail(
+                subject=f'Order Confirmation - Order #{order.id}',
+                message=f'Thank you for your order! Your order #{order.id} has been placed successfully. Total amount: ₹{order.total_amount}',
+                recipient_list=[request.user.email]
+            )
             
             return Response({
                 'message': 'Order placed successfully',
                 'order': OrderSerializer(order).data
             }, status=status.HTTP_201_CREATED)
             
+        except (DatabaseError, IntakeTimeout):
+            # Locked or busy database, the same request may go through later
+            return Response({
+                'error': 'Could not place the order right now, please retry'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             return Response({
                 'error': str(e)
@@ -71,20 +120,34 @@ def place_order(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@query_budget(23)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def cancel_order(request, order_id):
     """Cancel order if it's still in PLACED or CONFIRMED status"""
     try:
-        order = Order.objects.get(id=order_id, user=request.user)
+        order = Order.objects.for_display().get(id=order_id, user=request.user)
         
         if order.status not in ['PLACED', 'CONFIRMED']:
             return Response({
                 'error': 'Order cannot be cancelled at this stage'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        order.status = 'CANCELLED'
-        order.save()
+        try:
+            updated, rejected = transition_orders(
+                [(order.id, 'CANCELLED', None)],
+                queryset=Order.objects.filter(user=request.user),
+                allowed_from=('PLACED', 'CONFIRMED'),
+                email=False,
+            )
+        except TransitionConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        if rejected:
+            return Response({
+                'error': 'Order cannot be cancelled at this stage'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        order.status, order.version, order.updated_at = updated[0].status, updated[0].version, updated[0].updated_at
         
         return Response({
             'message': 'Order cancelled successfully',
@@ -98,81 +161,172 @@ def cancel_order(request, order_id):
 
 # Admin Views
 class AdminOrderListView(generics.ListAPIView):
-    """Admin view to list all orders with filtering"""
+    """Admin view to list all orders with filtering, newest first"""
     serializer_class = OrderSerializer
     permission_classes = [IsAdminUser]
-    queryset = Order.objects.all()
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    query_budget = 4
+    queryset = Order.objects.for_display()
+    pagination_class = OrderCursorPagination
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['status', 'user']
     search_fields = ['user__username', 'user__email']
-    ordering_fields = ['created_at', 'total_amount', 'status']
-    ordering = ['-created_at']
 
 class AdminOrderDetailView(generics.RetrieveUpdateAPIView):
     """Admin view to get and update order details"""
     serializer_class = OrderSerializer
     permission_classes = [IsAdminUser]
-    queryset = Order.objects.all()
+    query_budget = 15
+    queryset = Order.objects.for_display()
+
+    def update(self, request, *args, **kwargs):
+        # Items are read-only here, so unlike UpdateModelMixin keep the
+        # prefetched items for the response instead of reloading them
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
+
+    def perform_update(self, serializer):
+        order = serializer.instance
+        new_status = serializer.validated_data.get('status', order.status)
+        status_changed = new_status != order.status
+        with transaction.atomic():
+            record_status_changes([order], new_status)
+            if status_changed:
+                serializer.save(version=order.version + 1)
+                if new_status == 'CANCELLED':
+                    release_pickup_slots([order])
+            else:
+                serializer.save()
+        if status_changed:
+            publish_status_changes([order])
+
+def active_kitchen_orders():
+    """Snapshot of orders between PLACED and READY, oldest first"""
+    orders = (
+        Order.objects.filter(status__in=ACTIVE_STATUSES)
+        .for_display()
+        .order_by('created_at', 'id')
+    )
+    return [kitchen_payload(order, order.items.all()) for order in orders]
+
+def _kitchen_user(request):
+    # DRF authentication does not run for plain async views
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        authenticated = None
+    return authenticated[0] if authenticated else request.user
+
+async def kitchen_events(request):
+    """Server-Sent Events feed for kitchen screens, replaces polling the admin list
 
+    Sends an 'orders.snapshot' of active orders on connect, then
+    'order.created' and 'order.status' deltas. Needs an ASGI server (see
+    canteen_cms/asgi.py) and an admin JWT or session.
+    """
+    user = await sync_to_async(_kitchen_user)(request)
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication credentials were not provided'}, status=401)
+    if not user.is_staff:
+        return JsonResponse({'error': 'Admin access required'}, status=403)
+
+    async def snapshot():
+        orders = await sync_to_async(active_kitchen_orders)()
+        return [{'type': 'orders.snapshot', 'orders': orders}]
+
+    response = StreamingHttpResponse(
+        sse_stream(KITCHEN_EVENTS_CHANNEL, snapshot=snapshot),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@query_budget(17)
 @api_view(['PATCH'])
 @permission_classes([IsAdminUser])
 def update_order_status(request, order_id):
-    """Admin endpoint to update order status"""
+    """Admin endpoint to move one order to a new status"""
+    serializer = OrderStatusUpdateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     try:
-        order = Order.objects.get(id=order_id)
-        serializer = OrderStatusUpdateSerializer(order, data=request.data, partial=True)
-        
-        if serializer.is_valid():
-            serializer.save()
-            
-            # Send status update email to customer (optional)
-            try:
-                send_mail(
-                    subject=f'Order Status Update - Order #{order.id}',
-                    message=f'Your order #{order.id} status has been updated to: {order.get_status_display()}',
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[order.user.email],
-                    fail_silently=True
-                )
-            except:
-                pass
-            
+        updated, rejected = transition_orders([
+            (order_id, serializer.validated_data['status'], serializer.validated_data.get('version'))
+        ])
+    except TransitionConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    if rejected:
+        if 'status' not in rejected[0]:
             return Response({
-                'message': 'Order status updated successfully',
-                'order': OrderSerializer(order).data
-            })
-        
+                'error': 'Order not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        return Response({'error': rejected[0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'message': 'Order status updated successfully',
+        'order': OrderSerializer(Order.objects.for_display().get(id=order_id)).data
+    })
+
+# Covers a change to each of the five target statuses
+@query_budget(19)
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_update_order_status(request):
+    """Move many orders at once, e.g. {"orders": [{"id": 1, "status": "READY", "version": 3}]}
+
+    Each change is checked against the allowed transitions (and the version
+    when given). Returns the changed orders with their new versions and the
+    refused changes with a reason.
+    """
+    serializer = BulkOrderStatusSerializer(data=request.data)
+    if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-    except Order.DoesNotExist:
-        return Response({
-            'error': 'Order not found'
-        }, status=status.HTTP_404_NOT_FOUND)
 
+    try:
+        updated, rejected = transition_orders(
+            (change['id'], change['status'], change.get('version'))
+            for change in serializer.validated_data['orders']
+        )
+    except TransitionConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+
+    return Response({
+        'updated': [{'id': order.id, 'status': order.status, 'version': order.version} for order in updated],
+        'rejected': rejected,
+    })
+
+@query_budget(4)
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def daily_order_summary(request):
     """Get daily order summary for admin dashboard"""
-    today = now().date()
-    orders_today = Order.objects.filter(created_at__date=today)
+    today = localdate()
+    totals = DailyOrderSales.objects.filter(date=today)
     
     # Basic statistics
-    total_orders = orders_today.count()
-    total_revenue = orders_today.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    total_items_sold = sum(order.total_items for order in orders_today)
+    summary = totals.aggregate(
+        total_orders=Sum('orders'), total_revenue=Sum('revenue'), total_items_sold=Sum('quantity')
+    )
+    total_orders = summary['total_orders'] or 0
+    total_revenue = summary['total_revenue'] or 0
+    total_items_sold = summary['total_items_sold'] or 0
     
     # Status breakdown
-    status_breakdown = orders_today.values('status').annotate(count=Count('id'))
+    status_breakdown = totals.filter(orders__gt=0).values('status').annotate(count=F('orders'))
     
     # Popular items
-    popular_items = OrderItem.objects.filter(
-        order__created_at__date=today
+    popular_items = DailyItemSales.objects.filter(
+        date=today
     ).values(
         'menu_item__name'
     ).annotate(
         total_quantity=Sum('quantity'),
-        total_revenue=Sum('total_price')
-    ).order_by('-total_quantity')[:10]
+        total_revenue=Sum('revenue')
+    ).filter(total_quantity__gt=0).order_by('-total_quantity')[:10]
     
     return Response({
         'date': str(today),
@@ -185,26 +339,83 @@ def daily_order_summary(request):
         'popular_items': list(popular_items)
     })
 
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_analytics(request):
+    """Revenue, orders and items sold per hour/day/week/month over a date range
+
+    Query params: start, end (inclusive, default the last 30 days),
+    granularity, split=category|item and include_cancelled.
+    """
+    params = SalesAnalyticsQuerySerializer(data=request.query_params)
+    if not params.is_valid():
+        return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    options = params.validated_data
+    results = cached_sales_series(
+        options['start'],
+        options['end'],
+        granularity=options['granularity'],
+        split=options.get('split'),
+        include_cancelled=options['include_cancelled'],
+    )
+    return Response({
+        'start': str(options['start']),
+        'end': str(options['end']),
+        'granularity': options['granularity'],
+        'split': options.get('split'),
+        'results': results,
+    })
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_orders(request):
+    """Stream order lines joined with orders and customers for accounting
+
+    Query params: start, end (inclusive order dates), status (repeatable),
+    user, output=csv|jsonl, gzip and include_archived (default true).
+    """
+    params = OrderExportQuerySerializer(data=request.query_params)
+    if not params.is_valid():
+        return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    options = params.validated_data
+    rows = export_rows(
+        start=options.get('start'),
+        end=options.get('end'),
+        statuses=options.get('status'),
+        user_id=options.get('user'),
+        include_archived=options['include_archived'],
+    )
+    fmt, compress = options['output'], options['gzip']
+    # The rows are read while the response streams, after the view returned
+    response = SyncStreamingHttpResponse(
+        export_stream(rows, fmt=fmt, compress=compress),
+        content_type='application/gzip' if compress else f'{EXPORT_FORMATS[fmt]}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, compress)}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+@query_budget(7)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def customer_order_history(request):
-    """Get customer's order history with pagination"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    
-    # Simple pagination
-    page_size = 10
-    page = int(request.GET.get('page', 1))
-    start = (page - 1) * page_size
-    end = start + page_size
+    """Get customer's order history, archived orders included, with cursor pagination"""
+    paginator = OrderCursorPagination()
+    paginator.page_size = 10
+    page = paginator.paginate_querysets([
+        Order.objects.filter(user=request.user).for_display(),
+        ArchivedOrder.objects.filter(user=request.user).for_display(),
+    ], request)
     
-    paginated_orders = orders[start:end]
-    has_next = orders.count() > end
-    
-    serializer = OrderSerializer(paginated_orders, many=True)
-    
-    return Response({
-        'orders': serializer.data,
-        'has_next': has_next,
-        'page': page,
-        'total_orders': orders.count()
-    })
\ No newline at end of file
+    data = {
+        'orders': serialize_orders(page),
+        'has_next': paginator.has_next,
+        'next_cursor': paginator.next_cursor,
+    }
+    if paginator.count is not None:
+        data['total_orders'] = paginator.count
+    return Response(data)